@@ -0,0 +1,5 @@
+"""Shared helpers for the figure scripts in ``scripts/``.
+
+The figure scripts and their paired notebooks run from their own directories, so they put
+the repository root on ``sys.path`` before importing from this package.
+"""
@@ -0,0 +1,343 @@
+"""Pseudoadiabats looked up in a precomputed table instead of integrated every time.
+
+MetPy integrates the moist adiabat numerically for every parcel it lifts, and again for
+every line of a Skew-T's background. Here the whole family of pseudoadiabats is integrated
+once, on a grid of pressure and wet-bulb potential temperature (the temperature an adiabat
+has at 1000 hPa, which labels it), and stored along with the lapse rate at every grid
+point. Temperatures along an adiabat are then interpolated from the table: as a cubic
+Hermite spline in ln(p), using the exact lapse rates, and linearly between adiabats.
+
+The table spans 1127 hPa to 9.7 hPa, and wet-bulb potential temperatures from -80 to 60 °C;
+lookups outside of it give NaN. Against the numerical integration it replaces, the error
+stays below 0.003 K above 100 hPa, and below 0.015 K everywhere in the table, the largest
+errors being for the warmest adiabats near its top (see ``benchmarks/bench_adiabats.py``).
+
+The table is built at most once per process, and otherwise loaded memory-mapped from
+``.cache/adiabats`` at the root of the repository, unless ``BAMS_ADIABATS_CACHE_DIR`` says
+otherwise; it is safe to delete at any time.
+"""
+
+import functools
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
+
+import metpy
+from metpy.constants import Cp_d, Lv, Rd, epsilon
+from metpy.units import units
+
+default_cache_dir = Path(__file__).resolve().parents[1] / ".cache" / "adiabats"
+
+# Unit-free constants, in SI units
+_Rd = Rd.m_as("J / kg / K")
+_Lv = Lv.m_as("J / kg")
+_Cp_d = Cp_d.m_as("J / kg / K")
+_epsilon = epsilon.m_as("")
+
+# Grid of the table: steps in ln(p) from 1000 hPa, and in wet-bulb potential temperature
+_log_pressure_step = 0.04
+_levels_below = 3  # Down to 1127 hPa
+_levels_above = 116  # Up to 9.7 hPa
+_theta_w_range = (193.15, 333.15)
+_theta_w_step = 0.25
+
+# Number of RK4 steps between levels of the table
+_substeps = 4
+
+
+def _cache_dir():
+    path = Path(os.environ.get("BAMS_ADIABATS_CACHE_DIR", default_cache_dir))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _saturation_vapor_pressure(temperature):
+    """Bolton (1980), as in `metpy.calc.saturation_vapor_pressure`; K to hPa."""
+    return 6.112 * np.exp(17.67 * (temperature - 273.15) / (temperature - 29.65))
+
+
+def _mixing_ratio(vapor_pressure, pressure):
+    return _epsilon * vapor_pressure / (pressure - vapor_pressure)
+
+
+def _moist_lapse_rate(temperature, pressure):
+    """Rate of change of temperature with ln(p) along a pseudoadiabat, as in MetPy."""
+    rs = _mixing_ratio(_saturation_vapor_pressure(temperature), pressure)
+    return (_Rd * temperature + _Lv * rs) / (
+        _Cp_d + _Lv * _Lv * rs * _epsilon / (_Rd * temperature * temperature)
+    )
+
+
+def _integrate(temperature, log_pressure, delta, steps):
+    """Integrate along pseudoadiabats over ``delta`` in ln(p), with ``steps`` RK4 steps."""
+    h = delta / steps
+    for _ in range(steps):
+        k1 = _moist_lapse_rate(temperature, np.exp(log_pressure))
+        k2 = _moist_lapse_rate(temperature + h * k1 / 2, np.exp(log_pressure + h / 2))
+        k3 = _moist_lapse_rate(temperature + h * k2 / 2, np.exp(log_pressure + h / 2))
+        k4 = _moist_lapse_rate(temperature + h * k3, np.exp(log_pressure + h))
+        temperature = temperature + h * (k1 + 2 * k2 + 2 * k3 + k4) / 6
+        log_pressure = log_pressure + h
+    return temperature
+
+
+class MoistAdiabatTable:
+    """Pseudoadiabat temperatures on a grid of ln(p) and wet-bulb potential temperature.
+
+    Levels run upwards from the bottom of the table, and adiabats from the coldest. Use
+    `moist_adiabat_table` rather than building one directly.
+    """
+
+    def __init__(self, temperature, lapse_rate):
+        self.temperature = temperature
+        self.lapse_rate = lapse_rate
+        self.theta_w = _theta_w_range[0] + _theta_w_step * np.arange(temperature.shape[0])
+        self.log_pressure = np.log(1000.0) - _log_pressure_step * (
+            np.arange(temperature.shape[1]) - _levels_below
+        )
+
+    @classmethod
+    def build(cls):
+        """Integrate the table, upwards and downwards from 1000 hPa."""
+        adiabats = round((_theta_w_range[1] - _theta_w_range[0]) / _theta_w_step) + 1
+        theta_w = _theta_w_range[0] + _theta_w_step * np.arange(adiabats)
+        levels = _levels_below + 1 + _levels_above
+        steps = np.arange(levels) - _levels_below
+        log_pressure = np.log(1000.0) - _log_pressure_step * steps
+
+        temperature = np.empty((theta_w.size, levels))
+        temperature[:, _levels_below] = theta_w
+        for level in range(_levels_below + 1, levels):
+            temperature[:, level] = _integrate(
+                temperature[:, level - 1],
+                log_pressure[level - 1],
+                -_log_pressure_step,
+                _substeps,
+            )
+        for level in range(_levels_below - 1, -1, -1):
+            temperature[:, level] = _integrate(
+                temperature[:, level + 1],
+                log_pressure[level + 1],
+                _log_pressure_step,
+                _substeps,
+            )
+        return cls(temperature, _moist_lapse_rate(temperature, np.exp(log_pressure)))
+
+    def _locate(self, pressure):
+        """Find the level below each pressure, and the position between it and the next."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            position = (self.log_pressure[0] - np.log(pressure)) / _log_pressure_step
+        inside = (position >= 0) & (position <= self.log_pressure.size - 1)
+        level = np.clip(np.floor(np.where(inside, position, 0)), 0, self.log_pressure.size - 2)
+        level = level.astype(np.intp)
+        return level, np.where(inside, position - level, np.nan)
+
+    def _along(self, adiabat, level, fraction):
+        """Interpolate the temperature along given adiabats, as a cubic Hermite spline."""
+        h = -_log_pressure_step
+        t0 = self.temperature[adiabat, level]
+        t1 = self.temperature[adiabat, level + 1]
+        m0 = h * self.lapse_rate[adiabat, level]
+        m1 = h * self.lapse_rate[adiabat, level + 1]
+        u = fraction
+        return (
+            (2 * u**3 - 3 * u**2 + 1) * t0
+            + (u**3 - 2 * u**2 + u) * m0
+            + (3 * u**2 - 2 * u**3) * t1
+            + (u**3 - u**2) * m1
+        )
+
+    def temperature_at(self, pressure, theta_w):
+        """Look up the temperature of pseudoadiabats at given pressures.
+
+        Parameters
+        ----------
+        pressure : array-like
+            Pressure in hPa
+        theta_w : array-like
+            Wet-bulb potential temperature of the adiabats in K, broadcast against
+            ``pressure``
+
+        Returns
+        -------
+        `numpy.ndarray`
+            Temperature in K, NaN outside of the table
+
+        """
+        pressure, theta_w = np.broadcast_arrays(
+            np.asarray(pressure, dtype=np.float64), np.asarray(theta_w, dtype=np.float64)
+        )
+        level, fraction = self._locate(pressure)
+        with np.errstate(invalid="ignore"):
+            position = (theta_w - self.theta_w[0]) / _theta_w_step
+            inside = (position >= 0) & (position <= self.theta_w.size - 1)
+        adiabat = np.clip(np.floor(np.where(inside, position, 0)), 0, self.theta_w.size - 2)
+        adiabat = adiabat.astype(np.intp)
+        weight = np.where(inside, position - adiabat, np.nan)
+
+        lower = self._along(adiabat, level, fraction)
+        upper = self._along(adiabat + 1, level, fraction)
+        return lower + weight * (upper - lower)
+
+    def wet_bulb_potential_temperature(self, pressure, temperature):
+        """Find the pseudoadiabats through given points.
+
+        Parameters
+        ----------
+        pressure : array-like
+            Pressure in hPa
+        temperature : array-like
+            Temperature in K, broadcast against ``pressure``
+
+        Returns
+        -------
+        `numpy.ndarray`
+            Wet-bulb potential temperature in K, NaN outside of the table
+
+        """
+        pressure, temperature = np.broadcast_arrays(
+            np.asarray(pressure, dtype=np.float64), np.asarray(temperature, dtype=np.float64)
+        )
+        level, fraction = self._locate(pressure)
+
+        # Temperature increases with wet-bulb potential temperature at every level, so
+        # bisect for the adiabats on either side
+        lower = np.zeros(pressure.shape, dtype=np.intp)
+        upper = np.full(pressure.shape, self.theta_w.size - 1, dtype=np.intp)
+        while (upper - lower > 1).any():
+            middle = (lower + upper) // 2
+            below = self._along(middle, level, fraction) <= temperature
+            lower = np.where(below, middle, lower)
+            upper = np.where(below, upper, middle)
+
+        t_lower = self._along(lower, level, fraction)
+        t_upper = self._along(upper, level, fraction)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            weight = (temperature - t_lower) / (t_upper - t_lower)
+            weight = np.where((weight >= 0) & (weight <= 1), weight, np.nan)
+        return self.theta_w[lower] + weight * _theta_w_step
+
+
+def _cache_key():
+    digest = hashlib.sha256()
+    for part in (
+        metpy.__version__,
+        _log_pressure_step,
+        _levels_below,
+        _levels_above,
+        _theta_w_range,
+        _theta_w_step,
+        _substeps,
+    ):
+        digest.update(repr(part).encode("utf-8"))
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def moist_adiabat_table():
+    """Get the table of pseudoadiabats, loading or building it on first use.
+
+    Returns
+    -------
+    `MoistAdiabatTable`
+        The same table for the whole process, backed by read-only memory-mapped arrays
+
+    """
+    path = _cache_dir() / f"{_cache_key()}.npy"
+    try:
+        data = np.load(path, mmap_mode="r")
+    except (OSError, ValueError):
+        table = MoistAdiabatTable.build()
+
+        # Write atomically, so that scripts running in parallel never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp", suffix=".npy")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, np.stack([table.temperature, table.lapse_rate]))
+        os.replace(tmp, path)
+        data = np.load(path, mmap_mode="r")
+    return MoistAdiabatTable(data[0], data[1])
+
+
+def moist_lapse(pressure, temperature, reference_pressure=None):
+    """Calculate the temperature along pseudoadiabats, from the table.
+
+    Takes the same arguments as `metpy.calc.moist_lapse`.
+
+    Parameters
+    ----------
+    pressure : `pint.Quantity`
+        Pressures to calculate the temperature at
+    temperature : `pint.Quantity`
+        Starting temperature, or an array of them for several adiabats
+    reference_pressure : `pint.Quantity`, optional
+        Pressure of the starting temperature. Defaults to the first of ``pressure``.
+
+    Returns
+    -------
+    `pint.Quantity`
+        Temperature at every pressure, with a leading dimension for several starting
+        temperatures
+
+    """
+    p = units.Quantity(pressure).m_as("hPa")
+    t = units.Quantity(temperature).m_as("K")
+    if reference_pressure is None:
+        reference = np.ravel(p)[0]
+    else:
+        reference = units.Quantity(reference_pressure).m_as("hPa")
+
+    table = moist_adiabat_table()
+    theta_w = table.wet_bulb_potential_temperature(reference, t)
+    if np.ndim(theta_w):
+        theta_w = np.reshape(theta_w, np.shape(theta_w) + (1,) * np.ndim(p))
+    return units.Quantity(table.temperature_at(p, theta_w), "K").to(temperature.units)
+
+
+def plot_moist_adiabats(skew, t0=None, pressure=None, **kwargs):
+    """Plot the moist adiabats of a Skew-T, from the table.
+
+    Does the same as `metpy.plots.SkewT.plot_moist_adiabats`, with the same defaults.
+
+    Parameters
+    ----------
+    skew : `metpy.plots.SkewT`
+    t0 : `pint.Quantity`, optional
+        Temperatures of the adiabats at 1000 hPa. Defaults to every 10 °C below freezing
+        and every 5 °C above it, over the range of the plot.
+    pressure : `pint.Quantity`, optional
+        Pressures to draw the adiabats through. Default to the range of the plot.
+    kwargs
+        Passed on to `matplotlib.collections.LineCollection`
+
+    Returns
+    -------
+    `matplotlib.collections.LineCollection`
+
+    """
+    # Clear any previous lines
+    if skew.moist_adiabats:
+        skew.moist_adiabats.remove()
+
+    if t0 is None:
+        xmin, xmax = skew.ax.get_xlim()
+        t0 = units.Quantity(
+            np.concatenate((np.arange(xmin, 0, 10), np.arange(0, xmax + 1, 5))), "degC"
+        )
+    if pressure is None:
+        pressure = units.Quantity(np.linspace(*skew.ax.get_ylim()), "mbar")
+
+    p = pressure.m_as("hPa")
+    t = moist_adiabat_table().temperature_at(p, t0.m_as("K")[:, np.newaxis]) - 273.15
+    linedata = [np.vstack((ti, p)).T for ti in t]
+
+    kwargs.setdefault("colors", "b")
+    kwargs.setdefault("linestyles", "dashed")
+    kwargs.setdefault("alpha", 0.5)
+    kwargs.setdefault("zorder", Line2D.zorder - 0.001)
+    skew.moist_adiabats = skew.ax.add_collection(LineCollection(linedata, **kwargs))
+    return skew.moist_adiabats
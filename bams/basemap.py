@@ -0,0 +1,353 @@
+"""Map layers drawn from geometries projected and clipped once, and reused across renders.
+
+Drawing a map layer such as ``"states"`` means reading its Natural Earth (or MetPy)
+shapefile, projecting every shape onto the map and clipping it to the map's extent, all of
+which cartopy repeats for every figure. Our products are drawn on the same few maps over and
+over, so this module keeps the projected, clipped geometries of each layer in memory and on
+local disk, keyed by the layer, its scale, the projection, the map's extent and the versions
+of the libraries that produced them. Optionally, each layer can instead be drawn from an
+image rendered once for a given size and resolution of the map.
+
+`MapPanel` is a drop-in replacement for MetPy's declarative ``MapPanel`` that draws its
+layers this way. Layers given as arbitrary cartopy features, rather than as names or
+Natural Earth or MetPy features, are drawn as usual.
+
+The cache lives in ``.cache/basemap`` at the root of the repository unless
+``BAMS_BASEMAP_CACHE_DIR`` says otherwise; it is safe to delete at any time.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+
+import cartopy
+import cartopy.feature as cfeature
+import matplotlib
+import numpy as np
+import shapely
+import shapely.geometry as sgeom
+import shapely.wkb
+from matplotlib.artist import Artist
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from shapely.errors import ShapelyError
+from traitlets import Bool
+
+import metpy
+import metpy.plots
+
+default_cache_dir = Path(__file__).resolve().parents[1] / ".cache" / "basemap"
+
+# Most recently used layers, keyed as on disk
+_geometry_cache = OrderedDict()
+_geometry_cache_size = 32
+_image_cache = OrderedDict()
+_image_cache_size = 8
+
+# Fraction of the extent kept beyond each edge of the map when clipping, so that lines
+# along the edges are drawn (and clipped by the axes) as they would be without clipping
+_clip_margin = 0.02
+
+
+def _cache_dir():
+    path = Path(os.environ.get("BAMS_BASEMAP_CACHE_DIR", default_cache_dir))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _remember(cache, size, key, value):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > size:
+        cache.popitem(last=False)
+    return value
+
+
+def _store(path, write):
+    """Write a cache file atomically, so that parallel renders never see a partial file."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp", suffix=path.suffix)
+    with os.fdopen(fd, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+def _feature_source(feature):
+    """Identify the shapefile a feature reads, or return `None` if it cannot be cached."""
+    from metpy.plots.cartopy_utils import MetPyMapFeature
+
+    if isinstance(feature, cfeature.NaturalEarthFeature):
+        return {"source": "naturalearth", "category": feature.category, "name": feature.name}
+    if isinstance(feature, MetPyMapFeature):
+        return {"source": "metpy", "name": feature.name, "metpy": metpy.__version__}
+    return None
+
+
+def _feature_extent(feature, projection, extent):
+    """Find the extent of a map in a feature's own coordinates, as cartopy does."""
+    x0, x1, y0, y1 = extent
+    box = sgeom.box(x0, y0, x1, y1)
+    bounds = feature.crs.project_geometry(box, projection).bounds
+    if not bounds or not np.all(np.isfinite(bounds)):
+        return None
+    return bounds[0], bounds[2], bounds[1], bounds[3]
+
+
+def _key(source, scale, projection, extent, *extra):
+    """Hash everything a cached layer depends on into a cache key."""
+    parts = {
+        "layer": source,
+        "scale": scale,
+        "projection": projection.to_wkt(),
+        "extent": [round(float(value), 3) for value in extent],
+        "extra": list(extra),
+        "versions": {"cartopy": cartopy.__version__, "shapely": shapely.__version__},
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _clip(geometry, box):
+    try:
+        return geometry.intersection(box)
+    except ShapelyError:
+        # Shapes can become invalid when projected; repair them (only polygons can be)
+        if geometry.geom_type in ("Polygon", "MultiPolygon"):
+            return geometry.buffer(0).intersection(box)
+        return geometry
+
+
+def _project(feature, projection, extent, feature_extent):
+    """Project a feature's geometries within an extent onto a map and clip them to it."""
+    x0, x1, y0, y1 = extent
+    dx, dy = (x1 - x0) * _clip_margin, (y1 - y0) * _clip_margin
+    box = sgeom.box(x0 - dx, y0 - dy, x1 + dx, y1 + dy)
+
+    geometries = []
+    for geometry in feature.intersecting_geometries(feature_extent):
+        projected = _clip(projection.project_geometry(geometry, feature.crs), box)
+        if not projected.is_empty:
+            geometries.append(projected)
+    return geometries
+
+
+def _load_geometries(path):
+    with np.load(path) as stored:
+        data, offsets = stored["wkb"].tobytes(), stored["offsets"]
+    return [shapely.wkb.loads(data[start:end]) for start, end in zip(offsets, offsets[1:])]
+
+
+def _save_geometries(path, geometries):
+    blobs = [shapely.wkb.dumps(geometry) for geometry in geometries]
+    offsets = np.cumsum([0] + [len(blob) for blob in blobs], dtype=np.int64)
+    data = np.frombuffer(b"".join(blobs), dtype=np.uint8)
+    _store(path, lambda f: np.savez(f, wkb=data, offsets=offsets))
+
+
+def layer_geometries(feature, projection, extent):
+    """Get a layer's geometries projected onto a map and clipped to its extent.
+
+    Parameters
+    ----------
+    feature : `cartopy.feature.NaturalEarthFeature` or `MetPyMapFeature`
+        The layer, a Natural Earth feature of cartopy or of `metpy.plots.cartopy_utils`.
+        Its scale is chosen for the extent, as when cartopy draws it.
+    projection : `cartopy.crs.Projection`
+        Projection of the map
+    extent : tuple
+        ``(x0, x1, y0, y1)`` of the map, in ``projection``
+
+    Returns
+    -------
+    list of shapely geometries
+        The layer's geometries in ``projection``, reused from memory or disk when the
+        same layer has been projected onto the same map before
+
+    """
+    source = _feature_source(feature)
+    feature_extent = _feature_extent(feature, projection, extent)
+    if source is None:
+        return _project(feature, projection, extent, feature_extent)
+
+    # Pick the scale as the feature would when asked for its geometries
+    scaler = getattr(feature, "scaler", None)
+    if scaler is not None and feature_extent is not None:
+        scaler.scale_from_extent(feature_extent)
+    scale = scaler.scale if scaler is not None else getattr(feature, "scale", None)
+
+    key = _key(source, scale, projection, extent)
+    if key in _geometry_cache:
+        _geometry_cache.move_to_end(key)
+        return _geometry_cache[key]
+
+    path = _cache_dir() / f"{key}.npz"
+    try:
+        geometries = _load_geometries(path)
+    except (OSError, ValueError, KeyError, ShapelyError):
+        geometries = _project(feature, projection, extent, feature_extent)
+        _save_geometries(path, geometries)
+    return _remember(_geometry_cache, _geometry_cache_size, key, geometries)
+
+
+class CachedFeature(cfeature.Feature):
+    """A map layer whose geometries come already projected onto the map, from the cache.
+
+    It is drawn by cartopy like the feature it wraps, with the same style, but in the map's
+    own projection so that cartopy does not project it again.
+
+    Parameters
+    ----------
+    feature : `cartopy.feature.Feature`
+        The layer, as from ``lookup_map_feature``
+    projection : `cartopy.crs.Projection`
+        Projection of the map the layer is drawn on
+
+    """
+
+    def __init__(self, feature, projection):
+        super().__init__(projection, **feature.kwargs)
+        self.feature = feature
+
+    def geometries(self):
+        return self.intersecting_geometries(None)
+
+    def intersecting_geometries(self, extent):
+        if extent is None:
+            extent = (*self.crs.x_limits, *self.crs.y_limits)
+        return iter(layer_geometries(self.feature, self.crs, extent))
+
+
+def cached_feature(feature, projection):
+    """Wrap a map layer to be drawn from the cache, if it can be."""
+    if _feature_source(feature) is None:
+        return feature
+    return CachedFeature(feature, projection)
+
+
+def layer_image(feature, projection, xlim, ylim, size, dpi):
+    """Render a map layer on its own, transparent elsewhere.
+
+    Parameters
+    ----------
+    feature : `cartopy.feature.Feature`
+        The layer
+    projection : `cartopy.crs.Projection`
+        Projection of the map
+    xlim, ylim : tuple
+        Limits of the map's axes, in ``projection``
+    size : tuple
+        ``(width, height)`` of the map's axes, in pixels
+    dpi : float
+        Resolution the map is rendered at, which sets the width of lines in pixels
+
+    Returns
+    -------
+    `numpy.ndarray`
+        ``(height, width, 4)`` RGBA image, bottom row first as renderers draw them, reused
+        from memory or disk when the same layer has been rendered at the same size before
+
+    """
+    width, height = size
+    source = _feature_source(feature)
+    key = None
+    if source is not None:
+        style = {name: repr(value) for name, value in feature.kwargs.items()}
+        key = _key(
+            source,
+            "image",
+            projection,
+            (*xlim, *ylim),
+            width,
+            height,
+            float(dpi),
+            style,
+            matplotlib.__version__,
+        )
+        if key in _image_cache:
+            _image_cache.move_to_end(key)
+            return _image_cache[key]
+        path = _cache_dir() / f"{key}.npy"
+        try:
+            return _remember(_image_cache, _image_cache_size, key, np.load(path))
+        except (OSError, ValueError):
+            pass
+
+    fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+    fig.patch.set_visible(False)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_axes([0, 0, 1, 1], projection=projection)
+    ax.set_axis_off()
+    ax.patch.set_visible(False)
+    ax.set_aspect("auto")
+    ax.set_xlim(xlim)
+    ax.set_ylim(ylim)
+    ax.add_feature(cached_feature(feature, projection))
+    canvas.draw()
+    image = np.asarray(canvas.buffer_rgba())[::-1].copy()
+
+    if key is None:
+        return image
+    _store(path, lambda f: np.save(f, image))
+    return _remember(_image_cache, _image_cache_size, key, image)
+
+
+class LayerImage(Artist):
+    """Draw a map layer from an image rendered once for the size and resolution of the map.
+
+    Parameters
+    ----------
+    feature : `cartopy.feature.Feature`
+        The layer. Its ``zorder`` is used, as cartopy would.
+
+    """
+
+    def __init__(self, feature):
+        super().__init__()
+        self.feature = feature
+        self.set_zorder(feature.kwargs.get("zorder", 1.5))
+
+    def draw(self, renderer):
+        if not self.get_visible():
+            return
+        ax = self.axes
+        bbox = ax.bbox
+        x0, y0 = round(bbox.x0), round(bbox.y0)
+        size = max(round(bbox.width), 1), max(round(bbox.height), 1)
+        image = layer_image(
+            self.feature, ax.projection, ax.get_xlim(), ax.get_ylim(), size, ax.figure.dpi
+        )
+
+        gc = renderer.new_gc()
+        gc.set_clip_rectangle(bbox)
+        gc.set_alpha(self.get_alpha())
+        renderer.draw_image(gc, x0, y0, image)
+        gc.restore()
+        self.stale = False
+
+
+class MapPanel(metpy.plots.MapPanel):
+    """MetPy's declarative ``MapPanel``, drawing its layers from the basemap cache."""
+
+    rasterize_layers = Bool(default_value=False)
+    rasterize_layers.__doc__ = """Whether to draw each layer from a cached image.
+
+    Layers are otherwise drawn as vectors from cached geometries. Images are cached for each
+    size and resolution of the map, so this pays off when many figures are saved with the
+    same size and ``dpi``; at high resolutions the images take a lot of space.
+    """
+
+    @property
+    def _layer_features(self):
+        if self.rasterize_layers:
+            return
+        for feature in super()._layer_features:
+            yield cached_feature(feature, self.ax.projection)
+
+    def draw(self):
+        """Draw the panel."""
+        redraw = self._need_redraw
+        super().draw()
+        if redraw and self.rasterize_layers:
+            for feature in super()._layer_features:
+                self.ax.add_artist(LayerImage(feature))
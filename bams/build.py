@@ -0,0 +1,342 @@
+"""Incremental build of the figures, regenerating only those whose inputs have changed.
+
+Each figure's script is run only when something it depends on has changed since it last
+built successfully:
+
+* the script itself, and the modules of this package it imports (directly or not)
+* local data files, such as ``hgt.sfc.nc``, and MetPy test data files
+* the versions of Python and of the libraries the figures are made with
+* the remote data it used, as recorded by `bams.remote`: a figure is rebuilt when any of
+  those responses is no longer in the cache, has expired, or has different content
+* its outputs, which must still exist with the content it produced
+
+Everything is compared by content hash. The state of each figure is kept in
+``.cache/build`` at the root of the repository, unless ``BAMS_BUILD_STATE_DIR`` says
+otherwise; deleting it rebuilds everything. The figures to rebuild run in parallel over a
+bounded pool of workers, forked from a process that has already imported the libraries they
+use (see `bams.pool`), or each in its own interpreter with ``--isolated``.
+
+Run ``python -m bams.build --help`` for the options.
+"""
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from importlib import metadata
+from pathlib import Path
+
+from .output import product_paths
+from .pool import WarmPool
+
+root = Path(__file__).resolve().parents[1]
+default_state_dir = root / ".cache" / "build"
+
+# Libraries whose versions can change the figures
+libraries = [
+    "cartopy",
+    "geopandas",
+    "matplotlib",
+    "metpy",
+    "numpy",
+    "pandas",
+    "pillow",
+    "pyarrow",
+    "scipy",
+    "siphon",
+    "xarray",
+]
+
+
+@dataclass
+class Figure:
+    """A figure script, with the inputs and outputs the build cannot find out by itself.
+
+    Paths are relative to the root of the repository.
+    """
+
+    script: str
+    outputs: list
+    files: list = field(default_factory=list)
+    test_data: list = field(default_factory=list)
+    remote: bool = False
+
+
+def _products(stem):
+    """List the images a figure is saved to by `bams.output.product_paths`."""
+    return [output.target for output in product_paths(stem)]
+
+
+figures = {
+    "fig1": Figure("scripts/fig1_skewt.py", _products("output/fig1_skewt"), remote=True),
+    "fig2": Figure(
+        "scripts/fig2_multilayer.py",
+        [*_products("output/fig2_multilayer"), "output/fig2_caption.txt"],
+        remote=True,
+    ),
+    "fig3": Figure(
+        "scripts/fig3_cross_section.py",
+        _products("output/fig3_cross_section"),
+        files=["hgt.sfc.nc"],
+        test_data=["narr_example.nc"],
+    ),
+    "fig5": Figure(
+        "scripts/fig5_declarative.py",
+        _products("output/fig5_declarative"),
+        test_data=["GFS_test.nc"],
+    ),
+    "fig6": Figure(
+        "scripts/fig6_plotgeometry.py",
+        _products("output/fig6_plotgeometry"),
+        test_data=["spc_day1otlk_20210317_1200_lyr.geojson"],
+    ),
+}
+
+
+def _state_dir():
+    path = Path(os.environ.get("BAMS_BUILD_STATE_DIR", default_state_dir))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def file_digest(path):
+    """Hash the content of a file, or return `None` if it does not exist."""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+def package_modules(path):
+    """Find the modules of this package a script imports, directly or through others."""
+    package = Path(__file__).resolve().parent
+    found = set()
+    pending = [Path(path)]
+    while pending:
+        tree = ast.parse(pending.pop().read_text())
+        for node in ast.walk(tree):
+            names = []
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom):
+                if node.level == 1 or node.module == "bams":
+                    base = [] if node.module in (None, "bams") else [node.module]
+                    names = [".".join(["bams", *base, alias.name]) for alias in node.names]
+                    names.append(".".join(["bams", *base]))
+                elif node.module and node.module.startswith("bams."):
+                    names = [node.module]
+
+            for name in names:
+                parts = name.split(".")
+                if parts[0] != "bams":
+                    continue
+                module = package.joinpath(*parts[1:]).with_suffix(".py")
+                # Importing any module of the package runs its __init__ first
+                for module in (package / "__init__.py", module):
+                    if module.exists() and module not in found:
+                        found.add(module)
+                        pending.append(module)
+    return sorted(found)
+
+
+def library_versions():
+    """Get the versions of Python and of the libraries the figures depend on."""
+    versions = {"python": platform.python_version()}
+    for name in libraries:
+        try:
+            versions[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+def _test_data_path(name):
+    from metpy.cbook import get_test_data
+
+    return get_test_data(name, as_file_obj=False)
+
+
+def fingerprint(figure, versions=None):
+    """Hash everything a figure depends on, except its remote data."""
+    inputs = {
+        str(path.relative_to(root)): file_digest(path)
+        for path in [root / figure.script, *package_modules(root / figure.script)]
+    }
+    inputs.update({name: file_digest(root / name) for name in figure.files})
+    inputs.update(
+        {f"test_data/{name}": file_digest(_test_data_path(name)) for name in figure.test_data}
+    )
+    inputs["versions"] = versions if versions is not None else library_versions()
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _remote_current(manifest):
+    """Check that the remote responses a figure used are still cached, unchanged."""
+    from . import remote
+
+    mode = os.environ.get("BAMS_REMOTE_CACHE", "on")
+    if mode == "off":
+        return False
+
+    cache = remote.DiskCache(os.environ.get("BAMS_REMOTE_CACHE_DIR", remote.default_cache_dir))
+    if "BAMS_REMOTE_CACHE_TTL" in os.environ:
+        cache.ttl = float(os.environ["BAMS_REMOTE_CACHE_TTL"])
+    for url, digest in manifest.items():
+        record = cache.lookup(url, check_age=mode != "replay")
+        if record is None or record["digest"] != digest:
+            return False
+    return True
+
+
+def _load_state(name):
+    try:
+        return json.loads((_state_dir() / f"{name}.json").read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _save_state(name, state):
+    path = _state_dir() / f"{name}.json"
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp", suffix=".json")
+    with os.fdopen(fd, "w") as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def is_current(name, versions=None):
+    """Check whether a figure is up to date with all of its inputs."""
+    figure = figures[name]
+    state = _load_state(name)
+    if state is None or state["fingerprint"] != fingerprint(figure, versions):
+        return False
+    if any(file_digest(root / path) != state["outputs"].get(path) for path in figure.outputs):
+        return False
+    return not figure.remote or _remote_current(state["remote"])
+
+
+def build(name, versions=None, pool=None):
+    """Run a figure's script and record its state, returning the result and wall time.
+
+    The script runs in ``pool``, a `bams.pool.WarmPool`, if given, and otherwise in a new
+    interpreter.
+    """
+    figure = figures[name]
+    inputs = fingerprint(figure, versions)
+    script = root / figure.script
+    with tempfile.TemporaryDirectory() as tmp:
+        manifest = Path(tmp) / "remote.json"
+        env = dict(os.environ, BAMS_REMOTE_MANIFEST=str(manifest), MPLBACKEND="agg")
+        start = time.perf_counter()
+        if pool is not None:
+            result = pool.run(script, env={"BAMS_REMOTE_MANIFEST": str(manifest)})
+        else:
+            command = [sys.executable, script.name]
+            if env.get("BAMS_TRACE"):
+                command = [sys.executable, "-m", "bams.trace", "run", script.name]
+                env["PYTHONPATH"] = os.pathsep.join(
+                    filter(None, [str(root), env.get("PYTHONPATH")])
+                )
+            result = subprocess.run(
+                command,
+                cwd=script.parent,
+                env=env,
+                capture_output=True,
+                text=True,
+            )
+        elapsed = time.perf_counter() - start
+        used = json.loads(manifest.read_text()) if manifest.exists() else {}
+
+    if result.returncode == 0:
+        _save_state(
+            name,
+            {
+                "fingerprint": inputs,
+                "outputs": {path: file_digest(root / path) for path in figure.outputs},
+                "remote": used,
+                "built": time.time(),
+                "seconds": elapsed,
+            },
+        )
+    return result, elapsed
+
+
+def main():
+    """Regenerate the figures whose inputs have changed since they were last built."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument(
+        "figures",
+        nargs="*",
+        help=f"figures to build, out of {', '.join(figures)} (default all)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=min(len(figures), os.cpu_count() or 1),
+        help="number of figures to build at once",
+    )
+    parser.add_argument(
+        "-f", "--force", action="store_true", help="rebuild even figures that are up to date"
+    )
+    parser.add_argument(
+        "--isolated",
+        action="store_true",
+        help="run each figure in a new interpreter rather than in a warm worker",
+    )
+    parser.add_argument(
+        "-n", "--dry-run", action="store_true", help="only list the figures to rebuild"
+    )
+    args = parser.parse_args()
+    unknown = [name for name in args.figures if name not in figures]
+    if unknown:
+        parser.error(f"unknown figures: {', '.join(unknown)}")
+
+    names = args.figures or list(figures)
+    versions = library_versions()
+    stale = [name for name in names if args.force or not is_current(name, versions)]
+    for name in names:
+        if name not in stale:
+            print(f"{name:>5}  up to date")
+    if args.dry_run:
+        for name in stale:
+            print(f"{name:>5}  would rebuild")
+        return
+
+    if not stale:
+        return
+
+    failed = []
+    start = time.perf_counter()
+    jobs = max(min(args.jobs, len(stale)), 1)
+    pool = None if args.isolated else WarmPool(jobs)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(build, name, versions, pool): name for name in stale}
+        for future in as_completed(futures):
+            name = futures[future]
+            result, elapsed = future.result()
+            status = "built" if result.returncode == 0 else "FAILED"
+            print(f"{name:>5}  {status:<10} {elapsed:8.1f} s")
+            if result.returncode:
+                failed.append(name)
+                print(result.stderr, file=sys.stderr)
+    if pool is not None:
+        pool.close()
+    print(f"{'total':>5}  {len(stale):<10d} {time.perf_counter() - start:8.1f} s")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
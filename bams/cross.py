@@ -0,0 +1,316 @@
+"""Helpers for working with cross sections of gridded data."""
+
+from collections import OrderedDict
+
+import numpy as np
+import xarray as xr
+
+from metpy.interpolate import geodesic
+from metpy.xarray import check_axis
+
+# Most recently used cross section plans, keyed on grid and path
+_plan_cache = OrderedDict()
+_plan_cache_size = 16
+
+
+def _log_interpolate_columns(x, xp, fp):
+    """Interpolate ``fp`` to ``x`` linearly in ``log(xp)`` along the last axis.
+
+    Every column gets its own target value, unlike `metpy.interpolate.log_interpolate_1d`
+    which interpolates all columns to the same targets. Targets outside of the column's
+    range are set to NaN, matching the ``fill_value`` default of MetPy's version.
+    """
+    xp = np.asarray(xp, dtype=np.float64)
+    fp = np.broadcast_to(np.asarray(fp, dtype=np.float64), xp.shape)
+
+    # Sort every column by its coordinate, as MetPy does before searching
+    order = np.argsort(xp, axis=-1)
+    log_xp = np.log(np.take_along_axis(xp, order, axis=-1))
+    fp = np.take_along_axis(fp, order, axis=-1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_x = np.log(np.asarray(x, dtype=np.float64))[..., np.newaxis]
+
+        # Equivalent to searchsorted(..., side="left") for every column at once
+        above = np.count_nonzero(log_xp < log_x, axis=-1)[..., np.newaxis]
+        upper = np.clip(above, 1, xp.shape[-1] - 1)
+        lower = upper - 1
+
+        x0 = np.take_along_axis(log_xp, lower, axis=-1)
+        x1 = np.take_along_axis(log_xp, upper, axis=-1)
+        f0 = np.take_along_axis(fp, lower, axis=-1)
+        f1 = np.take_along_axis(fp, upper, axis=-1)
+        result = f0 + (f1 - f0) * ((log_x - x0) / (x1 - x0))
+
+    result[(above == xp.shape[-1]) | (log_x < x0)] = np.nan
+    return result[..., 0]
+
+
+def terrain_pressure(height, terrain):
+    """Calculate the pressure of the terrain surface below every column of a cross section.
+
+    This is a vectorized replacement for calling `metpy.interpolate.log_interpolate_1d` on
+    each column of the cross section in turn; all columns (and any other dimensions, such as
+    time) are interpolated in a single pass along the vertical dimension.
+
+    Parameters
+    ----------
+    height : `xarray.DataArray`
+        Geopotential height with a vertical (pressure) coordinate, e.g. the output of
+        `metpy.interpolate.cross_section`
+    terrain : `xarray.DataArray`
+        Terrain height with the same horizontal dimensions as ``height``, but no vertical
+        dimension
+
+    Returns
+    -------
+    `xarray.DataArray`
+        Terrain pressure with the dimensions and coordinates of ``terrain`` and the units of
+        the vertical coordinate of ``height``
+
+    """
+    vertical = height.metpy.vertical
+    height_units = height.metpy.units
+
+    # Strip units (and non-index coordinates, which differ between grids) so that only the
+    # shared dimensions are aligned
+    height_values = height.copy(data=height.metpy.unit_array.m).reset_coords(drop=True)
+    terrain_values = terrain.copy(
+        data=terrain.metpy.unit_array.m_as(height_units)
+    ).reset_coords(drop=True)
+    pressure = xr.DataArray(vertical.metpy.unit_array.m, dims=vertical.dims)
+
+    result = xr.apply_ufunc(
+        _log_interpolate_columns,
+        terrain_values,
+        height_values,
+        pressure,
+        input_core_dims=[[], [vertical.name], [vertical.name]],
+        dask="parallelized",
+        output_dtypes=[np.float64],
+    )
+
+    # Keep the terrain's coordinates, except (scalar) ones along dimensions of the height,
+    # such as the time of the terrain data when the height has many times
+    coords = {
+        name: coord.variable
+        for name, coord in terrain.coords.items()
+        if name not in result.dims
+    }
+    result = result.transpose(..., *terrain.dims).assign_coords(coords)
+    result.attrs = {"units": str(vertical.metpy.units)}
+    return result
+
+
+def _axis_weights(coord, points):
+    """Find the bracketing indices and linear weights of ``points`` along ``coord``."""
+    coord = np.asarray(coord, dtype=np.float64)
+    descending = coord[0] > coord[-1]
+    if descending:
+        coord = coord[::-1]
+
+    lower = np.clip(np.searchsorted(coord, points, side="right") - 1, 0, coord.size - 2)
+    weight = (points - coord[lower]) / (coord[lower + 1] - coord[lower])
+    valid = (points >= coord[0]) & (points <= coord[-1])
+
+    upper = lower + 1
+    if descending:
+        lower, upper = coord.size - 1 - lower, coord.size - 1 - upper
+    return lower, upper, weight, valid
+
+
+class CrossSectionPlan:
+    """Reusable horizontal interpolation along a great circle path.
+
+    A plan holds the geodesic sample points of a path through a grid, along with the
+    indices and bilinear weights of the grid points surrounding each sample. Applying the
+    plan to a field is then only a gather and a weighted sum, so any number of fields or
+    datasets on the same grid can be sliced without repeating the setup. Results match
+    `metpy.interpolate.cross_section` with ``interp_type="linear"``.
+
+    Use `plan_cross_section` rather than creating plans directly, so that plans are shared
+    between calls.
+    """
+
+    def __init__(self, x, y, crs, start, end, steps=100):
+        points = geodesic(crs, start, end, steps)
+
+        # Patch points to match given longitude range, whether [0, 360) or (-180, 180]
+        if check_axis(x, "longitude") and (x > 180).any():
+            points[points[:, 0] < 0, 0] += 360.0
+
+        self.points = points
+        self.x_name = x.name
+        self.y_name = y.name
+        self._x_attrs = dict(x.attrs)
+        self._y_attrs = dict(y.attrs)
+
+        x0, x1, wx, x_valid = _axis_weights(x.values, points[:, 0])
+        y0, y1, wy, y_valid = _axis_weights(y.values, points[:, 1])
+
+        # Points outside of the grid get NaN weights, like `xarray.DataArray.interp`
+        wx = np.where(x_valid & y_valid, wx, np.nan)
+        self._corners = [
+            (y0, x0, (1 - wy) * (1 - wx)),
+            (y0, x1, (1 - wy) * wx),
+            (y1, x0, wy * (1 - wx)),
+            (y1, x1, wy * wx),
+        ]
+
+    def footprint(self):
+        """Find the part of the grid that interpolating along the path reads.
+
+        Returns
+        -------
+        dict
+            Slices of the y and x dimensions holding every grid point the path is
+            interpolated from, to pass to ``isel`` before reading data from disk
+
+        """
+        y_index = np.concatenate([y for y, _, _ in self._corners])
+        x_index = np.concatenate([x for _, x, _ in self._corners])
+        return {
+            self.y_name: slice(int(y_index.min()), int(y_index.max()) + 1),
+            self.x_name: slice(int(x_index.min()), int(x_index.max()) + 1),
+        }
+
+    def _gather(self, data, y_index, x_index):
+        return data.isel(
+            {
+                self.y_name: xr.DataArray(y_index, dims="index"),
+                self.x_name: xr.DataArray(x_index, dims="index"),
+            }
+        )
+
+    def _interpolate(self, data):
+        """Take the weighted sum of the corners around each point, for data without coords."""
+        y_index, x_index, weight = self._corners[0]
+        sliced = self._gather(data, y_index, x_index) * xr.DataArray(weight, dims="index")
+        for y_index, x_index, weight in self._corners[1:]:
+            sliced = sliced + self._gather(data, y_index, x_index) * xr.DataArray(
+                weight, dims="index"
+            )
+        return sliced
+
+    def __call__(self, data):
+        """Interpolate a `xarray.DataArray` or every variable of a `xarray.Dataset`."""
+        if isinstance(data, xr.Dataset):
+            return data.map(self, True)
+        elif data.ndim == 0:
+            return data
+
+        dims = [self.y_name, self.x_name]
+        if not set(dims).issubset(data.dims):
+            raise ValueError(
+                f"Data must have dimensions {dims} to be interpolated along this path."
+            )
+
+        # Interpolate the horizontal coordinates (such as 2D latitude and longitude) on their
+        # own, as `xarray.DataArray.interp` does, since each corner has different values
+        horizontal = [
+            name for name, coord in data.coords.items() if set(dims) & set(coord.dims)
+        ]
+        sliced = self._interpolate(data.drop_vars(horizontal))
+        coords = {}
+        for name in horizontal:
+            coord = data.coords[name]
+            if name not in dims and set(dims) <= set(coord.dims) and coord.dtype.kind in "iuf":
+                values = self._interpolate(xr.DataArray(coord.variable))
+                coords[name] = (values.dims, values.values, dict(coord.attrs))
+
+        # Match the dimension order and metadata of `metpy.interpolate.cross_section`
+        first = min(data.dims.index(dim) for dim in dims)
+        order = [dim for dim in data.dims if dim not in dims]
+        order.insert(first, "index")
+        sliced = sliced.transpose(*order).assign_coords(
+            {
+                **coords,
+                self.x_name: ("index", self.points[:, 0], self._x_attrs),
+                self.y_name: ("index", self.points[:, 1], self._y_attrs),
+                "index": np.arange(len(self.points)),
+            }
+        )
+        sliced.attrs = data.attrs
+        sliced.name = data.name
+        return sliced
+
+
+def plan_cross_section(data, start, end, steps=100):
+    """Get the cross section plan for a path through the grid of ``data``.
+
+    Plans are kept in an in-memory LRU cache keyed on the grid's CRS, shape and extent as
+    well as the path, so repeated calls with data on the same grid reuse the same plan.
+
+    Parameters
+    ----------
+    data : `xarray.DataArray` or `xarray.Dataset`
+        Data on the grid to slice, which must have been parsed with MetPy's ``parse_cf``
+    start : (2, ) array-like
+        A latitude-longitude pair designating the start point of the cross section
+    end : (2, ) array-like
+        A latitude-longitude pair designating the end point of the cross section
+    steps : int, optional
+        The number of points along the geodesic between the start and the end point
+        (including the end points) to use in the cross section. Defaults to 100.
+
+    Returns
+    -------
+    `CrossSectionPlan`
+
+    See Also
+    --------
+    metpy.interpolate.cross_section
+
+    """
+    if isinstance(data, xr.Dataset):
+        # Any variable on the grid carries the coordinates and CRS we need
+        data = next(
+            var
+            for var in data.data_vars.values()
+            if "metpy_crs" in var.coords and var.ndim >= 2
+        )
+    x, y = data.metpy.coordinates("x", "y")
+    crs = data.metpy.pyproj_crs
+
+    key = (
+        crs.to_wkt(),
+        (y.size, x.size),
+        (float(x[0]), float(x[-1]), float(y[0]), float(y[-1])),
+        tuple(start),
+        tuple(end),
+        steps,
+    )
+    if key in _plan_cache:
+        _plan_cache.move_to_end(key)
+    else:
+        _plan_cache[key] = CrossSectionPlan(x, y, crs, start, end, steps)
+        while len(_plan_cache) > _plan_cache_size:
+            _plan_cache.popitem(last=False)
+    return _plan_cache[key]
+
+
+def cross_section(data, start, end, steps=100):
+    """Obtain an interpolated cross-sectional slice through gridded data.
+
+    A drop-in replacement for `metpy.interpolate.cross_section` (with linear interpolation)
+    that reuses a cached `CrossSectionPlan` for the grid and path.
+
+    Parameters
+    ----------
+    data : `xarray.DataArray` or `xarray.Dataset`
+        Three- (or higher) dimensional field(s) to interpolate, parsed with ``parse_cf``
+    start : (2, ) array-like
+        A latitude-longitude pair designating the start point of the cross section
+    end : (2, ) array-like
+        A latitude-longitude pair designating the end point of the cross section
+    steps : int, optional
+        The number of points along the geodesic between the start and the end point
+        (including the end points) to use in the cross section. Defaults to 100.
+
+    Returns
+    -------
+    `xarray.DataArray` or `xarray.Dataset`
+        The interpolated cross section, with new index dimension along the cross section
+
+    """
+    return plan_cross_section(data, start, end, steps)(data)
@@ -0,0 +1,179 @@
+"""Fields derived from the variables of a dataset, computed only where they are used.
+
+Fig5 computes the wind speed on every level of the GFS data although only 300 hPa is
+plotted, and for full-resolution model output computing (and holding) every level of every
+derived field is most of the work. `DerivedFields` declares derived fields instead, and adds
+them to a dataset as lazily indexed variables, the way xarray's file backends add variables
+that have not been read yet: selecting a level or an area of a derived field is free, and
+the field is only computed, from the same selection of its inputs, when its values are
+needed. Results are kept, so that plots selecting the same slice compute it only once.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+import xarray as xr
+from xarray.backends import BackendArray
+from xarray.core import indexing
+
+from metpy.units import units
+
+# Number of computed selections each derived field keeps
+_result_cache_size = 8
+
+
+def _hashable(key):
+    """Turn an outer indexer (of integers, slices and integer arrays) into a cache key."""
+    parts = []
+    for k in key:
+        if isinstance(k, slice):
+            parts.append(("slice", k.start, k.stop, k.step))
+        elif isinstance(k, np.ndarray):
+            parts.append(("array", tuple(k.tolist())))
+        else:
+            parts.append(int(k))
+    return tuple(parts)
+
+
+class _DerivedArray(BackendArray):
+    """A field computed from variables of a dataset for each selection of it."""
+
+    def __init__(self, func, inputs, kwargs, dims, shape):
+        self.func = func
+        self.inputs = inputs
+        self.kwargs = kwargs
+        self.dims = dims
+        self.shape = shape
+        self._results = OrderedDict()
+
+        # Compute a single point to find the units and type of the field
+        probe = self._compute_selection(tuple(slice(0, 1) for _ in dims))
+        self.units = probe.units
+        self.dtype = probe.magnitude.dtype
+
+    def _compute_selection(self, key):
+        selection = dict(zip(self.dims, key))
+        args = [
+            arg.isel({dim: selection[dim] for dim in arg.dims})
+            if hasattr(arg, "dims")
+            else arg
+            for arg in self.inputs
+        ]
+        result = self.func(*args, **self.kwargs)
+        if hasattr(result, "dims"):
+            remaining = [dim for dim, k in zip(self.dims, key) if not isinstance(k, int)]
+            # Broadcast results lacking some of the dimensions, as a view of the same values
+            sizes = {}
+            for arg in args:
+                sizes.update(getattr(arg, "sizes", {}))
+            missing = {dim: sizes[dim] for dim in remaining if dim not in result.dims}
+            if missing:
+                result = result.expand_dims(missing)
+            result = result.transpose(*remaining).metpy.unit_array
+        return units.Quantity(result)
+
+    def _raw_indexing_method(self, key):
+        cache_key = _hashable(key)
+        if cache_key in self._results:
+            self._results.move_to_end(cache_key)
+            return self._results[cache_key]
+
+        values = np.asarray(self._compute_selection(key).m_as(self.units), dtype=self.dtype)
+        values.setflags(write=False)
+        self._results[cache_key] = values
+        while len(self._results) > _result_cache_size:
+            self._results.popitem(last=False)
+        return values
+
+    def __getitem__(self, key):
+        return indexing.explicit_indexing_adapter(
+            key, self.shape, indexing.IndexingSupport.OUTER, self._raw_indexing_method
+        )
+
+
+class DerivedFields:
+    """Declarations of fields computed from other variables, added to datasets lazily.
+
+    Examples
+    --------
+    >>> fields = DerivedFields()
+    >>> fields.register("wind_speed", mpcalc.wind_speed, "u_wind", "v_wind")
+    >>> ds = fields.assign(ds)
+    >>> ds["wind_speed"].metpy.sel(vertical=300 * units.hPa).values  # computes one level
+
+    """
+
+    def __init__(self):
+        self.fields = {}
+
+    def register(self, name, func, *inputs, **kwargs):
+        """Declare a derived field.
+
+        Parameters
+        ----------
+        name : str
+            Name of the field's variable
+        func : callable
+            Function computing the field, such as one of `metpy.calc`. It is called with the
+            selection of each input matching the selection of the field, and must return
+            a result with those dimensions, or some of them, along which it is broadcast.
+        inputs : str
+            Names of the variables or coordinates of the dataset passed to ``func``, or
+            values passed as they are
+        kwargs
+            Passed on to ``func``
+
+        """
+        self.fields[name] = (func, inputs, kwargs)
+        return self
+
+    def assign(self, data):
+        """Add the declared fields to a dataset, without computing them.
+
+        Fields are added in the order they were registered, so that a field can be
+        derived from one registered before it.
+
+        Parameters
+        ----------
+        data : `xarray.Dataset`
+
+        Returns
+        -------
+        `xarray.Dataset`
+            New dataset with every declared field as a lazily computed variable, with its
+            ``units`` and ``grid_mapping`` attributes set
+
+        """
+        for name, (func, inputs, kwargs) in self.fields.items():
+            data = data.assign({name: derived_variable(data, func, *inputs, **kwargs)})
+        return data
+
+
+def derived_variable(data, func, *inputs, **kwargs):
+    """Make a variable computed from variables of a dataset only where it is selected.
+
+    See `DerivedFields.register` for the parameters.
+
+    Returns
+    -------
+    `xarray.Variable`
+        Lazily indexed variable, with the dimensions of all of its inputs
+
+    """
+    args = [data[arg] if isinstance(arg, str) else arg for arg in inputs]
+    arrays = [arg for arg in args if isinstance(arg, xr.DataArray)]
+
+    # Dimensions of the largest input first, then the others' in the order they appear
+    dims, sizes = [], {}
+    for arg in sorted(arrays, key=lambda arg: -arg.ndim):
+        dims.extend(dim for dim in arg.dims if dim not in dims)
+        sizes.update(arg.sizes)
+    shape = tuple(sizes[dim] for dim in dims)
+
+    array = _DerivedArray(func, args, kwargs, tuple(dims), shape)
+    attrs = {"units": str(array.units)}
+    for arg in arrays:
+        if "grid_mapping" in arg.attrs:
+            attrs["grid_mapping"] = arg.attrs["grid_mapping"]
+            break
+    return xr.Variable(dims, indexing.LazilyIndexedArray(array), attrs)
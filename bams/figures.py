@@ -0,0 +1,305 @@
+"""Figures drawn both by the figure scripts and by the render service.
+
+Fig3 and fig5 are rendered once by their scripts, and on demand, along any path or at any
+level and time, by `bams.service`. Both build them with the functions here, so that the
+figures served are those of the article.
+"""
+
+import cartopy.crs as ccrs
+import cartopy.feature as cfeature
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.patheffects import withStroke
+
+import metpy.calc as mpcalc
+from metpy.plots import BarbPlot, ContourPlot, FilledContourPlot, PanelContainer
+from metpy.units import units
+
+from . import thermo
+from .basemap import MapPanel
+from .cross import cross_section, terrain_pressure
+from .derived import DerivedFields
+
+# Font sizes of fig3, for legibility in print
+label_sizes = {"xtick.labelsize": 12, "ytick.labelsize": 12, "axes.labelsize": 14}
+
+# Title of fig5, formatted with the level and time shown
+fig5_title = "{level:~P} Heights and Wind Speed at {time:%Y-%m-%d %H:%M:%S}"
+
+
+def fig3_cross_section(data, topo, start, end, steps=100):
+    """Compute the fields of fig3 along a cross section.
+
+    Parameters
+    ----------
+    data : `xarray.Dataset`
+        NARR analysis, parsed by MetPy
+    topo : `xarray.DataArray`
+        Terrain height on a grid, parsed by MetPy
+    start, end : (lat, lon)
+        Ends of the cross section
+    steps : int, optional
+        Number of points along the cross section
+
+    Returns
+    -------
+    `xarray.Dataset`
+        The cross section, with the pressure of the terrain, potential temperature,
+        relative humidity and the wind, in knots, along and across the cross section
+
+    """
+    cross = cross_section(data, start, end, steps).set_coords(("lat", "lon"))
+    cross["topo_pressure"] = terrain_pressure(
+        cross["Geopotential_height"], cross_section(topo, start, end, steps)
+    )
+
+    # Derived thermodynamic fields are computed when first plotted, for the points plotted
+    fields = DerivedFields()
+    fields.register(
+        "Potential_temperature", thermo.potential_temperature, "isobaric", "Temperature"
+    )
+    fields.register(
+        "Relative_humidity",
+        thermo.relative_humidity_from_specific_humidity,
+        "isobaric",
+        "Temperature",
+        "Specific_humidity",
+    )
+    cross = fields.assign(cross)
+    cross["u_wind"] = cross["u_wind"].metpy.convert_units("knots")
+    cross["v_wind"] = cross["v_wind"].metpy.convert_units("knots")
+    cross["t_wind"], cross["n_wind"] = mpcalc.cross_section_components(
+        cross["u_wind"], cross["v_wind"]
+    )
+    return cross
+
+
+def fig3(data, cross, start, end):
+    """Draw fig3: a cross section, with an inset map of its path.
+
+    Parameters
+    ----------
+    data : `xarray.Dataset`
+        NARR analysis, parsed by MetPy, contoured on the inset map
+    cross : `xarray.Dataset`
+        The cross section, from `fig3_cross_section`
+    start, end : (lat, lon)
+        Ends of the cross section
+
+    Returns
+    -------
+    `matplotlib.figure.Figure`
+
+    """
+    with plt.rc_context(label_sizes):
+        return _draw_fig3(data, cross, start, end)
+
+
+def _draw_fig3(data, cross, start, end):
+    steps = cross["index"].size
+    fig = plt.figure(figsize=(18, 9))
+    ax = fig.add_subplot()
+
+    rh_contour = ax.contourf(
+        cross["index"],
+        cross["isobaric"],
+        cross["Relative_humidity"],
+        levels=np.arange(0, 1.05, 0.05),
+        cmap="YlGnBu",
+    )
+
+    rh_colorbar = fig.colorbar(rh_contour)
+
+    theta_contour = ax.contour(
+        cross["index"],
+        cross["isobaric"],
+        cross["Potential_temperature"],
+        levels=np.arange(250, 450, 5),
+        colors="k",
+        linewidths=2,
+    )
+
+    theta_contour.clabel(
+        theta_contour.levels[1::2],
+        fontsize=8,
+        colors="k",
+        inline=1,
+        inline_spacing=8,
+        fmt="%i",
+        rightside_up=True,
+        use_clabeltext=True,
+    )
+
+    # Barbs every 5% of the path, on every other level of the lowest 19 and every level above
+    wind_slc_vert = list(range(0, 19, 2)) + list(range(19, cross["isobaric"].size))
+    wind_slc_horz = slice(steps // 20, steps, max(steps // 20, 1))
+
+    ax.barbs(
+        cross["index"][wind_slc_horz],
+        cross["isobaric"][wind_slc_vert],
+        cross["t_wind"][wind_slc_vert, wind_slc_horz],
+        cross["n_wind"][wind_slc_vert, wind_slc_horz],
+        color="k",
+    )
+
+    ax.fill_between(
+        cross["index"],
+        cross["topo_pressure"],
+        cross["isobaric"][0],
+        edgecolor="black",
+        facecolor="gray",
+        zorder=2,
+    )
+
+    # Create x-axis ticks for lat, lon pairs, between the ends of the path
+    xticks = np.arange(steps // 10, steps, max(3 * steps // 20, 1))
+    ax.set_xticks(np.concatenate([[0], xticks, [steps - 1]]))
+
+    # Adjust y-axis to log-scale and define pressure level ticks
+    ax.set_yscale("symlog")
+    ax.set_ylim(cross["isobaric"].max(), cross["isobaric"].min())
+    ax.set_yticks(np.arange(1000, 50, -100))
+
+    # Get Cartopy CRS object via MetPy xarray accessor
+    # and create inset map
+    data_crs = data["Geopotential_height"].metpy.cartopy_crs
+    ax_inset = fig.add_axes([0.125, 0.654, 0.25, 0.25], projection=data_crs)
+
+    ax_inset.contour(
+        data["x"],
+        data["y"],
+        data["Geopotential_height"].sel(isobaric=500.0),
+        levels=np.arange(5100, 6000, 60),
+        cmap="inferno",
+    )
+
+    # Mark ends of cross section path and draw a line between
+    endpoints = data_crs.transform_points(
+        ccrs.Geodetic(), *np.vstack([start, end]).transpose()[::-1]
+    )
+    ax_inset.scatter(endpoints[:, 0], endpoints[:, 1], c="k", zorder=2)
+    ax_inset.plot(cross["x"], cross["y"], c="k", zorder=2)
+
+    # Add geographic features
+    ax_inset.coastlines()
+    ax_inset.add_feature(cfeature.STATES.with_scale("50m"), edgecolor="k", alpha=0.2, zorder=0)
+
+    # Label the ends of the path A and B, as on the x-axis
+    ax_inset.text(
+        endpoints[0, 0] - 400000,
+        endpoints[0, 1] - 350000,
+        "A",
+        transform=data_crs,
+        fontweight="bold",
+        color="white",
+        path_effects=[withStroke(linewidth=3, foreground="black")],
+    )
+    ax_inset.text(
+        endpoints[1, 0] + 200000,
+        endpoints[1, 1] - 250000,
+        "B",
+        transform=data_crs,
+        fontweight="bold",
+        color="white",
+        path_effects=[withStroke(linewidth=3, foreground="black")],
+    )
+
+    # Set axis and tick labels
+    ticklabels = [
+        f"{lat:.4}, {lon:.4}"
+        for (lat, lon) in zip(
+            cross["lat"].sel(index=xticks).values, cross["lon"].sel(index=xticks).values
+        )
+    ]
+
+    ax.set_xticklabels(np.concatenate([["A"], ticklabels, ["B"]]))
+    ax.set_yticklabels(np.arange(1000, 50, -100))
+    ax.set_ylabel("Pressure (hPa)")
+    ax.set_xlabel("Latitude (degrees north), Longitude (degrees east)")
+    rh_colorbar.set_label("Relative Humidity")
+    return fig
+
+
+def fig5_data(data):
+    """Subset the GFS forecast to fig5's area, declaring the wind speed to compute.
+
+    Parameters
+    ----------
+    data : `xarray.Dataset`
+        GFS forecast, parsed by MetPy
+
+    Returns
+    -------
+    `xarray.Dataset`
+        The subset, with wind speed as a derived field, computed only for the level and area
+        the plots select (see `bams.derived`)
+
+    """
+    ds = data.metpy.sel(lat=slice(70, 10), lon=slice(360 - 150, 360 - 55))
+    fields = DerivedFields()
+    fields.register(
+        "wind_speed",
+        mpcalc.wind_speed,
+        "u-component_of_wind_isobaric",
+        "v-component_of_wind_isobaric",
+    )
+    return fields.assign(ds)
+
+
+def fig5(data=None, level=300 * units.hPa, time=None):
+    """Build fig5's declarative product.
+
+    Parameters
+    ----------
+    data : `xarray.Dataset`, optional
+        Data of every plot, from `fig5_data`. Without it, the product is a template, to be
+        rendered with `bams.sweep.render_frame` and titled with `fig5_title`.
+    level : `pint.Quantity`, optional
+        Level shown, 300 hPa by default
+    time : `datetime.datetime`, optional
+        Time shown. By default, that of the data is used, which must then have only one.
+
+    Returns
+    -------
+    `metpy.plots.PanelContainer`
+
+    """
+    contour = ContourPlot()
+    contour.field = "Geopotential_height_isobaric"
+    contour.level = level
+    contour.contours = list(range(0, 10000, 120))
+    contour.clabels = True
+
+    cfill = FilledContourPlot()
+    cfill.field = "wind_speed"
+    cfill.level = level
+    cfill.contours = list(range(10, 201, 20))
+    cfill.colormap = "BuPu"
+    cfill.colorbar = "horizontal"
+    cfill.plot_units = "knot"
+
+    barbs = BarbPlot()
+    barbs.field = ["u-component_of_wind_isobaric", "v-component_of_wind_isobaric"]
+    barbs.level = level
+    barbs.skip = (3, 3)
+    barbs.plot_units = "knot"
+
+    panel = MapPanel()
+    panel.area = [-125, -74, 20, 55]
+    panel.projection = "lcc"
+    panel.layers = ["states", "coastline", "borders"]
+    panel.plots = [cfill, contour, barbs]
+
+    if data is not None:
+        for plot in panel.plots:
+            plot.data = data
+            if time is not None:
+                plot.time = time
+        if time is None:
+            time = data["time"].values.astype("datetime64[s]").item()
+        panel.title = fig5_title.format(level=level, time=time)
+
+    pc = PanelContainer()
+    pc.size = (15, 15)
+    pc.panels = [panel]
+    return pc
@@ -0,0 +1,295 @@
+"""Geometries clipped to the map, simplified to its pixels and projected once.
+
+MetPy's declarative ``PlotGeometry`` hands every geometry to cartopy, which projects and
+draws every vertex, even of shapes far outside the map's area. Fig6's SPC outlook is small,
+but watches, warnings, county zones or MRMS contours run to tens of thousands of polygons,
+and then projecting and drawing vertices that end up off the map, or closer together than a
+pixel, is nearly all of the rendering time.
+
+`PlotGeometry` is a drop-in replacement that, before drawing:
+
+* finds the geometries that reach the map by their bounds, and clips those to the map's
+  extent in longitude and latitude
+* projects them onto the map and simplifies them to a fraction of the size of a pixel of
+  the output, so that the result looks the same but has far fewer vertices
+* keeps the result in memory, keyed by a hash of each geometry along with the projection,
+  the extent and the tolerance, so that products drawn again on the same map, or sharing
+  geometries (such as county zones), reuse it
+
+Geometries that do not reach the map, and their labels, are not drawn at all. Only the
+geometry operations of Shapely 1.8, which cartopy 0.20 requires, are used.
+"""
+
+import hashlib
+from collections import OrderedDict
+from itertools import cycle
+
+import cartopy.crs as ccrs
+import numpy as np
+import shapely.geometry as sgeom
+import shapely.ops
+from shapely.errors import ShapelyError
+from shapely.prepared import prep
+from shapely.validation import make_valid
+from traitlets import Float
+
+import metpy.plots
+
+# Most recently used projected geometries, keyed on the geometry and the map
+_projected_cache = OrderedDict()
+_projected_cache_size = 65536
+
+# Fraction of the extent kept beyond each edge of the map when clipping, so that lines
+# along the edges are drawn (and clipped by the axes) as they would be without clipping
+_clip_margin = 0.02
+
+# Longest edge, in degrees, projected as a straight line
+_max_segment = 0.5
+
+
+def _geographic_extent(projection, extent):
+    """Find the longitude and latitude bounds of a map's extent, with a margin."""
+    x0, x1, y0, y1 = extent
+    dx, dy = (x1 - x0) * _clip_margin, (y1 - y0) * _clip_margin
+    box = sgeom.box(x0 - dx, y0 - dy, x1 + dx, y1 + dy)
+    bounds = ccrs.PlateCarree().project_geometry(box, projection).bounds
+    if not bounds or not np.all(np.isfinite(bounds)):
+        return None
+    return sgeom.box(*bounds)
+
+
+def _map_key(projection, box, tolerance):
+    """Hash everything a projected geometry depends on other than the geometry itself."""
+    parts = [projection.to_wkt(), repr(box.bounds if box is not None else None)]
+    parts.append(f"{tolerance:.6g}")
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def _reaching(geometries, box):
+    """Find the indices of the geometries that intersect a box."""
+    # Compare bounds first, so that only geometries near the box are tested exactly
+    bounds = np.array(
+        [geom.bounds if not geom.is_empty else (np.nan,) * 4 for geom in geometries]
+    )
+    bounds = bounds.reshape(-1, 4)
+    x0, y0, x1, y1 = box.bounds
+    near = np.flatnonzero(
+        (bounds[:, 0] <= x1)
+        & (bounds[:, 2] >= x0)
+        & (bounds[:, 1] <= y1)
+        & (bounds[:, 3] >= y0)
+    )
+    prepared = prep(box)
+    return np.array([i for i in near if prepared.intersects(geometries[i])], dtype=int)
+
+
+def _clip(geometry, box):
+    try:
+        return geometry.intersection(box)
+    except ShapelyError:
+        # Invalid shapes, as sometimes found in shapefiles, are repaired and then clipped
+        return make_valid(geometry).intersection(box)
+
+
+def _segmentize(x, y):
+    """Split the edges of a line longer than ``_max_segment`` into equal parts."""
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    if x.size < 2:
+        return x, y
+    dx, dy = np.diff(x), np.diff(y)
+    parts = np.maximum(np.ceil(np.hypot(dx, dy) / _max_segment), 1).astype(int)
+    edge = np.repeat(np.arange(parts.size), parts)
+    fraction = (np.arange(edge.size) - np.repeat(np.cumsum(parts) - parts, parts)) / parts[
+        edge
+    ]
+    return (
+        np.append(x[edge] + fraction * dx[edge], x[-1]),
+        np.append(y[edge] + fraction * dy[edge], y[-1]),
+    )
+
+
+def _project(geometries, projection, box, tolerance):
+    """Clip, project and simplify a list of geometries."""
+    if box is None:
+        # Without a bounded area, shapes may cross the edges of the projection's domain,
+        # which cartopy cuts them at
+        geodetic = ccrs.PlateCarree()
+        projected = [projection.project_geometry(geom, geodetic) for geom in geometries]
+    else:
+        # Within the map's area the projection is continuous, so projecting the vertices is
+        # enough, once long edges (which are curved on the map) have been split
+        def transform(x, y):
+            points = projection.transform_points(ccrs.PlateCarree(), *_segmentize(x, y))
+            return points[:, 0], points[:, 1]
+
+        projected = [shapely.ops.transform(transform, _clip(geom, box)) for geom in geometries]
+    if tolerance > 0:
+        projected = [geom.simplify(tolerance, preserve_topology=True) for geom in projected]
+    return projected
+
+
+def project_geometries(geometries, projection, extent, tolerance=0):
+    """Clip geometries to a map, project them onto it and simplify them.
+
+    Parameters
+    ----------
+    geometries : list of shapely geometries
+        Geometries in longitude and latitude
+    projection : `cartopy.crs.Projection`
+        Projection of the map
+    extent : tuple
+        ``(x0, x1, y0, y1)`` of the map, in ``projection``
+    tolerance : float, optional
+        Largest distance, in ``projection``'s units, that simplifying may move a line by.
+        Defaults to 0, which does not simplify.
+
+    Returns
+    -------
+    indices : `numpy.ndarray`
+        Indices, in order, of the geometries that reach the map
+    projected : list of shapely geometries
+        Those geometries, clipped, in ``projection`` and simplified, reused from memory
+        when the same geometry has been projected onto the same map before
+
+    """
+    box = _geographic_extent(projection, extent)
+    geometries = list(geometries)
+    if box is None:
+        indices = np.arange(len(geometries))
+    else:
+        indices = _reaching(geometries, box)
+
+    map_key = _map_key(projection, box, tolerance)
+    keys = [(hashlib.sha256(geometries[i].wkb).hexdigest(), map_key) for i in indices]
+    missing = [(i, key) for i, key in zip(indices, keys) if key not in _projected_cache]
+    new = dict(
+        zip(
+            [key for _, key in missing],
+            _project([geometries[i] for i, _ in missing], projection, box, tolerance),
+        )
+    )
+
+    projected = []
+    for key in keys:
+        if key in new:
+            _projected_cache[key] = new[key]
+        projected.append(_projected_cache[key])
+        _projected_cache.move_to_end(key)
+    while len(_projected_cache) > _projected_cache_size:
+        _projected_cache.popitem(last=False)
+    return indices, projected
+
+
+class PlotGeometry(metpy.plots.PlotGeometry):
+    """MetPy's declarative ``PlotGeometry``, drawing only what reaches the map.
+
+    Geometries are clipped to the map, projected onto it once and simplified to a fraction
+    of a pixel before cartopy draws them; see `project_geometries`.
+    """
+
+    simplify = Float(default_value=0.5, allow_none=True)
+    simplify.__doc__ = """Largest distance, in pixels, that simplifying may move a line by.
+
+    Set to 0 or `None` to draw every vertex. Default value is 0.5.
+    """
+
+    dpi = Float(default_value=None, allow_none=True)
+    dpi.__doc__ = """Resolution of the saved figure, to size the pixels that set `simplify`.
+
+    Defaults to the resolution of the figure, which is lower than that of figures saved
+    with a larger ``dpi``; set it to the ``dpi`` they are saved with so that they are not
+    simplified more than their pixels.
+    """
+
+    @staticmethod
+    def _position_label(geo_obj, label):
+        """Return a (lon, lat) where the label of a polygon/line/point can be placed."""
+        # As MetPy's, but reaching the parts of multi-part geometries through `geoms`
+        label_hash = sum(map(ord, str(label)))
+        if geo_obj.geom_type in ("MultiPolygon", "MultiLineString"):
+            geo_obj = max(geo_obj.geoms, key=lambda x: x.length)
+        elif geo_obj.geom_type == "MultiPoint":
+            geo_obj = geo_obj.geoms[label_hash % len(geo_obj.geoms)]
+
+        if geo_obj.geom_type == "Polygon":
+            coords = geo_obj.exterior.coords
+        else:
+            coords = geo_obj.coords
+        return coords[label_hash % len(coords)]
+
+    def _tolerance(self):
+        """Find the size of ``simplify`` pixels of the output in map coordinates."""
+        if not self.simplify:
+            return 0
+        ax = self.parent.ax
+        ax.apply_aspect()
+        x0, x1, y0, y1 = ax.get_extent()
+        scale = (self.dpi or ax.figure.dpi) / ax.figure.dpi
+        width, height = ax.bbox.width * scale, ax.bbox.height * scale
+        return self.simplify * max((x1 - x0) / width, (y1 - y0) / height)
+
+    def _build(self):
+        """Build the plot from the geometries that reach the map."""
+        # Cast attributes to a list if None, as MetPy does
+        self.fill = ["none"] if self.fill is None else self.fill
+        self.stroke = ["none"] if self.stroke is None else self.stroke
+        self.labels = [""] if self.labels is None else self.labels
+        self.label_edgecolor = (
+            ["none"] if self.label_edgecolor is None else self.label_edgecolor
+        )
+        self.label_facecolor = (
+            ["none"] if self.label_facecolor is None else self.label_facecolor
+        )
+
+        ax = self.parent.ax
+        styles = list(
+            zip(
+                self.geometry,
+                cycle(self.stroke),
+                cycle(self.fill),
+                cycle(self.labels),
+                cycle(self.label_facecolor),
+                cycle(self.label_edgecolor),
+            )
+        )
+        indices, projected = project_geometries(
+            self.geometry, ax.projection, ax.get_extent(), self._tolerance()
+        )
+
+        # All shapes are drawn by one artist, with a color for each, so that they are drawn
+        # in the same order as when MetPy adds an artist for each shape
+        shapes, edgecolors, facecolors = [], [], []
+        for index, shape in zip(indices, projected):
+            geo_obj, stroke, fill, label, fontcolor, fontoutline = styles[index]
+            if geo_obj.geom_type in ("Point", "MultiPoint"):
+                points = geo_obj.geoms if geo_obj.geom_type == "MultiPoint" else [geo_obj]
+                for point in points:
+                    lon, lat = point.coords[0]
+                    ax.plot(
+                        lon, lat, color=fill, marker=self.marker, transform=ccrs.PlateCarree()
+                    )
+            elif not shape.is_empty:
+                shapes.append(shape)
+                edgecolors.append(stroke)
+                facecolors.append(fill if "Polygon" in geo_obj.geom_type else "none")
+
+            # Plot labels if provided, choosing colors as MetPy does
+            if label:
+                if fontcolor in [None, "none"] and stroke not in [None, "none"]:
+                    fontcolor = stroke
+                elif fontcolor in [None, "none"]:
+                    fontcolor = "black"
+                if fontoutline in [None, "none"] and fill not in [None, "none"]:
+                    fontoutline = fill
+                elif fontoutline in [None, "none"]:
+                    fontoutline = "white"
+
+                lon, lat = self._position_label(geo_obj, label)
+                polygon = geo_obj.geom_type in ("Polygon", "MultiPolygon")
+                offset = (0, 0) if polygon else (0, -12)
+                self._draw_label(label, lon, lat, fontcolor, fontoutline, offset)
+
+        if shapes:
+            ax.add_geometries(
+                shapes, ax.projection, edgecolor=edgecolors, facecolor=facecolors
+            )
@@ -0,0 +1,98 @@
+"""Helpers for displaying high-resolution imagery on maps."""
+
+import numpy as np
+
+# Number of points per side sampled when mapping the axes onto the image
+_samples = 64
+
+
+def _index_slice(coord, lower, upper, pad=2):
+    """Find the slice of ``coord`` covering ``lower`` to ``upper``, plus some padding."""
+    inside = np.flatnonzero((coord >= lower) & (coord <= upper))
+    if not inside.size:
+        return slice(0, 0)
+    return slice(max(inside[0] - pad, 0), inside[-1] + pad + 1)
+
+
+def axes_pixels(ax, dpi=None):
+    """Get the size in pixels of a map's axes when the figure is saved.
+
+    Parameters
+    ----------
+    ax : `cartopy.mpl.geoaxes.GeoAxes`
+    dpi : float, optional
+        Resolution the figure will be saved at. Defaults to the figure's resolution.
+
+    Returns
+    -------
+    width, height : int
+
+    """
+    # Account for the axes shrinking to keep the map's aspect ratio
+    ax.apply_aspect()
+    fig = ax.figure
+    bbox = ax.get_position()
+    dpi = dpi or fig.dpi
+    width, height = fig.get_size_inches()
+    return int(np.ceil(bbox.width * width * dpi)), int(np.ceil(bbox.height * height * dpi))
+
+
+def decimate_to_axes(image, ax, dpi=None, oversample=2):
+    """Reduce an image to the part and resolution that a map's axes can display.
+
+    The image is cropped to the visible extent of the map, then block-averaged so that
+    every output pixel still covers at least ``oversample`` image pixels in each direction.
+    Reprojecting the result (e.g. with ``ax.imshow(..., transform=...)``) is then much
+    cheaper, without a visible loss of detail.
+
+    Parameters
+    ----------
+    image : `xarray.DataArray`
+        Two-dimensional image on a regular grid, parsed with MetPy's ``parse_cf``
+    ax : `cartopy.mpl.geoaxes.GeoAxes`
+        Map axes the image will be shown on, with its extent already set
+    dpi : float, optional
+        Resolution the figure will be saved at. Defaults to the figure's resolution.
+    oversample : float, optional
+        Minimum number of image pixels to keep per output pixel. Defaults to 2.
+
+    Returns
+    -------
+    `xarray.DataArray`
+        The cropped and averaged image, with coordinates matching the new pixels
+
+    """
+    x, y = image.metpy.coordinates("x", "y")
+    width, height = axes_pixels(ax, dpi)
+
+    # Map a grid of points covering the axes into the image's coordinates
+    x0, x1, y0, y1 = ax.get_extent()
+    xx, yy = np.meshgrid(np.linspace(x0, x1, _samples), np.linspace(y0, y1, _samples))
+    points = image.metpy.cartopy_crs.transform_points(ax.projection, xx, yy)
+    with np.errstate(invalid="ignore"):
+        visible = np.isfinite(points[..., :2]).all(axis=-1)
+    if not visible.any():
+        return image.isel({x.name: slice(0, 0), y.name: slice(0, 0)})
+
+    visible_x = points[..., 0][visible]
+    visible_y = points[..., 1][visible]
+    cropped = image.isel(
+        {
+            x.name: _index_slice(x.values, visible_x.min(), visible_x.max()),
+            y.name: _index_slice(y.values, visible_y.min(), visible_y.max()),
+        }
+    )
+
+    # Image pixels covered by one output pixel, from the spacing of the sampled points
+    col = (points[..., 0] - float(x[0])) / float(x[1] - x[0])
+    row = (points[..., 1] - float(y[0])) / float(y[1] - y[0])
+    along_x = np.hypot(np.diff(col, axis=1), np.diff(row, axis=1)) * (_samples - 1) / width
+    along_y = np.hypot(np.diff(col, axis=0), np.diff(row, axis=0)) * (_samples - 1) / height
+    density = min(np.nanmin(along_x), np.nanmin(along_y))
+
+    factor = max(int(density / oversample), 1)
+    if factor == 1:
+        return cropped
+    return cropped.coarsen({x.name: factor, y.name: factor}, boundary="trim").mean(
+        keep_attrs=True
+    )
@@ -0,0 +1,190 @@
+"""Parallel parsing of METAR text files, with the parsed reports cached on local disk.
+
+`read_metars` is a drop-in replacement for `metpy.io.parse_metar_file`. The text is split
+into chunks of whole reports, which are parsed across a pool of processes. The parsed table,
+along with its units, is stored as an Arrow IPC file keyed by the text and the year and month
+used to date the reports. Later runs that read the same file memory-map that table instead of
+parsing the text again.
+
+The cache lives in ``.cache/metar`` at the root of the repository unless
+``BAMS_METAR_CACHE_DIR`` says otherwise; it is safe to delete at any time.
+"""
+
+import hashlib
+import io
+import json
+import os
+import tempfile
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+import metpy
+from metpy.io import parse_metar_file
+
+default_cache_dir = Path(__file__).resolve().parents[1] / ".cache" / "metar"
+
+# Lines continuing a report (which may wrap) start with this prefix, as in MetPy
+_continuation = "     "
+
+# Below this many reports per worker, starting processes costs more than it saves
+_min_reports_per_chunk = 500
+
+
+def _cache_dir():
+    path = Path(os.environ.get("BAMS_METAR_CACHE_DIR", default_cache_dir))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _set_units(df, units):
+    # Pandas warns about setting attributes that are not columns, as MetPy does
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        df.units = units
+    return df
+
+
+def _report_starts(lines):
+    """Find the lines starting a report: any non-blank line not continuing the one before."""
+    return [
+        i
+        for i, line in enumerate(lines)
+        if line.strip() and not line.startswith(_continuation)
+    ]
+
+
+def split_reports(text, chunks):
+    """Split METAR text into roughly equal chunks, without splitting any report.
+
+    Parameters
+    ----------
+    text : str
+        Contents of a METAR text file
+    chunks : int
+        Number of chunks to split into
+
+    Returns
+    -------
+    list of str
+
+    """
+    lines = text.splitlines(keepends=True)
+    starts = _report_starts(lines)
+    if not starts:
+        return []
+
+    chunks = max(min(chunks, len(starts)), 1)
+    bounds = [0] + [starts[len(starts) * i // chunks] for i in range(1, chunks)] + [len(lines)]
+    return ["".join(lines[start:stop]) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def _parse_chunk(text, year, month):
+    df = parse_metar_file(io.StringIO(text), year=year, month=month)
+    # Units are an attribute on the frame, which does not survive pickling
+    return df, df.units
+
+
+def parse_metars(text, year=None, month=None, workers=None):
+    """Parse the contents of a METAR text file across a pool of processes.
+
+    Parameters
+    ----------
+    text : str
+        Contents of a METAR text file
+    year, month : int, optional
+        Year and month of the reports, as for `metpy.io.parse_metar_file`
+    workers : int, optional
+        Number of processes to use. Defaults to the number of CPUs.
+
+    Returns
+    -------
+    `pandas.DataFrame`
+        The same table as `metpy.io.parse_metar_file` returns, with its ``units`` attribute
+
+    """
+    workers = workers or os.cpu_count()
+    reports = len(_report_starts(text.splitlines()))
+    workers = max(min(workers, reports // _min_reports_per_chunk), 1)
+
+    if workers == 1:
+        df, units = _parse_chunk(text, year, month)
+    else:
+        chunks = split_reports(text, workers)
+        with ProcessPoolExecutor(len(chunks)) as pool:
+            results = list(
+                pool.map(_parse_chunk, chunks, [year] * len(chunks), [month] * len(chunks))
+            )
+        # MetPy drops duplicate reports (keeping the last) across the whole file
+        df = pd.concat([chunk for chunk, _ in results])
+        df = df.drop_duplicates(subset=["date_time", "latitude", "longitude"], keep="last")
+        units = results[0][1]
+
+    return _set_units(df, units)
+
+
+def _write_table(path, df):
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b"units"] = json.dumps(df.units).encode("utf-8")
+    table = table.replace_schema_metadata(metadata)
+
+    # Write atomically, so that scripts running in parallel never see a partial file
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp", suffix=".arrow")
+    os.close(fd)
+    with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def _read_table(path):
+    with pa.memory_map(str(path)) as source:
+        table = pa.ipc.open_file(source).read_all()
+    return _set_units(table.to_pandas(), json.loads(table.schema.metadata[b"units"]))
+
+
+def read_metars(source, year=None, month=None, workers=None):
+    """Read a METAR text file, reusing the parsed reports if it has been read before.
+
+    Parameters
+    ----------
+    source : str, `pathlib.Path` or file-like object
+        Path to a METAR text file, or the file opened in text mode (e.g. by Siphon's
+        ``remote_open(mode="t")``)
+    year, month : int, optional
+        Year and month of the reports, as for `metpy.io.parse_metar_file`. Default to the
+        current year and month.
+    workers : int, optional
+        Number of processes to parse with. Defaults to the number of CPUs.
+
+    Returns
+    -------
+    `pandas.DataFrame`
+        The same table as `metpy.io.parse_metar_file` returns, with its ``units`` attribute
+
+    """
+    if hasattr(source, "read"):
+        text = source.read()
+    else:
+        text = Path(source).read_text()
+
+    now = datetime.now()
+    year = year or now.year
+    month = month or now.month
+
+    key = hashlib.sha256(text.encode("utf-8"))
+    key.update(f"{year}-{month}-{metpy.__version__}".encode("utf-8"))
+    path = _cache_dir() / f"{key.hexdigest()}.arrow"
+
+    try:
+        return _read_table(path)
+    except (OSError, pa.ArrowInvalid, KeyError):
+        pass
+
+    df = parse_metars(text, year=year, month=month, workers=workers)
+    _write_table(path, df)
+    return df
@@ -0,0 +1,253 @@
+"""Save a figure at several resolutions and formats from a single render.
+
+Each figure script saved its figure with ``savefig(..., dpi=600, bbox_inches="tight")``,
+which draws the figure twice: once, without rasterizing, to find the tight box, and again to
+rasterize it. The web products need the same figure at print, screen and thumbnail
+resolutions, which would take two draws each. `save` instead:
+
+* finds the tight box once, caching it under a key given by the caller, so that a product
+  drawn again (such as by `bams.service`) skips that draw altogether
+* rasterizes the figure once, cropped to the box, at the highest resolution asked for, and
+  averages that image down to the other resolutions, which takes a fraction of drawing them
+* encodes the raster outputs (PNG, WebP, JPEG or TIFF) over a pool of threads, as Pillow
+  encodes without holding the GIL
+* saves vector outputs (SVG, PDF and the other formats only matplotlib writes) with
+  ``savefig``, cropped to the same box
+
+`save` returns how long each output took and how much memory its pixels needed, and the same
+for the shared render. `product_paths` names the outputs of a figure: a PNG at print
+resolution, and WebP images for screens and thumbnails.
+"""
+
+import io
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+from PIL import Image
+
+# Formats encoded from the single render, with their names in Pillow and the options used
+_pillow_formats = {
+    "png": ("PNG", {}),
+    "webp": ("WEBP", {"quality": 90}),
+    "jpg": ("JPEG", {"quality": 90}),
+    "jpeg": ("JPEG", {"quality": 90}),
+    "tif": ("TIFF", {"compression": "tiff_deflate"}),
+    "tiff": ("TIFF", {"compression": "tiff_deflate"}),
+}
+
+# Resolutions of the web products, as (suffix, dpi, format), besides the print PNG
+web_resolutions = [("_screen", 150, "webp"), ("_thumbnail", 40, "webp")]
+
+# Tight boxes of figures saved before, by key
+_bbox_cache = OrderedDict()
+_bbox_cache_size = 256
+
+
+@dataclass
+class Output:
+    """An image to save a figure to.
+
+    Attributes
+    ----------
+    target : str or `pathlib.Path` or file-like
+        Where to save the image
+    dpi : float
+        Resolution of the image. For vector formats, that of any rasterized artists.
+    format : str, optional
+        Format of the image, by default the suffix of ``target``
+
+    """
+
+    target: object
+    dpi: float = 100
+    format: str = None
+
+    def __post_init__(self):
+        if self.format is None:
+            if not isinstance(self.target, (str, os.PathLike)):
+                raise ValueError("the format of an output written to a file object is needed")
+            self.format = Path(self.target).suffix[1:]
+        self.format = self.format.lower()
+
+
+def product_paths(stem, dpi=600):
+    """List the outputs of a figure, for print and for the web.
+
+    Parameters
+    ----------
+    stem : str or `pathlib.Path`
+        Path of the outputs, without the suffixes, e.g. ``../output/fig3_cross_section``
+    dpi : float, optional
+        Print resolution
+
+    Returns
+    -------
+    list of `Output`
+
+    """
+    stem = str(stem)
+    return [
+        Output(f"{stem}.png", dpi),
+        *(Output(f"{stem}{suffix}.{fmt}", res) for suffix, res, fmt in web_resolutions),
+    ]
+
+
+def tight_bbox(fig, key=None, pad_inches=None):
+    """Find the box, in inches, that ``savefig(bbox_inches="tight")`` crops a figure to.
+
+    Parameters
+    ----------
+    fig : `matplotlib.figure.Figure`
+    key : hashable, optional
+        Identifies figures laid out the same way, e.g. a product and its parameters. The box
+        of a figure with a key seen before is not looked for again.
+    pad_inches : float, optional
+        Padding around the box, by default :rc:`savefig.pad_inches`
+
+    Returns
+    -------
+    `matplotlib.transforms.Bbox`
+
+    """
+    if key is not None and key in _bbox_cache:
+        _bbox_cache.move_to_end(key)
+        return _bbox_cache[key].frozen()
+
+    import matplotlib as mpl
+
+    if pad_inches is None:
+        pad_inches = mpl.rcParams["savefig.pad_inches"]
+    # Lay out the figure as savefig does, without rasterizing anything
+    renderer = fig.canvas.get_renderer()
+    with renderer._draw_disabled():
+        fig.draw(renderer)
+    bbox = fig.get_tightbbox(renderer).padded(pad_inches)
+
+    if key is not None:
+        _bbox_cache[key] = bbox.frozen()
+        while len(_bbox_cache) > _bbox_cache_size:
+            _bbox_cache.popitem(last=False)
+    return bbox
+
+
+def _pixels(bbox, dpi):
+    """Get the size in pixels of a box rasterized at a resolution, as Agg sizes its canvas."""
+    return int(bbox.width * dpi), int(bbox.height * dpi)
+
+
+def _resample(image, bbox, outputs):
+    """Resample the render to the resolution of each output.
+
+    Outputs are resampled from the highest resolution down, each from the previous one, by
+    averaging the pixels each new pixel covers, as antialiasing does when rasterizing.
+
+    Returns
+    -------
+    list of (`PIL.Image.Image`, float)
+        The image of each output, and how long it took to make
+
+    """
+    images = [None] * len(outputs)
+    for index in sorted(range(len(outputs)), key=lambda i: -outputs[i].dpi):
+        start = time.perf_counter()
+        size = _pixels(bbox, outputs[index].dpi)
+        if size != image.size:
+            image = image.resize(size, Image.Resampling.BOX)
+        images[index] = image, time.perf_counter() - start
+    return images
+
+
+def _encode(output, image, seconds, shared):
+    """Encode the image of an output."""
+    start = time.perf_counter()
+    name, options = _pillow_formats[output.format]
+    if name == "JPEG":
+        image = image.convert("RGB")
+    image.save(output.target, name, dpi=(output.dpi, output.dpi), **options)
+    return {
+        "target": str(output.target),
+        "format": output.format,
+        "dpi": output.dpi,
+        "size": image.size,
+        "seconds": seconds + time.perf_counter() - start,
+        "mb": 0 if shared else len(image.getbands()) * image.width * image.height / 2**20,
+    }
+
+
+def save(fig, outputs, key=None, pad_inches=None, threads=None):
+    """Save a figure to several outputs, cropped as ``bbox_inches="tight"`` would.
+
+    Parameters
+    ----------
+    fig : `matplotlib.figure.Figure`
+    outputs : list of `Output` or (target, dpi) or (target, dpi, format)
+    key : hashable, optional
+        Key under which the figure's tight box is cached (see `tight_bbox`)
+    pad_inches : float, optional
+        Padding around the tight box, by default :rc:`savefig.pad_inches`
+    threads : int, optional
+        Number of threads encoding the raster outputs, by default one for each, up to the
+        number of CPUs
+
+    Returns
+    -------
+    list of dict
+        For the render (``target`` None) and then each output: its ``target``, ``format``,
+        ``dpi``, ``size`` in pixels, the ``seconds`` it took, and ``mb``, the memory of the
+        pixels it allocated (the render's canvas and its copy, or the resampled image; the
+        output at the resolution of the render shares its pixels)
+
+    """
+    outputs = [output if isinstance(output, Output) else Output(*output) for output in outputs]
+    raster = [output for output in outputs if output.format in _pillow_formats]
+    vector = [output for output in outputs if output.format not in _pillow_formats]
+
+    start = time.perf_counter()
+    bbox = tight_bbox(fig, key, pad_inches)
+    records = []
+    if raster:
+        dpi = max(output.dpi for output in raster)
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="rgba", dpi=dpi, bbox_inches=bbox)
+        size = _pixels(bbox, dpi)
+        image = Image.frombuffer("RGBA", size, buffer.getbuffer(), "raw", "RGBA", 0, 1)
+        records.append(
+            {
+                "target": None,
+                "format": "rgba",
+                "dpi": dpi,
+                "size": size,
+                "seconds": time.perf_counter() - start,
+                "mb": 2 * 4 * size[0] * size[1] / 2**20,
+            }
+        )
+
+        images = _resample(image, bbox, raster)
+        threads = threads or min(len(raster), os.cpu_count() or 1)
+        with ThreadPoolExecutor(threads) as pool:
+            records.extend(
+                pool.map(
+                    lambda output, item: _encode(output, *item, item[0] is image),
+                    raster,
+                    images,
+                )
+            )
+
+    for output in vector:
+        start = time.perf_counter()
+        fig.savefig(output.target, format=output.format, dpi=output.dpi, bbox_inches=bbox)
+        records.append(
+            {
+                "target": str(output.target),
+                "format": output.format,
+                "dpi": output.dpi,
+                "size": None,
+                "seconds": time.perf_counter() - start,
+                "mb": 0,
+            }
+        )
+    return records
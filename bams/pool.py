@@ -0,0 +1,246 @@
+"""A pool of workers with the figures' heavy libraries already imported.
+
+Starting an interpreter and importing matplotlib, cartopy, MetPy, xarray and geopandas takes
+several seconds, which is most of the time some figures take. `WarmPool` imports them once,
+in a forkserver process, and runs each figure script in a process forked from it, so that
+scripts start with everything already imported. Every script gets a fresh process, so that
+nothing one script does (to pyplot's state, rcParams or the environment) carries over to the
+next.
+
+``python -m bams.pool --profile`` compares the time spent importing each of those libraries
+in a new interpreter with the time spent in a worker of the pool.
+"""
+
+import argparse
+import atexit
+import contextlib
+import importlib
+import io
+import json
+import multiprocessing
+import os
+import runpy
+import subprocess
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from . import trace
+
+# Modules imported by the figure scripts, in the order they are usually first imported
+default_preload = [
+    "numpy",
+    "matplotlib.pyplot",
+    "xarray",
+    "pandas",
+    "scipy.ndimage",
+    "metpy.calc",
+    "metpy.plots",
+    "cartopy.crs",
+    "cartopy.feature",
+    "geopandas",
+    "siphon.catalog",
+]
+
+
+def _run_script(script, env):
+    """Run a figure script from its directory in this process, capturing its output."""
+    os.environ.update(env)
+    script = Path(script).resolve()
+    os.chdir(script.parent)
+    sys.argv = [script.name]
+    sys.path[0] = str(script.parent)
+
+    # Trace the script if asked to, as `python -m bams.trace run` does
+    trace.install(process_name=script.name)
+
+    stdout, stderr = io.StringIO(), io.StringIO()
+    returncode = 0
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+        try:
+            with trace.span(script.name, category="run"):
+                runpy.run_path(str(script), run_name="__main__")
+        except SystemExit as e:
+            returncode = e.code if isinstance(e.code, int) else int(e.code is not None)
+        except BaseException:
+            traceback.print_exc()
+            returncode = 1
+        finally:
+            # Workers end without running exit handlers, which scripts may rely on (such
+            # as writing the manifest of remote data)
+            atexit._run_exitfuncs()
+    return subprocess.CompletedProcess(
+        [script.name], returncode, stdout.getvalue(), stderr.getvalue()
+    )
+
+
+def _time_imports(modules):
+    """Time importing each module in turn, in this process."""
+    times = {}
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            times[name] = None
+            continue
+        times[name] = time.perf_counter() - start
+    return times
+
+
+def _child(conn, func, args):
+    """Call a function in a worker and send its result back to the parent."""
+    try:
+        result = (True, func(*args))
+    except BaseException as e:
+        result = (False, e)
+    conn.send(result)
+    conn.close()
+
+
+class WorkerDied(RuntimeError):
+    """Raised when a worker exits without returning a result, e.g. when it is killed."""
+
+    def __init__(self, exitcode):
+        super().__init__(f"Worker exited with code {exitcode} without a result.")
+        self.exitcode = exitcode
+
+
+class WarmPool:
+    """Run figure scripts in forked workers with the heavy libraries already imported.
+
+    Each job runs in a new process forked from the forkserver, and a job whose process dies
+    (killed, out of memory, or crashed in an extension module) is reported as failed rather
+    than waited on forever.
+
+    Parameters
+    ----------
+    processes : int, optional
+        Number of scripts to run at once. Defaults to the number of CPUs.
+    preload : list of str, optional
+        Modules to import in the forkserver. Modules that fail to import are skipped.
+
+    """
+
+    def __init__(self, processes=None, preload=None):
+        # Scripts run without a display
+        os.environ.setdefault("MPLBACKEND", "agg")
+        self._context = multiprocessing.get_context("forkserver")
+        self._context.set_forkserver_preload(default_preload if preload is None else preload)
+        self._executor = ThreadPoolExecutor(max_workers=processes or os.cpu_count())
+
+    def _call(self, func, *args):
+        """Call a function in a new worker, waiting for its result."""
+        receiver, sender = self._context.Pipe(duplex=False)
+        process = self._context.Process(target=_child, args=(sender, func, args))
+        process.start()
+        sender.close()
+        try:
+            ok, result = receiver.recv()
+        except EOFError:
+            ok, result = None, None
+        finally:
+            receiver.close()
+            process.join()
+
+        if ok is None:
+            raise WorkerDied(process.exitcode)
+        if not ok:
+            raise result
+        return result
+
+    def _run(self, script, env):
+        try:
+            return self._call(_run_script, str(script), dict(env or {}))
+        except WorkerDied as e:
+            return subprocess.CompletedProcess([Path(script).name], e.exitcode, "", f"{e}\n")
+
+    def submit(self, script, env=None):
+        """Start running a script, returning a `concurrent.futures.Future`.
+
+        Its result is a `subprocess.CompletedProcess` with the script's exit code and
+        captured output, as from ``subprocess.run(..., capture_output=True, text=True)``.
+        If the worker dies, the exit code is that of the worker (negative for a signal, as
+        for `subprocess`).
+        """
+        return self._executor.submit(self._run, script, env)
+
+    def run(self, script, env=None):
+        """Run a script and wait for it to finish."""
+        return self.submit(script, env).result()
+
+    def time_imports(self, modules):
+        """Time importing modules in a worker."""
+        return self._executor.submit(self._call, _time_imports, modules).result()
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def profile(modules=None):
+    """Print how long importing each module takes in a new interpreter and in the pool."""
+    modules = default_preload if modules is None else modules
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    startup = time.perf_counter() - start
+    cold = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import json, sys; from bams.pool import _time_imports; "
+            "print(json.dumps(_time_imports(sys.argv[1:])))",
+            *modules,
+        ],
+        cwd=Path(__file__).resolve().parents[1],
+        env=dict(os.environ, MPLBACKEND="agg"),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    cold = json.loads(cold.stdout)
+
+    with WarmPool(1, preload=modules) as pool:
+        # The first task waits for the forkserver to import everything
+        start = time.perf_counter()
+        pool.time_imports([])
+        setup = time.perf_counter() - start
+        start = time.perf_counter()
+        warm = pool.time_imports(modules)
+        fork = time.perf_counter() - start - sum(t or 0 for t in warm.values())
+
+    def ms(seconds):
+        return f"{seconds * 1000:10.1f}" if seconds is not None else f"{'n/a':>10}"
+
+    print(f"{'':<20} {'cold (ms)':>10} {'warm (ms)':>10}")
+    print(f"{'interpreter/fork':<20} {ms(startup)} {ms(fork)}")
+    for name in modules:
+        print(f"{name:<20} {ms(cold[name])} {ms(warm[name])}")
+    total_cold = startup + sum(t or 0 for t in cold.values())
+    total_warm = fork + sum(t or 0 for t in warm.values())
+    print(f"{'total':<20} {ms(total_cold)} {ms(total_warm)}")
+    print(f"Starting the pool took {setup:.2f} s, once for all scripts.")
+
+
+def main():
+    """Profile the import time saved by running figure scripts in a warm pool."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--profile", action="store_true", help="compare import times")
+    parser.add_argument("modules", nargs="*", help="modules to profile (default preload)")
+    args = parser.parse_args()
+    if args.profile:
+        profile(args.modules or None)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,520 @@
+"""Offline-capable, content-addressed caching of remote data accessed through Siphon.
+
+All of Siphon's HTTP traffic (catalogs, simple web services, HTTPServer downloads and
+NetCDF Subset Service queries) goes through sessions created by
+``siphon.http_util.session_manager``. `install` hooks into it so that every response is
+stored on local disk, keyed by its full URL (including the query), and served from there on
+later runs. The cache works in one of three modes, selected by the ``BAMS_REMOTE_CACHE``
+environment variable:
+
+``on`` (the default)
+    Serve fresh responses from the cache and fetch (and store) everything else.
+``replay``
+    Never touch the network; every request is answered by a local stand-in server backed
+    by the cache, so a previously recorded run can be repeated offline.
+``off``
+    Leave Siphon alone.
+
+The cache lives in ``.cache/remote`` at the root of the repository unless
+``BAMS_REMOTE_CACHE_DIR`` says otherwise. ``BAMS_REMOTE_CACHE_TTL`` (seconds) limits the age
+of responses served from the cache (older ones are fetched again, but kept for replay) and
+``BAMS_REMOTE_CACHE_SIZE`` (bytes) caps the size of the cache, evicting the least recently
+used responses first. With ``BAMS_REMOTE_MANIFEST`` set, the URL and content digest of every
+response used are written to that JSON file at exit, which is how `bams.build` tracks the
+remote inputs of each figure. Downloaded files kept in the cache
+are opened from their `bams.store` stores, so each is decoded and parsed only once.
+"""
+
+import argparse
+import atexit
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import cartopy.crs as ccrs
+import numpy as np
+import requests
+import xarray as xr
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from siphon.http_util import session_manager
+
+from . import store
+
+default_cache_dir = Path(__file__).resolve().parents[1] / ".cache" / "remote"
+
+# Catalog listings (e.g. "current" directories) change as new data arrive
+default_catalog_ttl = 600
+
+# Headers that describe the encoded transfer rather than the (decoded) stored content
+_transfer_headers = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+_installed = None
+
+# Bytes of response content fetched over the network and served from the cache
+stats = Counter()
+
+# SHA-256 digest of the content of every response used, by URL
+used = {}
+
+
+class DiskCache:
+    """Content-addressed store of HTTP responses on local disk.
+
+    Response bodies are stored once per unique content under ``objects/``, and a small JSON
+    record per URL under ``keys/`` points at the body. Records are written atomically, so
+    several figure scripts can share a cache while running in parallel.
+
+    Parameters
+    ----------
+    root : str or `pathlib.Path`
+        Directory holding the cache
+    ttl : float, optional
+        Maximum age in seconds of responses served from the cache. Defaults to no limit.
+    catalog_ttl : float, optional
+        Maximum age in seconds of cached THREDDS catalogs, which change as new data arrive.
+    max_bytes : int, optional
+        Maximum total size of stored responses. Defaults to no limit.
+
+    """
+
+    def __init__(
+        self, root=default_cache_dir, ttl=None, catalog_ttl=default_catalog_ttl, max_bytes=None
+    ):
+        self.root = Path(root)
+        self.ttl = ttl
+        self.catalog_ttl = catalog_ttl
+        self.max_bytes = max_bytes
+        # Size of the stored content as of the last eviction, plus what has been stored since
+        self._bytes = None
+        (self.root / "keys").mkdir(parents=True, exist_ok=True)
+        (self.root / "objects").mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(url):
+        """Get the cache key for a (fully encoded) URL."""
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _record_path(self, url):
+        return self.root / "keys" / f"{self.key(url)}.json"
+
+    def blob_path(self, digest):
+        """Get the path of the stored content with the given SHA-256 digest."""
+        return self.root / "objects" / digest[:2] / digest
+
+    def _max_age(self, url):
+        if urlsplit(url).path.endswith("catalog.xml") and self.catalog_ttl is not None:
+            return self.catalog_ttl if self.ttl is None else min(self.ttl, self.catalog_ttl)
+        return self.ttl
+
+    def lookup(self, url, check_age=True):
+        """Find the record for a URL, or `None` if it is not cached or is too old."""
+        try:
+            record = json.loads(self._record_path(url).read_text())
+        except (OSError, ValueError):
+            return None
+
+        max_age = self._max_age(url)
+        if check_age and max_age is not None and time.time() - record["stored"] > max_age:
+            return None
+        if not self.blob_path(record["digest"]).exists():
+            return None
+
+        # Track access for least-recently-used eviction
+        os.utime(self._record_path(url))
+        return record
+
+    def store(self, url, content, headers=None):
+        """Store the content of the response to a URL and return its record."""
+        digest = hashlib.sha256(content).hexdigest()
+        blob = self.blob_path(digest)
+        added = 0
+        if blob.exists():
+            # Keep eviction from treating the content as unreferenced
+            os.utime(blob)
+        else:
+            blob.parent.mkdir(exist_ok=True)
+            self._write_atomic(blob, content)
+            added = len(content)
+
+        record = {
+            "url": url,
+            "digest": digest,
+            "size": len(content),
+            "stored": time.time(),
+            "headers": {
+                k: v for k, v in (headers or {}).items() if k.lower() not in _transfer_headers
+            },
+        }
+        self._write_atomic(self._record_path(url), json.dumps(record).encode("utf-8"))
+
+        # Only go through every record when the cache may have grown past its limit
+        if self.max_bytes is not None:
+            if self._bytes is not None:
+                self._bytes += added
+            if self._bytes is None or self._bytes > self.max_bytes:
+                self.evict()
+        return record
+
+    def _write_atomic(self, path, content):
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp, path)
+
+    def records(self):
+        """Yield the path and contents of every record in the cache."""
+        for path in (self.root / "keys").glob("*.json"):
+            try:
+                yield path, json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+
+    def evict(self):
+        """Remove the least recently used responses until within the size limit.
+
+        Responses older than ``ttl`` are not removed for their age: they are only not served
+        when fresh responses are wanted, and can still be replayed.
+        """
+        now = time.time()
+        live = []
+        for path, record in self.records():
+            try:
+                live.append((path.stat().st_mtime, path, record))
+            except OSError:
+                continue
+
+        # Content is shared between URLs with identical responses, so count it once
+        references = Counter(record["digest"] for _, _, record in live)
+        total = sum({record["digest"]: record["size"] for _, _, record in live}.values())
+        if self.max_bytes is not None:
+            live.sort(key=lambda item: item[0])
+            while live and total > self.max_bytes:
+                _, path, record = live.pop(0)
+                path.unlink(missing_ok=True)
+                references[record["digest"]] -= 1
+                if not references[record["digest"]]:
+                    total -= record["size"]
+
+        # Remove content no longer referenced by any URL, leaving alone any just written by
+        # another process that has not stored its record yet
+        referenced = {record["digest"] for _, _, record in live}
+        for blob in (self.root / "objects").glob("*/*"):
+            if blob.name not in referenced and now - blob.stat().st_mtime > 60:
+                blob.unlink(missing_ok=True)
+                store.remove(blob)
+        self._bytes = total
+
+    def response(self, request, record):
+        """Build a `requests.Response` to ``request`` from a cached record."""
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.reason = "OK"
+        resp.headers = CaseInsensitiveDict(record["headers"])
+        resp.headers["Content-Length"] = str(record["size"])
+        resp.encoding = get_encoding_from_headers(resp.headers)
+        resp.raw = io.BytesIO(self.blob_path(record["digest"]).read_bytes())
+        resp.url = request.url
+        resp.request = request
+        return resp
+
+
+class CachingAdapter(HTTPAdapter):
+    """Transport adapter answering GET requests from a `DiskCache`.
+
+    With ``replay_url`` set, requests missing from the cache are never sent to the original
+    host, but to the stand-in server at that URL instead.
+    """
+
+    def __init__(self, cache, replay_url=None, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+        self.replay_url = replay_url
+
+    def send(self, request, **kwargs):
+        """Send the request, or answer it from the cache."""
+        if request.method != "GET":
+            return super().send(request, **kwargs)
+
+        if self.replay_url is not None:
+            original = request.url
+            scheme, rest = original.split("://", 1)
+            request = request.copy()
+            request.url = f"{self.replay_url}/{scheme}/{rest}"
+            resp = super().send(request, **kwargs)
+            resp.url = original
+            stats["cached_bytes"] += len(resp.content)
+            if resp.status_code == 200:
+                used[original] = hashlib.sha256(resp.content).hexdigest()
+            return resp
+
+        record = self.cache.lookup(request.url)
+        if record is None:
+            resp = super().send(request, **kwargs)
+            if resp.status_code != 200:
+                return resp
+            stats["fetched_bytes"] += len(resp.content)
+            record = self.cache.store(request.url, resp.content, resp.headers)
+        else:
+            stats["cached_bytes"] += record["size"]
+        used[request.url] = record["digest"]
+        return self.cache.response(request, record)
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    def do_GET(self):  # noqa: N802
+        scheme, _, rest = self.path.lstrip("/").partition("/")
+        record = self.server.cache.lookup(f"{scheme}://{rest}", check_age=False)
+        if record is None:
+            self.send_error(404, "Not in cache")
+            return
+
+        content = self.server.cache.blob_path(record["digest"]).read_bytes()
+        self.send_response(200)
+        for name, value in record["headers"].items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Local HTTP server replaying responses recorded in a `DiskCache`.
+
+    The original URL ``https://host/path?query`` is served at ``/https/host/path?query``.
+    Use as a context manager to serve from a background thread.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, cache, host="127.0.0.1", port=0):
+        super().__init__((host, port), _StandInHandler)
+        self.cache = cache
+
+    @property
+    def url(self):
+        """Get the base URL of the server."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+def install(mode=None, cache_dir=None, ttl=None, max_bytes=None):
+    """Route Siphon's HTTP requests through the on-disk cache.
+
+    Arguments not given are taken from the ``BAMS_REMOTE_CACHE*`` environment variables
+    described in the module documentation.
+
+    Returns
+    -------
+    `DiskCache` or None
+        The cache in use, or `None` if caching is turned off
+
+    """
+    global _installed
+
+    mode = mode or os.environ.get("BAMS_REMOTE_CACHE", "on")
+    if mode == "off":
+        return None
+    elif mode not in ("on", "replay"):
+        raise ValueError(f"Unknown remote cache mode {mode!r}.")
+
+    if ttl is None and "BAMS_REMOTE_CACHE_TTL" in os.environ:
+        ttl = float(os.environ["BAMS_REMOTE_CACHE_TTL"])
+    if max_bytes is None and "BAMS_REMOTE_CACHE_SIZE" in os.environ:
+        max_bytes = int(os.environ["BAMS_REMOTE_CACHE_SIZE"])
+    cache = DiskCache(
+        cache_dir or os.environ.get("BAMS_REMOTE_CACHE_DIR", default_cache_dir),
+        ttl=ttl,
+        max_bytes=max_bytes,
+    )
+
+    replay_url = None
+    if mode == "replay":
+        replay_url = os.environ.get("BAMS_REMOTE_REPLAY_URL")
+        if replay_url is None:
+            replay_url = StandInServer(cache).__enter__().url
+
+    adapter = CachingAdapter(cache, replay_url=replay_url)
+    create_session = type(session_manager).create_session
+
+    def create_caching_session():
+        session = create_session(session_manager)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    session_manager.create_session = create_caching_session
+    _installed = cache
+    if max_bytes is not None:
+        cache.evict()
+
+    manifest = os.environ.get("BAMS_REMOTE_MANIFEST")
+    if manifest:
+        atexit.register(_write_manifest, manifest)
+    return cache
+
+
+def _write_manifest(path):
+    Path(path).write_text(json.dumps(used, indent=1, sort_keys=True))
+
+
+def _local_path(resp):
+    """Get a local path holding the content of a response."""
+    resp.raise_for_status()
+
+    if _installed is not None:
+        record = _installed.lookup(resp.url, check_age=False)
+        if record is not None:
+            return _installed.blob_path(record["digest"])
+
+    # Without the cache, keep the content for as long as this process may read it
+    fd, path = tempfile.mkstemp(suffix=".nc")
+    with os.fdopen(fd, "wb") as f:
+        f.write(resp.content)
+    atexit.register(Path(path).unlink, missing_ok=True)
+    return path
+
+
+def _open_local(path):
+    """Open a local copy of a response, parsed by MetPy.
+
+    Copies kept in the cache are opened from their stores, and others parsed as they are.
+    """
+    if _installed is not None and Path(path).is_relative_to(_installed.root):
+        return store.open_dataset(path, engine="netcdf4")
+    return xr.open_dataset(path, engine="netcdf4").metpy.parse_cf()
+
+
+def open_remote_dataset(dataset):
+    """Open a catalog dataset with xarray by downloading the whole file through the cache.
+
+    Parameters
+    ----------
+    dataset : `siphon.catalog.Dataset`
+
+    Returns
+    -------
+    `xarray.Dataset`
+        Parsed by MetPy's ``parse_cf``
+
+    """
+    resp = session_manager.create_session().get(dataset.access_urls["HTTPServer"])
+    return _open_local(_local_path(resp))
+
+
+def open_subset(dataset, variables, time=None, bbox=None):
+    """Open the requested subset of a catalog dataset with the NetCDF Subset Service.
+
+    Only the requested variables, time and area are transferred from the server. Datasets
+    not offered through the NetCDF Subset Service are downloaded whole and subset locally,
+    which saves memory but not transfer.
+
+    Parameters
+    ----------
+    dataset : `siphon.catalog.Dataset`
+    variables : list[str]
+        Names of the variables to request
+    time : `datetime.datetime`, optional
+        Request only the time nearest to this one
+    bbox : (west, east, south, north), optional
+        Request only data within this longitude/latitude box, given in the same order as
+        for `cartopy.mpl.geoaxes.GeoAxes.set_extent`
+
+    Returns
+    -------
+    `xarray.Dataset`
+        Parsed by MetPy's ``parse_cf``
+
+    """
+    if "NetcdfSubset" not in dataset.access_urls:
+        return _subset_locally(open_remote_dataset(dataset), variables, time, bbox)
+
+    ncss = dataset.subset()
+    query = ncss.query().variables(*variables).accept("netcdf4")
+    if time is not None:
+        query.time(time)
+    if bbox is not None:
+        query.lonlat_box(*bbox)
+    return _open_local(_local_path(ncss.get_query(query)))
+
+
+def _subset_locally(data, variables, time, bbox):
+    """Subset a whole downloaded dataset in the way the NetCDF Subset Service would."""
+    # Keep the grid mapping variable, which MetPy needs to find the projection
+    keep = list(variables)
+    grid_mapping = data[variables[0]].attrs.get("grid_mapping")
+    if grid_mapping in data.variables and grid_mapping not in keep:
+        keep.append(grid_mapping)
+    data = data[keep]
+    var = data.metpy.parse_cf(variables[0])
+    if time is not None:
+        data = data.sel({var.metpy.time.name: time}, method="nearest")
+    if bbox is None:
+        return data
+
+    # Find the grid rows and columns covering the box from a sample of points within it
+    west, east, south, north = bbox
+    lon, lat = np.meshgrid(np.linspace(west, east, 50), np.linspace(south, north, 50))
+    points = var.metpy.cartopy_crs.transform_points(
+        ccrs.PlateCarree(), lon.ravel(), lat.ravel()
+    )
+    points = points[np.isfinite(points).all(axis=1)]
+
+    subset = {}
+    for coord, values in zip(var.metpy.coordinates("x", "y"), points[:, :2].T):
+        lower, upper = values.min(), values.max()
+        inside = np.flatnonzero((coord.values >= lower) & (coord.values <= upper))
+        if inside.size:
+            subset[coord.name] = slice(max(inside[0] - 1, 0), inside[-1] + 2)
+    return data.isel(subset)
+
+
+def main():
+    """Inspect or serve the remote data cache from the command line."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--cache-dir", default=os.environ.get("BAMS_REMOTE_CACHE_DIR"))
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list cached URLs")
+    evict = commands.add_parser("evict", help="remove the least recently used responses")
+    evict.add_argument("--max-bytes", type=int)
+    serve = commands.add_parser("serve", help="replay the cache from a local server")
+    serve.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    cache_dir = args.cache_dir or default_cache_dir
+    if args.command == "list":
+        cache = DiskCache(cache_dir)
+        for _, record in sorted(cache.records(), key=lambda item: item[1]["stored"]):
+            stored = time.strftime("%Y-%m-%d %H:%M", time.localtime(record["stored"]))
+            print(f"{stored} {record['size']:>12d} {record['url']}")
+    elif args.command == "evict":
+        DiskCache(cache_dir, max_bytes=args.max_bytes).evict()
+    else:
+        server = StandInServer(DiskCache(cache_dir), port=args.port)
+        print(f"Replaying {cache_dir} at {server.url}; set BAMS_REMOTE_REPLAY_URL to use it.")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""Reprojection of images and grids that reuses the mapping between grids across runs.
+
+Our imagery and model feeds arrive on the same grid every time, and are shown on the same
+maps. Working out where each map pixel falls on the source grid is the expensive part of
+reprojecting them, so the mapping is computed once per pair of grids and stored on local
+disk, keyed by everything it depends on (the coordinate reference systems, the source
+coordinates and the target extent and shape). Reprojecting a new image is then a gather
+from a memory-mapped index array.
+
+The cache lives in ``.cache/reproject`` at the root of the repository unless
+``BAMS_REPROJECT_CACHE_DIR`` says otherwise; it is safe to delete at any time. Each new map
+size or extent adds arrays to it, so it is capped at ``BAMS_REPROJECT_CACHE_SIZE`` bytes
+(1 GiB by default), evicting the least recently used arrays first.
+"""
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from .imagery import axes_pixels
+
+default_cache_dir = Path(__file__).resolve().parents[1] / ".cache" / "reproject"
+default_max_bytes = 2**30
+
+
+def _cache_dir():
+    path = Path(os.environ.get("BAMS_REPROJECT_CACHE_DIR", default_cache_dir))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _key(*parts):
+    """Hash coordinate reference systems, arrays and plain values into a cache key."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if hasattr(part, "to_wkt"):
+            part = part.to_wkt()
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        else:
+            part = np.ascontiguousarray(part, dtype=np.float64).tobytes()
+        # Length-prefix each part so that different splits of the same bytes do not collide
+        digest.update(len(part).to_bytes(8, "little"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def _max_bytes():
+    return int(os.environ.get("BAMS_REPROJECT_CACHE_SIZE", default_max_bytes))
+
+
+def evict(cache_dir=None, max_bytes=None, keep=()):
+    """Remove the least recently used arrays until the cache is within its size limit.
+
+    Arrays in ``keep`` are never removed. Arrays already memory-mapped by a running script
+    stay readable by it after they are removed.
+    """
+    cache_dir = Path(cache_dir or _cache_dir())
+    if max_bytes is None:
+        max_bytes = _max_bytes()
+    arrays = []
+    for path in cache_dir.glob("*.npy"):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        arrays.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in arrays)
+    keep = {Path(path) for path in keep}
+    for _, size, path in sorted(arrays):
+        if total <= max_bytes:
+            break
+        if path not in keep:
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+def _cached(key, compute):
+    """Load the array stored under ``key`` memory-mapped, computing and storing it first."""
+    path = _cache_dir() / f"{key}.npy"
+    try:
+        array = np.load(path, mmap_mode="r")
+        # Track access for least-recently-used eviction
+        os.utime(path)
+        return array
+    except (OSError, ValueError):
+        pass
+
+    # Write atomically, so that scripts running in parallel never see a partial file
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp", suffix=".npy")
+    with os.fdopen(fd, "wb") as f:
+        np.save(f, compute())
+    os.replace(tmp, path)
+    evict(path.parent, keep=[path])
+    return np.load(path, mmap_mode="r")
+
+
+def _nearest_index(coord, values):
+    """Find the index of the nearest point of a 1D coordinate, or -1 outside of it."""
+    coord = np.asarray(coord, dtype=np.float64)
+    descending = coord.size > 1 and coord[0] > coord[-1]
+    if descending:
+        coord = coord[::-1]
+
+    upper = np.clip(np.searchsorted(coord, values), 1, coord.size - 1)
+    lower = upper - 1
+    with np.errstate(invalid="ignore"):
+        index = np.where(values - coord[lower] < coord[upper] - values, lower, upper)
+
+        # Accept points up to half a grid spacing beyond the outermost points
+        half = np.abs(coord[-1] - coord[0]) / max(coord.size - 1, 1) / 2
+        outside = ~((values >= coord[0] - half) & (values <= coord[-1] + half))
+
+    if descending:
+        index = coord.size - 1 - index
+    return np.where(outside, -1, index)
+
+
+def reprojection_index(source_x, source_y, source_crs, target_crs, extent, shape):
+    """Map each pixel of a target grid onto the nearest point of a source grid.
+
+    Parameters
+    ----------
+    source_x, source_y : array-like
+        1D coordinates of the source grid, in ``source_crs``
+    source_crs, target_crs : `cartopy.crs.CRS`
+    extent : tuple
+        ``(x0, x1, y0, y1)`` of the target grid, in ``target_crs``
+    shape : tuple
+        ``(rows, columns)`` of the target grid
+
+    Returns
+    -------
+    `numpy.ndarray`
+        Read-only, memory-mapped integer array of ``shape``, holding the flat index (for
+        C order) of the source point nearest to each target pixel, or -1 where the pixel
+        falls outside of the source grid. Rows run from ``y0`` to ``y1``.
+
+    """
+    source_x = np.asarray(source_x, dtype=np.float64)
+    source_y = np.asarray(source_y, dtype=np.float64)
+    rows, columns = shape
+
+    def compute():
+        # Centers of the target pixels
+        x0, x1, y0, y1 = extent
+        x = x0 + (np.arange(columns) + 0.5) * (x1 - x0) / columns
+        y = y0 + (np.arange(rows) + 0.5) * (y1 - y0) / rows
+        xx, yy = np.meshgrid(x, y)
+
+        points = source_crs.transform_points(target_crs, xx, yy)
+        col = _nearest_index(source_x, points[..., 0])
+        row = _nearest_index(source_y, points[..., 1])
+
+        dtype = np.int32 if source_x.size * source_y.size < 2**31 else np.int64
+        index = (row * source_x.size + col).astype(dtype)
+        index[(row < 0) | (col < 0)] = -1
+        return index
+
+    key = _key(
+        "index", source_crs, target_crs, source_x, source_y, tuple(extent), tuple(shape)
+    )
+    return _cached(key, compute)
+
+
+def project_mesh(x, y, source_crs, target_crs):
+    """Project the points of a grid, reusing the result for grids seen before.
+
+    Parameters
+    ----------
+    x, y : array-like
+        1D coordinates of the grid, in ``source_crs``
+    source_crs, target_crs : `cartopy.crs.CRS`
+
+    Returns
+    -------
+    x, y : `numpy.ndarray`
+        Read-only, memory-mapped 2D coordinates of each grid point in ``target_crs``
+
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    def compute():
+        xx, yy = np.meshgrid(x, y)
+        return np.moveaxis(target_crs.transform_points(source_crs, xx, yy)[..., :2], -1, 0)
+
+    mesh = _cached(_key("mesh", source_crs, target_crs, x, y), compute)
+    return mesh[0], mesh[1]
+
+
+def warp(image, target_crs, extent, shape):
+    """Reproject an image onto a regular grid, by nearest neighbor.
+
+    Parameters
+    ----------
+    image : `xarray.DataArray`
+        Two-dimensional image, parsed with MetPy's ``parse_cf``
+    target_crs : `cartopy.crs.CRS`
+    extent : tuple
+        ``(x0, x1, y0, y1)`` of the target grid, in ``target_crs``
+    shape : tuple
+        ``(rows, columns)`` of the target grid
+
+    Returns
+    -------
+    `numpy.ma.MaskedArray`
+        The reprojected image, with rows running from ``y0`` to ``y1`` and points outside of
+        the image (or missing in it) masked
+
+    """
+    x, y = image.metpy.coordinates("x", "y")
+    index = reprojection_index(
+        x.values, y.values, image.metpy.cartopy_crs, target_crs, extent, shape
+    )
+
+    values = image.transpose(y.dims[0], x.dims[0]).values.ravel()
+    warped = np.take(values, np.where(index < 0, 0, index))
+    mask = index < 0
+    if np.issubdtype(warped.dtype, np.floating):
+        mask |= np.isnan(warped)
+    return np.ma.array(warped, mask=mask)
+
+
+def warp_to_axes(image, ax, dpi=None, regrid_shape=None):
+    """Reproject an image onto the pixels of a map's axes, ready for ``ax.imshow``.
+
+    Parameters
+    ----------
+    image : `xarray.DataArray`
+        Two-dimensional image, parsed with MetPy's ``parse_cf``
+    ax : `cartopy.mpl.geoaxes.GeoAxes`
+        Map axes the image will be shown on, with its extent already set
+    dpi : float, optional
+        Resolution the figure will be saved at. Defaults to the figure's resolution.
+    regrid_shape : int, optional
+        Number of pixels along the shorter side of the map, as for cartopy's ``imshow``.
+        Defaults to the size of the axes when saved.
+
+    Returns
+    -------
+    image : `numpy.ma.MaskedArray`
+        The reprojected image
+    extent : tuple
+        Extent of the image in the map's projection, to pass to ``imshow`` along with
+        ``origin="lower"``
+
+    """
+    extent = ax.get_extent()
+    width, height = axes_pixels(ax, dpi)
+    if regrid_shape is not None:
+        scale = regrid_shape / min(width, height)
+        width, height = max(int(width * scale), 1), max(int(height * scale), 1)
+    return warp(image, ax.projection, extent, (height, width)), extent
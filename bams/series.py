@@ -0,0 +1,179 @@
+"""Cross sections through long time series of gridded data, streamed to disk.
+
+Fig3 slices one NARR time in memory. For climatologies the same path is needed through
+thousands of times, more than fit in memory at once. `cross_section_series` runs fig3's
+workflow (the cross section, the pressure of the terrain below it and any derived fields)
+on blocks of times over a pool of worker processes, and writes each block to disk as soon
+as it is done:
+
+* each worker opens the dataset lazily, once, and reads only the part of the grid the path
+  runs through (see `bams.cross.CrossSectionPlan.footprint`) for the times of its block
+* at most twice as many blocks as workers are in memory at any time, so memory is bounded
+  by the size of a block rather than by the length of the series
+* blocks are written to a directory of NetCDF files, one per block, or appended to a Zarr
+  store if the path ends in ``.zarr`` (which requires ``zarr``); a directory of NetCDF
+  files left by an interrupted run is resumed, skipping the blocks already written
+
+`open_series` opens the result as a single dataset. Datasets opened with Dask chunks can
+also be passed to `bams.cross.cross_section` and `bams.cross.terrain_pressure` directly,
+which keep them lazy.
+"""
+
+import collections
+import multiprocessing
+import os
+import tempfile
+from pathlib import Path
+
+import xarray as xr
+
+from .cross import cross_section, plan_cross_section, terrain_pressure
+from .pool import default_preload
+
+# State of each worker: the opened dataset and the parameters of the cross section
+_worker = {}
+
+
+def _init_worker(open_data, start, end, steps, terrain, height, fields):
+    data = open_data()
+    plan = plan_cross_section(data, start, end, steps)
+    _worker.update(
+        data=data.isel(plan.footprint()),
+        start=start,
+        end=end,
+        steps=steps,
+        terrain=terrain,
+        height=height,
+        fields=fields,
+    )
+
+
+def _cross_section_block(dim, times):
+    """Compute the cross section of a block of times in a worker."""
+    block = _worker["data"].isel({dim: times}).load()
+    cross = cross_section(block, _worker["start"], _worker["end"], _worker["steps"])
+    if _worker["terrain"] is not None:
+        cross["topo_pressure"] = terrain_pressure(cross[_worker["height"]], _worker["terrain"])
+    if _worker["fields"] is not None:
+        cross = _worker["fields"].assign(cross)
+
+    # The CRS object cannot be written to disk; it is recreated by `parse_cf`
+    return cross.drop_vars("metpy_crs", errors="ignore").load()
+
+
+def _write_netcdf(path, cross):
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp", suffix=".nc")
+    os.close(fd)
+    cross.to_netcdf(tmp)
+    os.replace(tmp, path)
+
+
+def cross_section_series(
+    open_data,
+    start,
+    end,
+    path,
+    steps=100,
+    terrain=None,
+    height="Geopotential_height",
+    fields=None,
+    dim="time",
+    times_per_block=24,
+    processes=None,
+):
+    """Compute the cross section along a path through every time of a dataset.
+
+    Parameters
+    ----------
+    open_data : callable
+        Picklable function, taking no arguments, returning the dataset parsed with MetPy's
+        ``parse_cf`` but not loaded into memory (as ``xr.open_dataset`` opens files). It is
+        called once in each worker.
+    start, end : (2, ) array-like
+        Latitude-longitude pairs of the ends of the path
+    path : str or `pathlib.Path`
+        Directory to write a NetCDF file for each block of times to, or Zarr store
+    steps : int, optional
+        Number of points along the path
+    terrain : `xarray.DataArray`, optional
+        Terrain height, parsed with ``parse_cf``. If given, the pressure of the terrain
+        below the path is computed for every time, as ``topo_pressure``.
+    height : str, optional
+        Variable holding the geopotential height the terrain pressure is found from
+    fields : `bams.derived.DerivedFields`, optional
+        Fields to derive from the cross section, such as potential temperature
+    dim : str, optional
+        Dimension of the dataset to split into blocks
+    times_per_block : int, optional
+        Number of times computed (and held in memory) at once by each worker
+    processes : int, optional
+        Number of workers. Defaults to the number of CPUs.
+
+    Returns
+    -------
+    `pathlib.Path`
+        ``path``, to pass to `open_series`
+
+    """
+    path = Path(path)
+    zarr = path.suffix == ".zarr"
+    if not zarr:
+        path.mkdir(parents=True, exist_ok=True)
+
+    size = open_data().sizes[dim]
+    blocks = [
+        slice(first, min(first + times_per_block, size))
+        for first in range(0, size, times_per_block)
+    ]
+    if not zarr:
+        blocks = [block for block in blocks if not (path / f"{block.start:08d}.nc").exists()]
+
+    def write(block, cross):
+        if not zarr:
+            _write_netcdf(path / f"{block.start:08d}.nc", cross)
+        elif block.start == 0:
+            cross.to_zarr(path, mode="w")
+        else:
+            cross.to_zarr(path, append_dim=dim)
+
+    if terrain is not None:
+        # The terrain along the path is the same for every time
+        terrain = cross_section(terrain, start, end, steps).load()
+
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(default_preload)
+    processes = processes or os.cpu_count()
+    with context.Pool(
+        processes,
+        initializer=_init_worker,
+        initargs=(open_data, start, end, steps, terrain, height, fields),
+    ) as pool:
+        # Write blocks in order as they finish, keeping a bounded number in flight
+        pending = collections.deque()
+        for block in blocks:
+            pending.append((block, pool.apply_async(_cross_section_block, (dim, block))))
+            while len(pending) >= 2 * processes:
+                done, result = pending.popleft()
+                write(done, result.get())
+        while pending:
+            done, result = pending.popleft()
+            write(done, result.get())
+    return path
+
+
+def open_series(path, dim="time"):
+    """Open the cross sections written by `cross_section_series` as one dataset.
+
+    A Zarr store, or a directory of NetCDF files when Dask is installed, is opened lazily;
+    otherwise the NetCDF files are read into memory.
+    """
+    path = Path(path)
+    if path.suffix == ".zarr":
+        return xr.open_zarr(path).metpy.parse_cf()
+
+    files = sorted(path.glob("*.nc"))
+    try:
+        data = xr.open_mfdataset(files, combine="nested", concat_dim=dim)
+    except (ImportError, ValueError):
+        data = xr.concat([xr.load_dataset(file) for file in files], dim)
+    return data.metpy.parse_cf()
@@ -0,0 +1,321 @@
+"""A local render service, keeping the figures' libraries, data and caches warm.
+
+The figure scripts are one-shot: each imports the plotting stack, opens its data, renders
+and exits, so most of the time taken by a figure is spent getting ready to draw it. For
+products rendered on demand, ``python -m bams.service`` runs a server on localhost (or on a
+Unix socket) that renders them in response to requests such as::
+
+    GET /fig3?start=37,-105&end=35.5,-65
+    GET /fig5?level=500&dpi=150&format=svg
+
+and answers with the image. Renders run concurrently in a pool of worker processes forked,
+as in `bams.pool`, from a process that has already imported the plotting libraries. Each
+worker opens every dataset once, when it starts, and keeps it in memory, along with the
+caches filled by drawing (the projected map layers of `bams.basemap` and the cross section
+plans of `bams.cross`), so a request pays only for its own render. ``GET /stats`` returns
+how long requests for each product took.
+
+Products are registered in `products`, as functions taking the request's parameters as
+strings and returning a figure, and datasets in `datasets`, as functions opening them.
+"""
+
+import argparse
+import io
+import json
+import mimetypes
+import multiprocessing
+import os
+import socketserver
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qsl, urlsplit
+
+from metpy.cbook import get_test_data
+from metpy.units import units
+
+from . import figures, output, store
+from .pool import default_preload
+from .sweep import render_frame
+
+default_port = 8765
+
+# Fig3's path, used when a request gives none
+default_start = (37.0, -105.0)
+default_end = (35.5, -65.0)
+
+# State of each worker: the opened datasets, by name
+_worker = {}
+
+
+def _open_narr():
+    return store.open_dataset(get_test_data("narr_example.nc", False)).squeeze().load()
+
+
+def _open_terrain():
+    topo = store.open_dataset(Path(__file__).resolve().parents[1] / "hgt.sfc.nc", "hgt")
+    return topo.squeeze().load()
+
+
+def _open_gfs():
+    return store.open_dataset(get_test_data("GFS_test.nc", False)).load()
+
+
+# Functions opening each dataset the products use
+datasets = {"narr": _open_narr, "terrain": _open_terrain, "gfs": _open_gfs}
+
+
+def _point(value):
+    """Parse a ``lat,lon`` pair."""
+    lat, lon = (float(part) for part in value.split(","))
+    return lat, lon
+
+
+def fig3(start=None, end=None, steps="100"):
+    """Fig3's cross section of the NARR analysis, along any path."""
+    start = default_start if start is None else _point(start)
+    end = default_end if end is None else _point(end)
+    data = _worker["narr"]
+    cross = figures.fig3_cross_section(data, _worker["terrain"], start, end, int(steps))
+    return figures.fig3(data, cross, start, end)
+
+
+def fig5(level="300", time=None):
+    """Fig5's declarative product of the GFS forecast, at any level and time."""
+    data = _worker["gfs"]
+    if "fig5" not in _worker:
+        _worker["fig5"] = (figures.fig5(), figures.fig5_data(data))
+    template, ds = _worker["fig5"]
+
+    level = float(level) * units.hPa
+    if time is None:
+        time = data["time"].values.ravel()[0].astype("datetime64[s]").item()
+    else:
+        time = datetime.fromisoformat(time)
+    pc = render_frame(template, ds, level, time, title=figures.fig5_title)
+    pc.draw()
+    return pc.figure
+
+
+# Functions drawing each product from the parameters of a request
+products = {"fig3": fig3, "fig5": fig5}
+
+
+def _init_worker(names):
+    for name in names:
+        _worker[name] = datasets[name]()
+
+
+def render(product, params):
+    """Render a product, in the current process, to an image.
+
+    Parameters
+    ----------
+    product : str
+        Name of the product, in `products`
+    params : dict
+        Parameters of the request, as strings. ``dpi`` (default 100) and ``format``
+        (default ``png``) are used to save the figure; the others are passed to the product.
+
+    Returns
+    -------
+    bytes
+        The image
+
+    """
+    params = dict(params)
+    dpi = float(params.pop("dpi", 100))
+    fmt = params.pop("format", "png")
+    for name in datasets:
+        if name not in _worker:
+            _worker[name] = datasets[name]()
+
+    fig = products[product](**params)
+    buffer = io.BytesIO()
+    try:
+        # Requests differing only in resolution or format share the figure's tight box
+        key = (product, tuple(sorted(params.items())))
+        output.save(fig, [output.Output(buffer, dpi, fmt)], key=key)
+    finally:
+        # Products are drawn on pyplot figures, which must be closed
+        import matplotlib.pyplot as plt
+
+        plt.close(fig)
+    return buffer.getvalue()
+
+
+class RenderService:
+    """Render products in a pool of warm workers, recording how long each request takes.
+
+    Parameters
+    ----------
+    processes : int, optional
+        Number of products rendered at once. Defaults to the number of CPUs.
+    preload : list of str, optional
+        Modules imported once, before the workers are forked
+
+    """
+
+    def __init__(self, processes=None, preload=None):
+        os.environ.setdefault("MPLBACKEND", "agg")
+        self.processes = processes or os.cpu_count()
+        self._context = multiprocessing.get_context("forkserver")
+        preload = [*default_preload, __name__] if preload is None else preload
+        self._context.set_forkserver_preload(preload)
+        self._lock = threading.Lock()
+        self._executor = None
+        self.latencies = {}
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    self.processes,
+                    mp_context=self._context,
+                    initializer=_init_worker,
+                    initargs=(list(datasets),),
+                )
+            return self._executor
+
+    def render(self, product, params):
+        """Render a product in a worker, as `render` does."""
+        if product not in products:
+            raise KeyError(product)
+        start = time.perf_counter()
+        pool = self._pool()
+        try:
+            image = pool.submit(render, product, params).result()
+        except BrokenProcessPool:
+            # A worker died (e.g. killed, or out of memory); start a new pool for the next
+            with self._lock:
+                if self._executor is pool:
+                    self._executor = None
+            pool.shutdown(wait=False)
+            raise
+        with self._lock:
+            self.latencies.setdefault(product, []).append(time.perf_counter() - start)
+        return image
+
+    def warm(self):
+        """Start every worker, each opening the datasets, rather than on the first requests."""
+        pool = self._pool()
+        for future in [pool.submit(_init_worker, []) for _ in range(self.processes)]:
+            future.result()
+
+    def stats(self):
+        """Summarize the time taken by the requests for each product, in seconds."""
+        with self._lock:
+            latencies = {name: sorted(times) for name, times in self.latencies.items()}
+        return {
+            name: {
+                "requests": len(times),
+                "median": times[len(times) // 2],
+                "max": times[-1],
+            }
+            for name, times in latencies.items()
+        }
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Answer ``GET /<product>?<params>`` with an image, and ``GET /stats`` with JSON."""
+
+    def address_string(self):
+        # Clients of a Unix socket have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send(status, f"{message}\n".encode(), "text/plain; charset=utf-8")
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        product = url.path.strip("/")
+        if product == "stats":
+            body = json.dumps(self.server.service.stats(), indent=2).encode()
+            self._send(HTTPStatus.OK, body, "application/json")
+            return
+
+        if product not in products:
+            self._error(HTTPStatus.NOT_FOUND, f"Unknown product {product!r}.")
+            return
+
+        params = dict(parse_qsl(url.query))
+        start = time.perf_counter()
+        try:
+            image = self.server.service.render(product, params)
+        except (TypeError, ValueError) as e:
+            self._error(HTTPStatus.BAD_REQUEST, f"{type(e).__name__}: {e}")
+        except Exception as e:
+            self._error(HTTPStatus.INTERNAL_SERVER_ERROR, f"{type(e).__name__}: {e}")
+        else:
+            content_type = mimetypes.guess_type(f"image.{params.get('format', 'png')}")[0]
+            seconds = f"{time.perf_counter() - start:.3f}"
+            self._send(
+                HTTPStatus.OK,
+                image,
+                content_type or "application/octet-stream",
+                {"X-Render-Seconds": seconds},
+            )
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service, port=default_port, socket_path=None):
+    """Make an HTTP server for a `RenderService`, on a localhost port or a Unix socket."""
+    if socket_path is not None:
+        Path(socket_path).unlink(missing_ok=True)
+        server = _UnixHTTPServer(str(socket_path), _Handler)
+    else:
+        server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+    server.service = service
+    return server
+
+
+def main():
+    """Serve the figures' products on demand from warm workers."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--port", type=int, default=default_port, help="localhost port")
+    parser.add_argument("--socket", help="Unix socket to listen on, instead of a port")
+    parser.add_argument("--processes", type=int, help="renders at once (default: CPUs)")
+    args = parser.parse_args()
+
+    with RenderService(args.processes) as service:
+        service.warm()
+        with make_server(service, args.port, args.socket) as server:
+            where = args.socket or f"http://127.0.0.1:{args.port}"
+            print(f"Serving {', '.join(products)} on {where}", flush=True)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Skew-T diagrams whose background is rendered once and reused for every sounding.
+
+Drawing the background of fig1's Skew-T (the dry and moist adiabats, the mixing lines, the
+ticks and labels) takes most of the time it takes to render one. `SkewTTemplate` renders the
+background once, keeps it as a raster, and renders each sounding by restoring that raster
+and drawing only the sounding's own artists (traces, barbs, shading, text) on top of it,
+before removing them again for the next one. The only difference from rendering the whole
+figure is that shading is drawn over the background lines rather than below them.
+
+The inset hodograph, which is cheap to draw, is drawn in full on top of each sounding so that
+it covers the sounding as it does in fig1.
+"""
+
+import matplotlib.image as mimage
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.transforms import Bbox
+from mpl_toolkits.axes_grid1.inset_locator import inset_axes
+
+from metpy.plots import Hodograph, SkewT
+
+from . import adiabats
+
+
+class SkewTTemplate:
+    """A Skew-T with an inset hodograph, laid out as fig1, for rendering many soundings.
+
+    Parameters
+    ----------
+    figsize : tuple, optional
+        Size of the figure in inches
+    dpi : float, optional
+        Resolution of the rendered images
+    rotation : float, optional
+        Rotation of the isotherms, as for `metpy.plots.SkewT`
+    xlim, ylim : tuple, optional
+        Temperature (in °C) and pressure (in hPa) limits of the diagram
+    xlabel, ylabel : str, optional
+        Axis labels
+    hodograph : bool, optional
+        Whether to add an inset hodograph in the upper right corner
+    component_range : float, optional
+        Range of the hodograph, as for `metpy.plots.Hodograph`
+    increment : float, optional
+        Increment between the hodograph's grid circles
+
+    Attributes
+    ----------
+    fig : `matplotlib.figure.Figure`
+    skew : `metpy.plots.SkewT`
+    hodo : `metpy.plots.Hodograph` or None
+
+    """
+
+    def __init__(
+        self,
+        figsize=(12, 12),
+        dpi=100,
+        rotation=45,
+        xlim=(-40, 60),
+        ylim=(1000, 100),
+        xlabel=r"Temperature ($\mathrm{°C}$)",
+        ylabel="Pressure (hPa)",
+        hodograph=True,
+        component_range=80.0,
+        increment=20,
+    ):
+        self.fig = plt.figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.skew = SkewT(self.fig, rotation=rotation)
+        self.skew.ax.set_ylim(*ylim)
+        self.skew.ax.set_xlim(*xlim)
+
+        # The 0 isotherm, as in fig1
+        self.skew.ax.axvline(0, color="c", linestyle="--", linewidth=2)
+        self.skew.plot_dry_adiabats()
+        adiabats.plot_moist_adiabats(self.skew)
+        self.skew.plot_mixing_lines()
+        self.skew.ax.set_ylabel(ylabel)
+        self.skew.ax.set_xlabel(xlabel)
+
+        self.hodo = None
+        if hodograph:
+            ax_hodo = inset_axes(self.skew.ax, "40%", "40%", loc=1)
+            self.hodo = Hodograph(ax_hodo, component_range=component_range)
+            self.hodo.add_grid(increment=increment)
+            ax_hodo.set_yticks(range(-50, 51, 50))
+
+        # Render the background without the hodograph, which is drawn over each sounding
+        if self.hodo is not None:
+            self.hodo.ax.set_visible(False)
+        self.canvas.draw()
+        self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+        if self.hodo is not None:
+            self.hodo.ax.set_visible(True)
+        self.canvas.draw()
+
+        # Extent of the background, to which each render adds that of its sounding's artists
+        tight = self.fig.get_tightbbox(self.canvas.get_renderer())
+        self._tight = tight.transformed(self.fig.dpi_scale_trans)
+
+    def _axes(self):
+        return [self.skew.ax] + ([self.hodo.ax] if self.hodo is not None else [])
+
+    def render(self, draw, path=None):
+        """Render one sounding onto the background.
+
+        Parameters
+        ----------
+        draw : callable
+            Called with the template's `~metpy.plots.SkewT` and `~metpy.plots.Hodograph`
+            (or None), to plot the sounding with their usual methods, or on the figure.
+            It must not change the limits of either.
+        path : str or path-like, optional
+            PNG file to save the rendered sounding to
+
+        Returns
+        -------
+        `numpy.ndarray`
+            The rendered image, as RGBA
+
+        """
+        axes = self._axes()
+        containers = [self.fig] + axes
+        before = [set(container.get_children()) for container in containers]
+        limits = [(ax.get_xlim(), ax.get_ylim()) for ax in axes]
+
+        try:
+            draw(self.skew, self.hodo)
+            if [(ax.get_xlim(), ax.get_ylim()) for ax in axes] != limits:
+                raise ValueError("Rendering a sounding must not change the axes limits.")
+
+            added = [
+                [artist for artist in container.get_children() if artist not in seen]
+                for container, seen in zip(containers, before)
+            ]
+            fig_artists, skew_artists = added[0], added[1]
+            image = self._draw(skew_artists, fig_artists)
+        finally:
+            # Leave the template as it was, even if drawing failed part way
+            for container, seen in zip(containers, before):
+                for artist in container.get_children():
+                    if artist not in seen:
+                        artist.remove()
+
+        if path is not None:
+            mimage.imsave(path, image, dpi=self.fig.dpi)
+        return image
+
+    def _draw(self, skew_artists, fig_artists):
+        """Draw the new artists over the background, and crop the result."""
+        renderer = self.canvas.get_renderer()
+        self.canvas.restore_region(self._background)
+
+        # The sounding goes over the background lines, but stays below the spines
+        for artist in sorted(skew_artists, key=lambda a: a.get_zorder()):
+            artist.draw(renderer)
+        if skew_artists:
+            for spine in self.skew.ax.spines.values():
+                spine.draw(renderer)
+
+        if self.hodo is not None:
+            self.hodo.ax.draw(renderer)
+        for artist in sorted(fig_artists, key=lambda a: a.get_zorder()):
+            artist.draw(renderer)
+
+        # Flip the crop box, from the bottom left of the figure to the top left of the image
+        height = int(self.fig.bbox.height)
+        x0, y0, x1, y1 = (
+            int(round(v)) for v in self._crop(skew_artists + fig_artists).extents
+        )
+        return np.asarray(self.canvas.buffer_rgba())[height - y1 : height - y0, x0:x1].copy()
+
+    def _crop(self, artists):
+        """Find the box to crop the figure to, with the sounding's artists drawn on it.
+
+        This crops as savefig does with ``bbox_inches="tight"``, padding by 0.1 inch, but not
+        beyond the figure: the skewed x axis reaches far to its left, which savefig would pad
+        with blank space.
+        """
+        renderer = self.canvas.get_renderer()
+        boxes = [self._tight]
+        for artist in artists:
+            if not artist.get_visible():
+                continue
+            # Unlike their window extent, the tight box of barbs includes the barbs themselves
+            bbox = artist.get_tightbbox(renderer)
+            if bbox is not None and np.isfinite(bbox.extents).all():
+                boxes.append(bbox)
+        tight = Bbox.union(boxes).padded(0.1 * self.fig.dpi)
+        return Bbox.intersection(tight, self.fig.bbox)
@@ -0,0 +1,409 @@
+"""Analysis of many soundings at once.
+
+`parcel_profiles` and `analyze_soundings` compute the same surface-based parcel profile,
+LCL, LFC, EL, CAPE, CIN and lifted index as the corresponding functions in `metpy.calc`, but
+for a whole stack of soundings in one pass: every step is done for all soundings at once,
+and the indices are all derived from a single parcel profile per sounding.
+
+Soundings can be given either as a list of 1D arrays of different lengths, or as 2D arrays
+(soundings by levels) padded with NaN or masked where levels are missing. Levels where the
+pressure, temperature or dewpoint is missing are skipped, as MetPy does. As in MetPy, every
+sounding must start at the surface, with pressure decreasing upwards.
+
+Parcels follow the pseudoadiabats of `bams.adiabats` above their LCL, looked up in its table
+rather than integrated.
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+import scipy.optimize as so
+
+from metpy.constants import Rd, epsilon, kappa
+from metpy.units import units
+
+from .adiabats import _mixing_ratio, _saturation_vapor_pressure, moist_adiabat_table
+
+# Unit-free constants, in SI units
+_Rd = Rd.m_as("J / kg / K")
+_epsilon = epsilon.m_as("")
+_kappa = kappa.m_as("")
+
+_columns = {
+    "lcl_pressure": "hPa",
+    "lcl_temperature": "degC",
+    "lfc_pressure": "hPa",
+    "lfc_temperature": "degC",
+    "el_pressure": "hPa",
+    "el_temperature": "degC",
+    "cape": "J/kg",
+    "cin": "J/kg",
+    "lifted_index": "delta_degC",
+}
+
+
+def _dewpoint(vapor_pressure):
+    """Inverse of Bolton (1980), as in `metpy.calc.dewpoint`; hPa to K."""
+    val = np.log(vapor_pressure / 6.112)
+    return 243.5 * val / (17.67 - val) + 273.15
+
+
+def _lcl(pressure, temperature, dewpoint, max_iters=50, eps=1e-5):
+    """Find the LCL by the same fixed-point iteration as `metpy.calc.lcl`."""
+    w = _mixing_ratio(_saturation_vapor_pressure(dewpoint), pressure)
+    nan_mask = np.zeros(pressure.shape, dtype=bool)
+
+    def _lcl_iter(p, p0, w, t):
+        nonlocal nan_mask
+        td = _dewpoint(p * w / (_epsilon + w))
+        p_new = p0 * (td / t) ** (1.0 / _kappa)
+        nan_mask = nan_mask | np.isnan(p_new)
+        return np.where(np.isnan(p_new), p, p_new)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        lcl_p = so.fixed_point(
+            _lcl_iter, pressure, args=(pressure, w, temperature), xtol=eps, maxiter=max_iters
+        )
+    lcl_p = np.where(nan_mask, np.nan, lcl_p)
+    lcl_p = np.where(np.isclose(lcl_p, pressure), pressure, lcl_p)
+    return lcl_p, _dewpoint(lcl_p * w / (_epsilon + w))
+
+
+def _as_levels(values, unit):
+    """Convert a stack of (possibly ragged or masked) soundings to a padded 2D array."""
+    if isinstance(values, (list, tuple)):
+        # Convert all soundings at once when they share units, then spread them out over the
+        # padded rows
+        row_units = {getattr(row, "units", None) for row in values}
+        if len(row_units) == 1:
+            rows = [np.ravel(getattr(row, "magnitude", row)) for row in values]
+            flat = np.concatenate(rows)
+            if row_units != {None}:
+                flat = units.Quantity(flat, row_units.pop())
+        else:
+            rows = [np.ravel(_as_levels(row, unit)) for row in values]
+            flat = np.concatenate(rows)
+        sizes = np.array([row.size for row in rows])
+        flat = _as_levels(flat, unit)
+        padded = np.full((sizes.size, sizes.max(initial=0)), np.nan)
+        padded[np.arange(padded.shape[-1]) < sizes[:, np.newaxis]] = flat
+        return padded
+
+    values = units.Quantity(values).m_as(unit) if hasattr(values, "units") else values
+    return np.ma.filled(np.ma.asarray(values, dtype=np.float64), np.nan)
+
+
+def _prepare(pressure, temperature, dewpoint):
+    """Pack the valid levels of every sounding to the front, and note where they came from."""
+    p = np.atleast_2d(_as_levels(pressure, "hPa"))
+    t = np.atleast_2d(_as_levels(temperature, "K"))
+    td = np.atleast_2d(_as_levels(dewpoint, "K"))
+    valid = np.isfinite(p) & np.isfinite(t) & np.isfinite(td)
+
+    order = np.argsort(~valid, axis=-1, kind="stable")
+    count = valid.sum(axis=-1)
+    packed = np.arange(p.shape[-1]) < count[:, np.newaxis]
+
+    def pack(values):
+        return np.where(packed, np.take_along_axis(values, order, axis=-1), np.nan)
+
+    return pack(p), pack(t), pack(td), order, packed
+
+
+def _parcel(p, t, td, packed):
+    """Lift a surface parcel through packed soundings, returning it and the LCL."""
+    n = p.shape[0]
+    lcl_p = np.full(n, np.nan)
+    lcl_t = np.full(n, np.nan)
+    ok = packed[:, 0]
+    lcl_p[ok], lcl_t[ok] = _lcl(p[ok, 0], t[ok, 0], td[ok, 0])
+
+    # Dry adiabat up to the LCL
+    with np.errstate(invalid="ignore"):
+        profile = t[:, :1] * (p / p[:, :1]) ** _kappa
+        moist = packed & (p < lcl_p[:, np.newaxis])
+
+    # Pseudoadiabat above the LCL, looked up from the one through the dry adiabat's
+    # temperature at the LCL
+    table = moist_adiabat_table()
+    with np.errstate(invalid="ignore"):
+        theta_w = table.wet_bulb_potential_temperature(
+            lcl_p, t[:, 0] * (lcl_p / p[:, 0]) ** _kappa
+        )
+    profile = np.where(moist, table.temperature_at(p, theta_w[:, np.newaxis]), profile)
+
+    return np.where(packed, profile, np.nan), lcl_p, lcl_t
+
+
+def _crossings(p, difference, profile, start):
+    """Find where ``difference`` changes sign between levels, as `find_intersections` does.
+
+    Returns masks of the segments (between consecutive levels) with a crossing, where the
+    sign of ``difference`` above it, and the pressure and parcel temperature at it,
+    interpolated linearly in ln(p). Segments starting below level ``start`` are ignored.
+    """
+    x = np.log(p)
+    x0, x1 = x[:, :-1], x[:, 1:]
+    d0, d1 = difference[:, :-1], difference[:, 1:]
+    a0, a1 = profile[:, :-1], profile[:, 1:]
+
+    segment = np.arange(x0.shape[-1]) >= np.reshape(start, (-1, 1))
+    with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+        crossing = segment & np.isfinite(d0) & np.isfinite(d1) & (np.sign(d0) != np.sign(d1))
+        cross_x = (d1 * x0 - d0 * x1) / (d1 - d0)
+        cross_t = ((cross_x - x0) / (x1 - x0)) * (a1 - a0) + a0
+        cross_p = np.exp(cross_x)
+    return crossing, np.sign(d1), cross_p, cross_t
+
+
+def _pick(mask, values, which):
+    """Pick the values at the first (``'bottom'``) or last (``'top'``) true element of rows."""
+    found = mask.any(axis=-1)
+    if which == "bottom":
+        index = np.argmax(mask, axis=-1)
+    elif which == "top":
+        index = mask.shape[-1] - 1 - np.argmax(mask[:, ::-1], axis=-1)
+    else:
+        raise ValueError(f"Unsupported option {which!r} for which LFC or EL to use.")
+    picked = [np.take_along_axis(v, index[:, np.newaxis], axis=-1)[:, 0] for v in values]
+    return found, [np.where(found, v, np.nan) for v in picked]
+
+
+def _less_or_close(a, b):
+    return (a < b) | np.isclose(a, b)
+
+
+def _greater_or_close(a, b):
+    return (a > b) | np.isclose(a, b)
+
+
+def _last_level(values, count):
+    return np.take_along_axis(values, np.maximum(count - 1, 0)[:, np.newaxis], axis=-1)[:, 0]
+
+
+def _lfc(p, t, profile, lcl_p, lcl_t, which):
+    """Find the LFC of packed soundings, following `metpy.calc.lfc`."""
+    difference = profile - t
+
+    # Skip the surface if the parcel starts at the environmental temperature
+    start = np.where(np.isclose(profile[:, 0], t[:, 0]), 1, 0)
+    crossing, sign, cross_p, cross_t = _crossings(p, difference, profile, start)
+    increasing = crossing & (sign > 0)
+    above_lcl = increasing & (cross_p < lcl_p[:, np.newaxis])
+    found, (lfc_p, lfc_t) = _pick(above_lcl, (cross_p, cross_t), which)
+
+    # Without any crossing, the LFC is at the LCL if the parcel is warmer anywhere above it
+    above = np.isfinite(p) & (p < lcl_p[:, np.newaxis])
+    positive = (above & ~_less_or_close(profile, t)).any(axis=-1)
+    at_lcl = ~increasing.any(axis=-1) & positive
+
+    # With crossings only below the LCL, it is at the LCL unless the parcel turns cooler
+    # again below the LCL (MetPy fails when it never does; the LFC is then at the LCL)
+    el_crossing, el_sign, el_p, _ = _crossings(p, difference, profile, 1)
+    el_candidates = el_crossing & (el_sign < 0)
+    lowest_el = np.min(np.where(el_candidates, el_p, np.inf), axis=-1)
+    lowest_el = np.where(el_candidates.any(axis=-1), lowest_el, -np.inf)
+    at_lcl |= increasing.any(axis=-1) & ~found & ~(lowest_el > lcl_p)
+
+    lfc_p = np.where(at_lcl, lcl_p, lfc_p)
+    lfc_t = np.where(at_lcl, lcl_t, lfc_t)
+    return lfc_p, lfc_t
+
+
+def _el(p, t, profile, lcl_p, count, which):
+    """Find the EL of packed soundings, following `metpy.calc.el`."""
+    crossing, sign, cross_p, cross_t = _crossings(p, profile - t, profile, 1)
+    decreasing = crossing & (sign < 0)
+    _, (highest_p,) = _pick(decreasing, (cross_p,), "top")
+    above_lcl = decreasing & (cross_p < lcl_p[:, np.newaxis])
+    found, (el_p, el_t) = _pick(above_lcl, (cross_p, cross_t), which)
+
+    # No EL if the parcel is still warmer than the environment at the top of the sounding,
+    # or if the highest crossing is below the LCL
+    exists = found & (highest_p < lcl_p)
+    exists &= ~(_last_level(profile, count) > _last_level(t, count))
+    return np.where(exists, el_p, np.nan), np.where(exists, el_t, np.nan)
+
+
+def _cape_cin(p, t, profile, lfc_p, el_p, count):
+    """Integrate the positive and negative areas, following `metpy.calc.cape_cin`."""
+    difference = profile - t
+    el_p = np.where(np.isnan(el_p), _last_level(p, count), el_p)
+    crossing, _, cross_p, _ = _crossings(p, difference, profile, 1)
+
+    # The area between consecutive points (levels and crossings), over which the difference
+    # varies linearly in ln(p), is exactly the trapezoid MetPy integrates over
+    p0, p1 = p[:, :-1], p[:, 1:]
+    d0, d1 = difference[:, :-1], difference[:, 1:]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        whole = 0.5 * (d0 + d1) * np.log(p0 / p1)
+        lower = 0.5 * d0 * np.log(p0 / cross_p)
+        upper = 0.5 * d1 * np.log(cross_p / p1)
+
+    def integrate(inside):
+        in0, in1, in_cross = inside(p0), inside(p1), inside(cross_p)
+        area = np.where(~crossing & in0 & in1, whole, 0)
+        area += np.where(crossing & in0 & in_cross, lower, 0)
+        area += np.where(crossing & in_cross & in1, upper, 0)
+        return _Rd * np.nansum(area, axis=-1)
+
+    with np.errstate(invalid="ignore"):
+        lfc = lfc_p[:, np.newaxis]
+        el = el_p[:, np.newaxis]
+        cape = integrate(lambda x: _less_or_close(x, lfc) & _greater_or_close(x, el))
+        cin = np.minimum(integrate(lambda x: _greater_or_close(x, lfc)), 0)
+
+    # Without an LFC there is neither
+    no_lfc = np.isnan(lfc_p)
+    return np.where(no_lfc, 0, cape), np.where(no_lfc, 0, cin)
+
+
+def _lifted_index(p, t, profile, count):
+    """Find the temperature difference at 500 hPa, interpolating linearly in pressure."""
+    rows = np.arange(p.shape[0])
+    exact = p == 500
+    has_exact = exact.any(axis=-1)
+    index = np.argmax(exact, axis=-1)
+    li = t[rows, index] - profile[rows, index]
+
+    # Otherwise, interpolate between the levels on either side
+    with np.errstate(invalid="ignore"):
+        upper = np.clip(np.argmax(p < 500, axis=-1), 1, p.shape[-1] - 1)
+        lower = upper - 1
+        inside = (p[rows, lower] > 500) & (p[rows, upper] < 500) & (upper < count)
+        weight = (500 - p[rows, lower]) / (p[rows, upper] - p[rows, lower])
+        diff = t - profile
+        interpolated = diff[rows, lower] + weight * (diff[rows, upper] - diff[rows, lower])
+    return np.where(has_exact, li, np.where(inside, interpolated, np.nan))
+
+
+def _unpack(values, order, packed, shape):
+    result = np.full(packed.shape, np.nan)
+    np.put_along_axis(result, order, np.where(packed, values, np.nan), axis=-1)
+    return result.reshape(shape)
+
+
+def parcel_profiles(pressure, temperature, dewpoint):
+    """Calculate the profile of a parcel lifted from the surface, for many soundings at once.
+
+    Equivalent to calling `metpy.calc.parcel_profile` with the surface temperature and
+    dewpoint of every sounding.
+
+    Parameters
+    ----------
+    pressure, temperature, dewpoint : `pint.Quantity` or list of `pint.Quantity`
+        Either 2D (soundings by levels, padded with NaN or masked) or 1D (a single sounding)
+        arrays, or a list of 1D arrays of different lengths
+
+    Returns
+    -------
+    `pint.Quantity`
+        The parcel temperature at every level, with the same shape as the input (padded to
+        the longest sounding for a list), and NaN where a level is missing
+
+    """
+    p, t, td, order, packed = _prepare(pressure, temperature, dewpoint)
+    profile, _, _ = _parcel(p, t, td, packed)
+    shape = np.shape(pressure) if not isinstance(pressure, (list, tuple)) else packed.shape
+    return units.Quantity(_unpack(profile, order, packed, shape), "K")
+
+
+def parcel_profile(pressure, temperature, dewpoint):
+    """Calculate the profile of a parcel lifted from the first of given pressures.
+
+    Takes the same arguments as `metpy.calc.parcel_profile`, for a single sounding.
+
+    Parameters
+    ----------
+    pressure : `pint.Quantity`
+        Pressure levels of the sounding, starting at the parcel's
+    temperature, dewpoint : `pint.Quantity`
+        Starting temperature and dewpoint of the parcel
+
+    Returns
+    -------
+    `pint.Quantity`
+        The parcel temperature at every pressure
+
+    """
+    p = np.atleast_2d(_as_levels(pressure, "hPa"))
+    t = np.full(p.shape, np.nan)
+    td = np.full(p.shape, np.nan)
+    t[:, 0] = _as_levels(temperature, "K")
+    td[:, 0] = _as_levels(dewpoint, "K")
+    profile, _, _ = _parcel(p, t, td, np.isfinite(p))
+    return units.Quantity(profile.reshape(np.shape(pressure)), "K")
+
+
+def analyze_soundings(
+    pressure,
+    temperature,
+    dewpoint,
+    parcel_profile=None,
+    which_lfc="top",
+    which_el="top",
+    index=None,
+):
+    """Calculate the common convective indices of many soundings at once.
+
+    For a surface-based parcel, calculates the same LCL, LFC, EL, CAPE, CIN and lifted
+    index as `metpy.calc.lcl`, `~metpy.calc.lfc`, `~metpy.calc.el`, `~metpy.calc.cape_cin`
+    and `~metpy.calc.lifted_index`. As in `metpy.calc.cape_cin`, CAPE and CIN are always
+    integrated from the lowest LFC to the highest EL, whatever ``which_lfc`` and
+    ``which_el`` select for the table.
+
+    Parameters
+    ----------
+    pressure, temperature, dewpoint : `pint.Quantity` or list of `pint.Quantity`
+        Either 2D (soundings by levels, padded with NaN or masked) or 1D (a single sounding)
+        arrays, or a list of 1D arrays of different lengths
+    parcel_profile : `pint.Quantity`, optional
+        Output of `parcel_profiles` for the same soundings, if already calculated
+    which_lfc, which_el : {'top', 'bottom'}, optional
+        Which LFC and EL to report when there are several, as in `metpy.calc.lfc` and
+        `metpy.calc.el`. Default to the highest.
+    index : array-like, optional
+        Index for the table, e.g. station identifiers
+
+    Returns
+    -------
+    `pandas.DataFrame`
+        One row per sounding, with a ``units`` attribute giving the units of every column,
+        as returned by `metpy.io` readers (see `metpy.units.pandas_dataframe_to_unit_arrays`)
+
+    """
+    p, t, td, order, packed = _prepare(pressure, temperature, dewpoint)
+    count = packed.sum(axis=-1)
+    profile, lcl_p, lcl_t = _parcel(p, t, td, packed)
+    if parcel_profile is not None:
+        given = np.atleast_2d(_as_levels(parcel_profile, "K"))
+        profile = np.where(packed, np.take_along_axis(given, order, axis=-1), np.nan)
+
+    lfc_p, lfc_t = _lfc(p, t, profile, lcl_p, lcl_t, which_lfc)
+    el_p, el_t = _el(p, t, profile, lcl_p, count, which_el)
+
+    # CAPE and CIN always use the lowest LFC and the highest EL
+    bottom_lfc_p, _ = _lfc(p, t, profile, lcl_p, lcl_t, "bottom")
+    top_el_p, _ = _el(p, t, profile, lcl_p, count, "top")
+    cape, cin = _cape_cin(p, t, profile, bottom_lfc_p, top_el_p, count)
+
+    table = pd.DataFrame(
+        {
+            "lcl_pressure": lcl_p,
+            "lcl_temperature": lcl_t - 273.15,
+            "lfc_pressure": lfc_p,
+            "lfc_temperature": lfc_t - 273.15,
+            "el_pressure": el_p,
+            "el_temperature": el_t - 273.15,
+            "cape": cape,
+            "cin": cin,
+            "lifted_index": _lifted_index(p, t, profile, count),
+        },
+        index=index,
+    )
+    # Pandas warns about setting attributes that are not columns, as MetPy does
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        table.units = dict(_columns)
+    return table
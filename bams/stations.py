@@ -0,0 +1,280 @@
+"""Thinning of station plots that reuses work between maps and runs.
+
+`StationLayout` holds the stations of a set of reports projected onto a map, along with a
+spatial index over them, and is shared between every thinning of the same stations on the
+same map (e.g. at several radii). `thin_stations` replaces `metpy.calc.reduce_point_density`
+for the common case of thinning the latest reports on a fixed map. It remembers the result
+of the previous call for the same map and radius, and only re-evaluates the stations that
+are affected by stations appearing, disappearing, moving, or changing priority.
+
+The state for incremental thinning lives in ``.cache/stations`` at the root of the
+repository unless ``BAMS_STATIONS_CACHE_DIR`` says otherwise; it is safe to delete at any
+time.
+"""
+
+import hashlib
+import heapq
+import os
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+
+import cartopy.crs as ccrs
+import numpy as np
+from scipy.spatial import cKDTree
+
+default_cache_dir = Path(__file__).resolve().parents[1] / ".cache" / "stations"
+
+# Most recently used layouts, keyed on map projection and stations
+_layout_cache = OrderedDict()
+_layout_cache_size = 16
+
+
+def _cache_dir():
+    path = Path(os.environ.get("BAMS_STATIONS_CACHE_DIR", default_cache_dir))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _magnitude(values):
+    return np.asarray(getattr(values, "magnitude", values))
+
+
+def station_keys(station_id):
+    """Identify every report by its station and its number among that station's reports.
+
+    Hourly files hold several reports (e.g. specials) from some stations, which must be
+    told apart to follow each one from run to run.
+
+    Parameters
+    ----------
+    station_id : array-like of str
+
+    Returns
+    -------
+    `numpy.ndarray` of str
+        Keys like ``KDEN:0``, ``KDEN:1``, in the order of ``station_id``
+
+    """
+    seen = {}
+    keys = []
+    for stid in np.asarray(station_id, dtype=str):
+        keys.append(f"{stid}:{seen.get(stid, 0)}")
+        seen[stid] = seen.get(stid, 0) + 1
+    return np.array(keys)
+
+
+class StationLayout:
+    """Stations projected onto a map, with a spatial index for finding their neighbors.
+
+    Parameters
+    ----------
+    station_id : array-like of str
+        Identifier of every station (or report)
+    longitude, latitude : array-like
+        Location of every station, in degrees
+    crs : `cartopy.crs.CRS`
+        Projection of the map, in which distances are measured
+
+    """
+
+    def __init__(self, station_id, longitude, latitude, crs):
+        self.keys = station_keys(station_id)
+        self.crs = crs
+        self.points = crs.transform_points(
+            ccrs.PlateCarree(), _magnitude(longitude), _magnitude(latitude)
+        )[..., :2]
+
+        # Stations that cannot be placed on the map are never plotted
+        self.valid = np.isfinite(self.points).all(axis=-1)
+        self._valid_index = np.flatnonzero(self.valid)
+        self.tree = cKDTree(self.points[self.valid])
+        self._neighbors = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def neighbors(self, index, radius):
+        """Find the stations within ``radius`` of station ``index``, including itself."""
+        memo = self._neighbors.setdefault(radius, {})
+        if index not in memo:
+            found = self.tree.query_ball_point(self.points[index], radius)
+            memo[index] = self._valid_index[found]
+        return memo[index]
+
+    def near(self, points, radius):
+        """Find the stations within ``radius`` of any of ``points`` (in map coordinates)."""
+        points = np.asarray(points).reshape(-1, 2)
+        points = points[np.isfinite(points).all(axis=-1)]
+        if not points.size:
+            return np.array([], dtype=int)
+        found = self.tree.query_ball_point(points, radius)
+        return np.unique(self._valid_index[np.concatenate(found).astype(int)])
+
+    def _ranks(self, priority):
+        """Order stations by decreasing priority, breaking ties by key so runs agree."""
+        if priority is None:
+            priority = np.zeros(len(self))
+        # Missing priorities go last
+        priority = np.nan_to_num(_magnitude(priority).astype(np.float64), nan=-np.inf)
+        return [(-p, key) for p, key in zip(priority, self.keys)], priority
+
+    def reduce_point_density(self, radius, priority=None, previous=None):
+        """Return a mask reducing the density of stations to no more than one per radius.
+
+        Stations are considered in order of decreasing priority, and kept unless a kept
+        station lies within ``radius``, as in `metpy.calc.reduce_point_density`. Ties in
+        priority are broken by station key, rather than by position in the arrays, so that
+        the result does not depend on the order of the reports.
+
+        Parameters
+        ----------
+        radius : float or `pint.Quantity`
+            Minimum distance between kept stations, in meters of the map projection
+        priority : array-like, optional
+            Priority of every station; higher is kept first
+        previous : dict, optional
+            State returned by `thinning_state` for an earlier set of stations, thinned at the
+            same radius on the same map. Only stations affected by the differences from that
+            set are re-evaluated.
+
+        Returns
+        -------
+        `numpy.ndarray` of bool
+            Mask of stations to keep
+
+        """
+        if hasattr(radius, "units"):
+            radius = radius.to("m").magnitude
+        ranks, priority = self._ranks(priority)
+
+        if previous is None:
+            keep = np.zeros(len(self), dtype=bool)
+            dirty = self._valid_index
+        else:
+            keep, dirty = self._carry_over(radius, priority, previous)
+
+        # Re-evaluate in rank order, so that every station sees the final status of all
+        # higher-ranked stations. A change in status can only affect lower-ranked neighbors.
+        queue = [(ranks[i], i) for i in dirty]
+        heapq.heapify(queue)
+        queued = set(int(i) for i in dirty)
+        initial = set(queued)
+        while queue:
+            rank, i = heapq.heappop(queue)
+            neighbors = self.neighbors(i, radius)
+            status = not any(keep[n] and ranks[n] < rank for n in neighbors)
+            if status != keep[i] or i in initial:
+                keep[i] = status
+                for n in neighbors:
+                    if n not in queued and ranks[n] > rank:
+                        heapq.heappush(queue, (ranks[n], n))
+                        queued.add(n)
+        return keep
+
+    def _carry_over(self, radius, priority, previous):
+        """Start from a previous thinning, and find the stations it may be wrong about."""
+        keep = np.zeros(len(self), dtype=bool)
+        last = {key: i for i, key in enumerate(previous["keys"])}
+        matched = np.array([last.get(key, -1) for key in self.keys])
+        common = matched >= 0
+        keep[common] = previous["keep"][matched[common]]
+
+        # Stations that are new, or whose position or priority changed
+        changed = ~common
+        changed[common] |= (previous["priority"][matched[common]] != priority[common]) | (
+            previous["points"][matched[common]] != self.points[common]
+        ).any(axis=-1)
+        keep &= self.valid & ~changed
+
+        # Stations that are gone, or have moved or changed priority, may have been excluding
+        # their neighbors
+        gone = np.ones(len(previous["keys"]), dtype=bool)
+        gone[matched[common & ~changed]] = False
+
+        changed = np.flatnonzero(changed & self.valid)
+        dirty = set(changed.tolist())
+        dirty.update(self.near(previous["points"][gone], radius).tolist())
+        for i in changed:
+            dirty.update(self.neighbors(i, radius).tolist())
+        return keep, np.array(sorted(dirty), dtype=int)
+
+    def thinning_state(self, keep, priority=None):
+        """Get what a later `reduce_point_density` needs to update this thinning."""
+        _, priority = self._ranks(priority)
+        return {"keys": self.keys, "points": self.points, "priority": priority, "keep": keep}
+
+
+def station_layout(station_id, longitude, latitude, crs):
+    """Get the layout of stations on a map, reusing it if seen recently.
+
+    Layouts are kept in an in-memory LRU cache keyed on the map projection and the stations,
+    so that thinning the same stations again (e.g. at another radius) reuses the projected
+    locations, spatial index and neighbor lists.
+    """
+    digest = hashlib.sha256(crs.to_wkt().encode("utf-8"))
+    for values in (station_id, longitude, latitude):
+        digest.update(np.ascontiguousarray(_magnitude(values)).tobytes())
+    key = digest.hexdigest()
+
+    if key in _layout_cache:
+        _layout_cache.move_to_end(key)
+    else:
+        _layout_cache[key] = StationLayout(station_id, longitude, latitude, crs)
+        while len(_layout_cache) > _layout_cache_size:
+            _layout_cache.popitem(last=False)
+    return _layout_cache[key]
+
+
+def _load_state(path):
+    try:
+        with np.load(path) as state:
+            return {name: state[name] for name in state.files}
+    except (OSError, ValueError):
+        return None
+
+
+def _store_state(path, state):
+    # Write atomically, so that scripts running in parallel never see a partial file
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp", suffix=".npz")
+    with os.fdopen(fd, "wb") as f:
+        np.savez(f, **state)
+    os.replace(tmp, path)
+
+
+def thin_stations(station_id, longitude, latitude, crs, radius, priority=None):
+    """Return a mask reducing the density of stations on a map.
+
+    Equivalent to projecting the stations and calling `metpy.calc.reduce_point_density`,
+    except that ties in priority are broken by station rather than by position in the
+    arrays. The result for the same map and radius is stored, so that the next call only
+    re-evaluates the stations affected by what changed in between.
+
+    Parameters
+    ----------
+    station_id : array-like of str
+        Identifier of every station (or report)
+    longitude, latitude : array-like
+        Location of every station, in degrees
+    crs : `cartopy.crs.CRS`
+        Projection of the map
+    radius : float or `pint.Quantity`
+        Minimum distance between kept stations, in meters of the map projection
+    priority : array-like, optional
+        Priority of every station; higher is kept first
+
+    Returns
+    -------
+    `numpy.ndarray` of bool
+        Mask of stations to keep
+
+    """
+    if hasattr(radius, "units"):
+        radius = radius.to("m").magnitude
+    layout = station_layout(station_id, longitude, latitude, crs)
+
+    key = hashlib.sha256(f"{crs.to_wkt()}\n{float(radius)!r}".encode("utf-8")).hexdigest()
+    path = _cache_dir() / f"{key}.npz"
+    keep = layout.reduce_point_density(radius, priority, previous=_load_state(path))
+    _store_state(path, layout.thinning_state(keep, priority))
+    return keep
@@ -0,0 +1,342 @@
+"""Gridded inputs ingested once into memory-mapped local stores, opened already parsed.
+
+The scripts open ``hgt.sfc.nc`` and MetPy's NARR and GFS test data with
+``xr.open_dataset`` and then ``parse_cf``, so every run decodes the NetCDF metadata, builds
+the CRS, converts the projection coordinates to metres and merges the parsed variables
+again, and reading any part of a variable goes through HDF5. `open_dataset` instead ingests
+each file, the first time it is opened, into a store holding the result of ``parse_cf``:
+
+* every variable is saved, decoded, as an uncompressed ``.npy`` file that is memory-mapped
+  when read, so the chunks of a variable are the pages of its file, and selecting a level
+  or the rows a cross section passes through reads only the pages holding them
+* the dimensions, attributes (with units in MetPy's canonical spelling) and the grid
+  mapping of the CRS are saved as JSON, from which the dataset, with its ``metpy_crs``
+  coordinate, is put back together without parsing anything
+
+Opening a store reads its JSON and the (small) dimension coordinates, and nothing else
+until values are used. A file has one store for each set of arguments it is opened with,
+which records the size and modification time of the file and the versions of xarray and
+MetPy it was ingested with, and is ingested again, in place, when any of them changes.
+``python -m bams.store ingest FILE...`` ingests files ahead of time.
+
+Stores live in ``.cache/stores`` at the root of the repository unless
+``BAMS_STORE_CACHE_DIR`` says otherwise; the cache is safe to delete at any time.
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+from xarray.backends import BackendArray
+from xarray.core import indexing
+
+import metpy
+from metpy.plots.mapping import CFProjection
+from metpy.units import units
+
+default_cache_dir = Path(__file__).resolve().parents[1] / ".cache" / "stores"
+
+# Version of the layout of stores, part of their key
+_format_version = 1
+
+
+def _cache_dir():
+    path = Path(os.environ.get("BAMS_STORE_CACHE_DIR", default_cache_dir))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _json_value(value):
+    """Convert an attribute to something JSON can hold."""
+    if isinstance(value, np.ndarray):
+        return [_json_value(item) for item in value.tolist()]
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    if isinstance(value, (list, tuple)):
+        return [_json_value(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _json_value(item) for key, item in value.items()}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def _resolve_attrs(attrs):
+    """Make attributes storable, spelling units as MetPy's registry prints them."""
+    attrs = {name: _json_value(value) for name, value in attrs.items()}
+    if isinstance(attrs.get("units"), str):
+        try:
+            attrs["units"] = str(units.Unit(attrs["units"]))
+        except Exception:
+            # Units pint cannot parse (or that MetPy handles specially) are kept as they are
+            pass
+    return attrs
+
+
+def _key(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def _source_dir(source):
+    """Find the directory holding the stores of a file, which need not exist any more."""
+    source = Path(source).resolve()
+    return _cache_dir() / f"{source.stem}-{_key(str(source))}"
+
+
+def store_path(source, **kwargs):
+    """Find where the store of a file opened with the given arguments is (or would be) kept."""
+    return _source_dir(source) / _key(_json_value(kwargs))
+
+
+def _identity(source):
+    """Describe the version of a file, and of the code reading it, that a store holds."""
+    stat = Path(source).stat()
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "format": _format_version,
+        "versions": {"xarray": xr.__version__, "metpy": metpy.__version__},
+    }
+
+
+def _current(path, source):
+    try:
+        meta = json.loads((path / "store.json").read_text())
+    except (OSError, ValueError):
+        return False
+    return meta.get("source") == _identity(source)
+
+
+def _discard(path):
+    """Remove a store, moving it aside first so that it is never seen half-removed."""
+    if not path.exists():
+        return
+    trash = Path(tempfile.mkdtemp(dir=path.parent, prefix=".old"))
+    try:
+        os.replace(path, trash / path.name)
+    except OSError:
+        # Another process removed it first
+        pass
+    shutil.rmtree(trash, ignore_errors=True)
+
+
+def update(source, **kwargs):
+    """Ingest a file into its store, unless the store is current, and return its path.
+
+    A store ingested from an earlier version of the file is replaced.
+    """
+    path = store_path(source, **kwargs)
+    if not _current(path, source):
+        _discard(path)
+        ingest(source, path, **kwargs)
+    return path
+
+
+def remove(source):
+    """Remove every store of a file, e.g. when the file is deleted."""
+    path = _source_dir(source)
+    if path.exists():
+        # Leave alone stores being written or removed by other processes
+        for store in [store for store in path.iterdir() if not store.name.startswith(".")]:
+            _discard(store)
+        try:
+            path.rmdir()
+        except OSError:
+            # Not empty: another process is ingesting the file
+            pass
+
+
+def ingest(data, path, **kwargs):
+    """Write a dataset to a store.
+
+    Parameters
+    ----------
+    data : `xarray.Dataset` or str or `pathlib.Path`
+        The dataset, or a file to open with xarray. It is parsed with MetPy's ``parse_cf``
+        unless it already has a ``metpy_crs`` coordinate. Variables are read one at a time.
+    path : str or `pathlib.Path`
+        Directory of the store. It is written in full, then moved into place, so a store is
+        never seen half-written.
+    kwargs
+        Passed to `xarray.open_dataset` when ``data`` is a file
+
+    Returns
+    -------
+    `pathlib.Path`
+
+    """
+    if isinstance(data, xr.Dataset):
+        return _write(data, path, None)
+    source = _identity(data)
+    with xr.open_dataset(data, **kwargs) as data:
+        return _write(data, path, source)
+
+
+def _write(data, path, source):
+    """Write a dataset to a store, recording the version of the file it was read from."""
+    path = Path(path)
+    if "metpy_crs" not in data.coords:
+        data = data.metpy.parse_cf()
+
+    crs = None
+    if "metpy_crs" in data.coords:
+        crs = _json_value(data["metpy_crs"].item().to_dict())
+        data = data.drop_vars("metpy_crs")
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(dir=path.parent, prefix=".tmp"))
+    try:
+        variables = {}
+        for index, (name, var) in enumerate(data.variables.items()):
+            values = var.values
+            if values.dtype.kind == "O":
+                values = values.astype(str)
+            filename = f"{index:04d}.npy"
+            np.save(tmp / filename, values, allow_pickle=False)
+            variables[name] = {
+                "file": filename,
+                "dims": list(var.dims),
+                "shape": list(values.shape),
+                "dtype": values.dtype.str,
+                "attrs": _resolve_attrs(var.attrs),
+                "coord": name in data.coords,
+            }
+        meta = {
+            "format": _format_version,
+            "source": source,
+            "attrs": _resolve_attrs(data.attrs),
+            "crs": crs,
+            "variables": variables,
+        }
+        (tmp / "store.json").write_text(json.dumps(meta, indent=1))
+        try:
+            os.replace(tmp, path)
+        except OSError:
+            # Another process ingested the same file first
+            shutil.rmtree(tmp, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return path
+
+
+class _StoreArray(BackendArray):
+    """A variable of a store, memory-mapped when first read."""
+
+    def __init__(self, path, shape, dtype):
+        self.path = path
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self._array = None
+
+    def _map(self):
+        with open(self.path, "rb") as f:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                np.lib.format.read_array_header_1_0(f)
+            else:
+                np.lib.format.read_array_header_2_0(f)
+            offset = f.tell()
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # Read only the pages a selection touches, rather than megabytes of readahead around
+        # each, since selections (a level, the rows along a path) are small parts of the file
+        if hasattr(mmap, "MADV_RANDOM"):
+            mapped.madvise(mmap.MADV_RANDOM)
+        array = np.frombuffer(mapped, self.dtype, int(np.prod(self.shape)), offset)
+        return array.reshape(self.shape)
+
+    def _raw_indexing_method(self, key):
+        if self._array is None:
+            self._array = self._map()
+        # Copy out the selection, which reads only the pages holding it
+        return np.array(self._array[key])
+
+    def __getitem__(self, key):
+        return indexing.explicit_indexing_adapter(
+            key, self.shape, indexing.IndexingSupport.BASIC, self._raw_indexing_method
+        )
+
+
+def open_store(path):
+    """Open a store written by `ingest`, as ``parse_cf`` would have returned it.
+
+    Returns
+    -------
+    `xarray.Dataset`
+        Variables are read from their memory-mapped files when their values are used;
+        only dimension coordinates are read on opening.
+
+    """
+    path = Path(path)
+    meta = json.loads((path / "store.json").read_text())
+
+    variables, coords = {}, {}
+    for name, info in meta["variables"].items():
+        if info["dims"] == [name]:
+            values = np.load(path / info["file"])
+        else:
+            values = indexing.LazilyIndexedArray(
+                _StoreArray(path / info["file"], info["shape"], info["dtype"])
+            )
+        var = xr.Variable(info["dims"], values, info["attrs"])
+        (coords if info["coord"] else variables)[name] = var
+
+    data = xr.Dataset(variables, coords, meta["attrs"])
+    if meta["crs"] is not None:
+        data = data.assign_coords(metpy_crs=CFProjection(meta["crs"]))
+    return data
+
+
+def open_dataset(source, varname=None, **kwargs):
+    """Open a file, from its store, as ``xr.open_dataset`` and then ``parse_cf`` would.
+
+    The file is ingested into a store the first time it is opened with the same arguments,
+    and again after it changes.
+
+    Parameters
+    ----------
+    source : str or `pathlib.Path`
+        NetCDF (or other xarray-readable) file
+    varname : str, optional
+        Variable to return, as a `xarray.DataArray`, rather than the whole dataset
+    kwargs
+        Passed to `xarray.open_dataset` when the file is ingested
+
+    Returns
+    -------
+    `xarray.Dataset` or `xarray.DataArray`
+
+    """
+    data = open_store(update(source, **kwargs))
+    return data if varname is None else data[varname]
+
+
+def main():
+    """Ingest gridded inputs into local stores, or list the stores."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = commands.add_parser("ingest", help="ingest files, if not already")
+    ingest_parser.add_argument("files", nargs="+")
+    commands.add_parser("list", help="list stores")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        for source in args.files:
+            print(f"{source} -> {update(source)}")
+    else:
+        for path in sorted(_cache_dir().glob("*/*/store.json")):
+            size = sum(file.stat().st_size for file in path.parent.iterdir())
+            print(f"{size:>12d} {path.parent.parent.name}/{path.parent.name}")
+
+
+if __name__ == "__main__":
+    main()
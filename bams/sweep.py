@@ -0,0 +1,205 @@
+"""Render a declarative product for every level and time of a sweep, in parallel.
+
+Fig5 is one `PanelContainer` at one level and time; operationally the same product is
+needed at every mandatory level and forecast hour. `render_sweep` takes the product as a
+template (a `PanelContainer` whose plots have no data) and renders one frame for every level
+and time over a pool of worker processes:
+
+* each worker opens the dataset once, with a function given by the caller, and draws every
+  frame it is given from it; opened lazily, only the slices each frame selects are read
+* the first frame is rendered on its own, so that the map layers it draws are cached (see
+  `bams.basemap`) before the other workers need them
+* workers write their frames straight to disk and only return the paths, at most
+  ``processes`` frames are rendered at once, and each worker is replaced after
+  ``frames_per_worker`` frames, so memory stays bounded however long the sweep
+
+Workers are forked from a process that has already imported the plotting libraries, as in
+`bams.pool`. The function opening the dataset must be picklable, i.e. defined at the top
+level of a module (or of a script guarded by ``if __name__ == "__main__"``).
+"""
+
+import itertools
+import multiprocessing
+import pickle
+from pathlib import Path
+
+from metpy.units import units
+
+from .pool import default_preload
+
+# State of each worker: the pickled template and the opened dataset
+_worker = {}
+
+
+def sweep(levels=None, times=None):
+    """List the (level, time) of each frame, every level for each time in turn.
+
+    Parameters
+    ----------
+    levels : list, optional
+        Vertical levels, e.g. ``[850, 500, 300] * units.hPa``. Without them, the levels
+        set on the template are kept.
+    times : list of `datetime.datetime`, optional
+        Times to select. Without them, the times set on the template are kept.
+
+    """
+    levels = [None] if levels is None else list(levels)
+    times = [None] if times is None else list(times)
+    return [(level, time) for time, level in itertools.product(times, levels)]
+
+
+def _metpy_quantity(value):
+    """Rebuild a quantity in MetPy's unit registry, as unpickled ones are not."""
+    if hasattr(value, "units") and not isinstance(value, units.Quantity):
+        return units.Quantity(value.magnitude, str(value.units))
+    return value
+
+
+def render_frame(template, data, level=None, time=None, path=None, title=None, **kwargs):
+    """Render one frame of a sweep.
+
+    Parameters
+    ----------
+    template : `metpy.plots.PanelContainer` or bytes
+        The product, or the product pickled. It is copied, not changed.
+    data : `xarray.Dataset`
+        Data for every plot of the product
+    level, time : optional
+        Level and time to select in every plot, if given
+    path : str or `pathlib.Path`, optional
+        File to save the frame to. Without it, the figure is returned undrawn.
+    title : str, optional
+        Title of every panel, formatted with ``level`` and ``time``
+    kwargs
+        Passed on to ``savefig``, e.g. ``dpi``
+
+    Returns
+    -------
+    `pathlib.Path` or `metpy.plots.PanelContainer`
+
+    """
+    import matplotlib.pyplot as plt
+
+    pc = pickle.loads(template if isinstance(template, bytes) else pickle.dumps(template))
+    for panel in pc.panels:
+        for plot in panel.plots:
+            plot.data = data
+            if hasattr(plot, "level"):
+                plot.level = _metpy_quantity(plot.level if level is None else level)
+            if time is not None:
+                plot.time = time
+        if title is not None:
+            panel.title = title.format(level=level, time=time)
+
+    if path is None:
+        return pc
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pc.save(path, **kwargs)
+    plt.close(pc.figure)
+    return path
+
+
+def _init_worker(template, open_data):
+    _worker["template"] = template
+    _worker["data"] = open_data()
+
+
+def _render(args):
+    index, (level, time), pattern, title, kwargs = args
+    path = pattern.format(index=index, level=level, time=time)
+    return render_frame(
+        _worker["template"], _worker["data"], level, time, path, title, **kwargs
+    )
+
+
+def render_sweep(
+    template,
+    open_data,
+    frames,
+    pattern,
+    title=None,
+    processes=None,
+    frames_per_worker=50,
+    **kwargs,
+):
+    """Render a declarative product for each level and time of a sweep.
+
+    Parameters
+    ----------
+    template : `metpy.plots.PanelContainer`
+        The product. Data set on its plots are ignored; every plot gets the dataset returned
+        by ``open_data``.
+    open_data : callable
+        Picklable function, taking no arguments, returning the dataset to plot. It is called
+        once in each worker.
+    frames : list of tuple
+        ``(level, time)`` of each frame, as from `sweep`
+    pattern : str
+        Path of each frame, formatted with its ``index`` (in ``frames``), ``level`` and
+        ``time``, e.g. ``"output/fig5_{index:03d}.png"``
+    title : str, optional
+        Title of every panel, formatted with ``level`` and ``time``, e.g.
+        ``"{level:~P} Heights and Wind Speed at {time:%Y-%m-%d %H%MZ}"``
+    processes : int, optional
+        Number of frames to render at once. Defaults to the number of CPUs.
+    frames_per_worker : int, optional
+        Number of frames each worker renders before it is replaced by a new one
+    kwargs
+        Passed on to ``savefig``, e.g. ``dpi``
+
+    Returns
+    -------
+    list of `pathlib.Path`
+        Path of each frame, in the order of ``frames``
+
+    """
+    if not frames:
+        return []
+    template = pickle.dumps(template)
+    tasks = [(index, frame, pattern, title, kwargs) for index, frame in enumerate(frames)]
+
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(default_preload)
+    with context.Pool(
+        processes,
+        initializer=_init_worker,
+        initargs=(template, open_data),
+        maxtasksperchild=frames_per_worker,
+    ) as pool:
+        # Cache the map layers before the other workers draw them
+        paths = [pool.apply(_render, (tasks[0],))]
+        paths.extend(pool.imap(_render, tasks[1:]))
+    return paths
+
+
+def animate(paths, output, duration=500, loop=0):
+    """Assemble frames into an animated GIF, WebP or PNG, chosen from ``output``'s suffix.
+
+    Parameters
+    ----------
+    paths : list of str or `pathlib.Path`
+        Frames, in order, all of the same size
+    output : str or `pathlib.Path`
+        Path of the animation
+    duration : int, optional
+        Time each frame is shown for, in milliseconds
+    loop : int, optional
+        Number of times the animation plays, or 0 to repeat forever
+
+    """
+    from PIL import Image
+
+    frames = [Image.open(path) for path in paths]
+    try:
+        frames[0].save(
+            output,
+            save_all=True,
+            append_images=frames[1:],
+            duration=duration,
+            loop=loop,
+        )
+    finally:
+        for frame in frames:
+            frame.close()
+    return Path(output)
@@ -0,0 +1,203 @@
+"""Thermodynamic fields computed on plain arrays, with units handled only at the boundary.
+
+MetPy's thermodynamic functions carry pint quantities through every operation: each
+intermediate result is a new array wrapped in a quantity, whose units are worked out (and
+checked, and converted) again at every step and in every function called along the way, so
+that `metpy.calc.equivalent_potential_temperature` allocates some twenty arrays the size of
+the grid. On the full RTMA grid of fig2, and on every cross section of a long series, that
+overhead is most of the time taken.
+
+The functions here take and return the same as MetPy's (DataArrays are broadcast against
+each other and the result wrapped like ``temperature``), but convert each input to a plain
+array in hPa, kelvin or kg/kg once, without copying when it already is, and compute the
+result in place, a block of points at a time, in a few buffers that stay in cache, in the
+precision of the temperature (and humidity) given, so that float32 fields stay float32.
+They follow MetPy's formulas and agree with its results to within rounding (see
+``benchmarks/bench_thermo.py``).
+"""
+
+import numpy as np
+
+from metpy.constants import epsilon, kappa
+from metpy.units import units
+from metpy.xarray import preprocess_and_wrap
+
+# Unit-free constants
+_epsilon = epsilon.m_as("")
+_kappa = kappa.m_as("")
+_reference_pressure = 1000.0  # hPa, as metpy.constants.P0
+_sat_pressure_0c = 6.112  # hPa, as metpy.constants.sat_pressure_0c
+
+# Number of points computed at a time, small enough for a few buffers of them to stay in cache
+_block_size = 16384
+
+
+def _magnitude(value, unit):
+    """Get the values of a quantity in a unit, as a floating point array."""
+    quantity = value if isinstance(value, units.Quantity) else units.Quantity(value)
+    if quantity.units == units(unit):
+        magnitude = quantity.magnitude
+    else:
+        magnitude = quantity.m_as(unit)
+    magnitude = np.asarray(magnitude)
+    return magnitude if magnitude.dtype.kind == "f" else magnitude.astype(np.float64)
+
+
+def _apply(kernel, inputs, fields, buffers=0):
+    """Run a kernel over its inputs broadcast together, a block at a time.
+
+    Each block is small enough for the kernel's passes over it to stay in cache, and inputs
+    are cast to the fields' precision a block at a time, so the only array the size of the
+    grid allocated is the result.
+    """
+    dtype = np.result_type(*fields)
+    iterator = np.nditer(
+        [*inputs, None],
+        flags=["external_loop", "buffered", "zerosize_ok"],
+        op_flags=[["readonly"]] * len(inputs) + [["writeonly", "allocate"]],
+        op_dtypes=[dtype] * (len(inputs) + 1),
+        casting="same_kind",
+        buffersize=_block_size,
+    )
+    work = [np.empty(_block_size, dtype) for _ in range(buffers)]
+    with iterator:
+        for *blocks, out in iterator:
+            kernel(*blocks, out, *(buffer[: out.size] for buffer in work))
+        return iterator.operands[-1]
+
+
+def _saturation_vapor_pressure(temperature, out, work):
+    """Bolton (1980), as `metpy.calc.saturation_vapor_pressure`, in hPa, into ``out``."""
+    np.subtract(temperature, 273.15, out=out)
+    np.subtract(temperature, 29.65, out=work)
+    np.divide(out, work, out=out)
+    out *= 17.67
+    np.exp(out, out=out)
+    out *= _sat_pressure_0c
+    return out
+
+
+def _potential_temperature(p, t, theta):
+    np.divide(p, _reference_pressure, out=theta)
+    np.power(theta, _kappa, out=theta)
+    np.divide(t, theta, out=theta)
+
+
+@preprocess_and_wrap(wrap_like="temperature", broadcast=("pressure", "temperature"))
+def potential_temperature(pressure, temperature):
+    """Calculate the potential temperature, as `metpy.calc.potential_temperature`.
+
+    Parameters
+    ----------
+    pressure : `pint.Quantity` or `xarray.DataArray`
+    temperature : `pint.Quantity` or `xarray.DataArray`
+
+    Returns
+    -------
+    `pint.Quantity` or `xarray.DataArray`
+        Potential temperature, in kelvin
+
+    """
+    p = _magnitude(pressure, "hPa")
+    t = _magnitude(temperature, "K")
+    return units.Quantity(_apply(_potential_temperature, (p, t), (t,)), "K")
+
+
+def _relative_humidity(p, t, q, humidity, saturation):
+    # Saturation mixing ratio, and then the mixing ratio over it
+    _saturation_vapor_pressure(t, saturation, humidity)
+    np.subtract(p, saturation, out=humidity)
+    np.divide(saturation, humidity, out=saturation)
+    saturation *= _epsilon
+    np.subtract(1, q, out=humidity)
+    np.divide(q, humidity, out=humidity)
+    humidity /= saturation
+
+
+@preprocess_and_wrap(
+    wrap_like="temperature", broadcast=("pressure", "temperature", "specific_humidity")
+)
+def relative_humidity_from_specific_humidity(pressure, temperature, specific_humidity):
+    """Calculate the relative humidity from the specific humidity, as MetPy does.
+
+    Parameters
+    ----------
+    pressure : `pint.Quantity` or `xarray.DataArray`
+    temperature : `pint.Quantity` or `xarray.DataArray`
+    specific_humidity : `pint.Quantity` or `xarray.DataArray`
+
+    Returns
+    -------
+    `pint.Quantity` or `xarray.DataArray`
+        Relative humidity, dimensionless
+
+    """
+    p = _magnitude(pressure, "hPa")
+    t = _magnitude(temperature, "K")
+    q = _magnitude(specific_humidity, "dimensionless")
+    humidity = _apply(_relative_humidity, (p, t, q), (t, q), buffers=1)
+    return units.Quantity(humidity, "dimensionless")
+
+
+def _equivalent_potential_temperature(p, t, td, theta, mixing, lcl, work):
+    # Temperature at the LCL
+    np.divide(t, td, out=work)
+    np.log(work, out=work)
+    work /= 800
+    np.subtract(td, 56, out=lcl)
+    np.reciprocal(lcl, out=lcl)
+    lcl += work
+    np.reciprocal(lcl, out=lcl)
+    lcl += 56
+
+    # Saturation mixing ratio at the dewpoint
+    vapor = _saturation_vapor_pressure(td, theta, mixing)
+    np.subtract(p, vapor, out=mixing)
+    np.divide(vapor, mixing, out=mixing)
+    mixing *= _epsilon
+
+    # t ((p - e) / p0) ** -kappa (t / t_l) ** (0.28 r)
+    #   exp(r (1 + 0.448 r) (3036 / t_l - 1.78)), as a single exponential
+    np.subtract(p, vapor, out=theta)
+    theta /= _reference_pressure
+    np.log(theta, out=theta)
+    theta *= -_kappa
+    np.divide(t, lcl, out=work)
+    np.log(work, out=work)
+    work *= mixing
+    work *= 0.28
+    theta += work
+    np.divide(3036, lcl, out=lcl)
+    lcl -= 1.78
+    lcl *= mixing
+    mixing *= 0.448
+    mixing += 1
+    lcl *= mixing
+    theta += lcl
+    np.exp(theta, out=theta)
+    theta *= t
+
+
+@preprocess_and_wrap(
+    wrap_like="temperature", broadcast=("pressure", "temperature", "dewpoint")
+)
+def equivalent_potential_temperature(pressure, temperature, dewpoint):
+    """Calculate the equivalent potential temperature, as MetPy does (Bolton, 1980).
+
+    Parameters
+    ----------
+    pressure : `pint.Quantity` or `xarray.DataArray`
+    temperature : `pint.Quantity` or `xarray.DataArray`
+    dewpoint : `pint.Quantity` or `xarray.DataArray`
+
+    Returns
+    -------
+    `pint.Quantity` or `xarray.DataArray`
+        Equivalent potential temperature, in kelvin
+
+    """
+    p = _magnitude(pressure, "hPa")
+    t = _magnitude(temperature, "K")
+    td = _magnitude(dewpoint, "K")
+    theta = _apply(_equivalent_potential_temperature, (p, t, td), (t, td), buffers=3)
+    return units.Quantity(theta, "K")
@@ -0,0 +1,451 @@
+"""Structured tracing of where the time goes when making a figure.
+
+A span times one step (fetching data, parsing it, a calculation, drawing or saving) and
+records when it started and how long it took, along with what it read and produced: the
+bytes the process read in the meantime, the shape, type and size of the result, and the
+peak memory of the process at the end. Wrap code in `span`, or functions in `traced`::
+
+    with trace.span("regrid", category="compute") as s:
+        ...
+        s.set(points=len(points))
+
+Spans cost next to nothing unless tracing is turned on, which `install` does when the
+``BAMS_TRACE`` environment variable names the file to write spans to. `install` also wraps
+the calls the figures spend their time in (see ``targets``), as their modules are imported:
+Siphon's remote access, opening and parsing data, the heavy calculations, contour labelling
+and ``savefig``, so that a figure script gets a timeline of its run without any changes.
+``python -m bams.trace run script.py`` runs a script that way, and `bams.pool` and
+`bams.build` do so for every figure when ``BAMS_TRACE`` is set.
+
+Spans are written as Chrome trace events (viewable in ``chrome://tracing`` or Perfetto):
+
+* to a file ending in ``.json``, all at once at exit, as a Chrome trace. Each process adds
+  its spans to those already in the file, holding a lock on it, so that several processes
+  (e.g. the figures of a build) can share a file.
+* to any other file, one JSON object per line as each span ends. Lines are appended, so
+  several processes can share a file as well.
+  ``python -m bams.trace chrome`` turns such a file into a Chrome trace, and
+  ``python -m bams.trace summary`` sums up the time spent in each kind of span.
+
+To leave tracing on in production, set ``BAMS_TRACE_SAMPLE`` to the fraction of runs to
+trace; the others are not traced at all.
+"""
+
+import argparse
+import atexit
+import fcntl
+import functools
+import importlib.abc
+import inspect
+import json
+import os
+import random
+import resource
+import runpy
+import sys
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+# Calls wrapped by `install`, by module: (category, attribute path within the module)
+targets = {
+    "siphon.catalog": [("fetch", "Dataset.remote_access"), ("fetch", "Dataset.remote_open")],
+    "siphon.ncss": [("fetch", "NCSS.get_data")],
+    "siphon.simplewebservice.wyoming": [("fetch", "WyomingUpperAir.request_data")],
+    "bams.remote": [("fetch", "open_subset"), ("fetch", "open_remote_dataset")],
+    "bams.store": [("fetch", "open_dataset"), ("decode", "ingest")],
+    "xarray": [("fetch", "open_dataset")],
+    "cartopy.feature": [("fetch", "NaturalEarthFeature.geometries")],
+    "metpy.xarray": [("decode", "MetPyDatasetAccessor.parse_cf")],
+    "bams.metar": [("decode", "read_metars")],
+    "geopandas": [("decode", "read_file")],
+    "metpy.calc": [
+        ("compute", "cape_cin"),
+        ("compute", "equivalent_potential_temperature"),
+        ("compute", "potential_temperature"),
+        ("compute", "relative_humidity_from_specific_humidity"),
+        ("compute", "wind_speed"),
+    ],
+    "bams.cross": [("compute", "cross_section"), ("compute", "terrain_pressure")],
+    "bams.smoothing": [("compute", "smooth_gaussian")],
+    "bams.sounding": [("compute", "parcel_profile"), ("compute", "analyze_soundings")],
+    "bams.stations": [("compute", "thin_stations")],
+    "bams.thermo": [
+        ("compute", "equivalent_potential_temperature"),
+        ("compute", "potential_temperature"),
+        ("compute", "relative_humidity_from_specific_humidity"),
+    ],
+    "matplotlib.contour": [("render", "ContourLabeler.clabel")],
+    "metpy.plots.declarative": [("render", "PanelContainer.draw")],
+    "matplotlib.figure": [("save", "Figure.savefig")],
+}
+
+_writer = None
+_patched = []
+_finder = None
+
+
+def _read_bytes():
+    """Bytes read by this process so far, where the platform tells."""
+    try:
+        with open("/proc/self/io", "rb") as f:
+            for line in f:
+                if line.startswith(b"rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def describe(value):
+    """Describe the shape, type and size of an array-like result, as span arguments."""
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    info = {}
+    if hasattr(value, "data_vars"):
+        info["variables"] = len(value.data_vars)
+        info["dims"] = {str(name): size for name, size in value.sizes.items()}
+    elif hasattr(value, "shape"):
+        info["shape"] = [int(size) for size in value.shape]
+        if hasattr(value, "dtype"):
+            info["dtype"] = str(value.dtype)
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, (int, float)):
+        info["nbytes"] = int(nbytes)
+    return info
+
+
+class _NoSpan:
+    """Stand-in for `Span` when tracing is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_no_span = _NoSpan()
+
+
+class Span:
+    """A timed step, written when it ends. Create spans with `span`."""
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def set(self, **args):
+        """Add arguments to the span, such as the size of what it produced."""
+        self.args.update(args)
+
+    def __enter__(self):
+        self._read = _read_bytes()
+        self._ts = time.time_ns() // 1000
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = (time.perf_counter_ns() - self._start) / 1000
+        read = _read_bytes()
+        if read is not None and self._read is not None:
+            self.args["read_bytes"] = read - self._read
+        self.args["peak_rss_mb"] = round(_peak_rss_mb(), 1)
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+
+        writer = _writer
+        if writer is not None:
+            writer.write(
+                {
+                    "name": self.name,
+                    "cat": self.category,
+                    "ph": "X",
+                    "ts": self._ts,
+                    "dur": duration,
+                    "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                    "args": self.args,
+                }
+            )
+        return False
+
+
+def span(name, category="", **args):
+    """Time a block of code, as a context manager.
+
+    Parameters
+    ----------
+    name : str
+        Name of the step
+    category : str, optional
+        Kind of step, such as ``"fetch"``, ``"decode"``, ``"compute"``, ``"render"`` or
+        ``"save"``
+    args
+        Anything else to record with the span, which must be serializable to JSON
+
+    Returns
+    -------
+    `Span`
+        Use its ``set`` method to add arguments before the block ends
+
+    """
+    if _writer is None:
+        return _no_span
+    return Span(name, category, args)
+
+
+def traced(name=None, category=""):
+    """Decorate a function to time each call in a span, describing what it returns."""
+
+    def decorate(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _writer is None:
+                return func(*args, **kwargs)
+            with Span(label, category, {}) as s:
+                result = func(*args, **kwargs)
+                s.set(**describe(result))
+                return result
+
+        wrapper.__wrapped_by_trace__ = True
+        return wrapper
+
+    return decorate
+
+
+class _JsonLinesWriter:
+    def __init__(self, path):
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def write(self, event):
+        # One write per line, so that lines from several processes do not interleave
+        os.write(self._fd, (json.dumps(event, default=str) + "\n").encode("utf-8"))
+
+    def close(self):
+        os.close(self._fd)
+
+
+class _ChromeWriter:
+    def __init__(self, path):
+        self._path = path
+        self._events = []
+
+    def write(self, event):
+        self._events.append(event)
+
+    def close(self):
+        # Workers of a pool or build end at the same time, so merge with their spans under a
+        # lock rather than overwriting them
+        with open(self._path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            text = f.read()
+            events = json.loads(text)["traceEvents"] if text.strip() else []
+            f.seek(0)
+            f.truncate()
+            json.dump({"traceEvents": events + self._events}, f, default=str)
+
+
+def _patch(module, category, attribute):
+    """Wrap a function or method of a module in a span."""
+    *path, name = attribute.split(".")
+    owner = module
+    for part in path:
+        owner = getattr(owner, part, None)
+    if owner is None or not hasattr(owner, name):
+        return
+    original = inspect.getattr_static(owner, name)
+    func = getattr(original, "__func__", original)
+    if getattr(func, "__wrapped_by_trace__", False):
+        return
+
+    wrapper = traced(f"{module.__name__}.{attribute}", category)(func)
+    if isinstance(original, (classmethod, staticmethod)):
+        wrapper = type(original)(wrapper)
+    setattr(owner, name, wrapper)
+    _patched.append((owner, name, original))
+
+
+def _patch_module(module):
+    for category, attribute in targets.get(module.__name__, []):
+        _patch(module, category, attribute)
+
+
+class _PatchingLoader(importlib.abc.Loader):
+    """Wrap the targets of a module as soon as it has been imported."""
+
+    def __init__(self, loader):
+        self.loader = loader
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        self.loader.exec_module(module)
+        _patch_module(module)
+
+
+class _PatchingFinder(importlib.abc.MetaPathFinder):
+    """Find the modules with targets as usual, but load them with `_PatchingLoader`."""
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname not in targets:
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _PatchingLoader(spec.loader)
+                return spec
+        return None
+
+
+def install(path=None, sample=None, process_name=None):
+    """Turn tracing on, writing spans to a file, and wrap the calls in ``targets``.
+
+    Parameters
+    ----------
+    path : str or path-like, optional
+        File to write spans to, a Chrome trace if it ends in ``.json`` and JSON lines
+        otherwise. Defaults to ``BAMS_TRACE``; without either, tracing stays off.
+    sample : float, optional
+        Probability of tracing this run. Defaults to ``BAMS_TRACE_SAMPLE``, or 1.
+    process_name : str, optional
+        Name of this process in the trace. Defaults to the name of the running script.
+
+    Returns
+    -------
+    bool
+        Whether this run is traced
+
+    """
+    global _writer, _finder
+    if _writer is not None:
+        return True
+
+    path = path or os.environ.get("BAMS_TRACE")
+    if not path:
+        return False
+    if sample is None:
+        sample = float(os.environ.get("BAMS_TRACE_SAMPLE", 1))
+    if random.random() >= sample:
+        return False
+
+    path = Path(path)
+    _writer = _ChromeWriter(path) if path.suffix == ".json" else _JsonLinesWriter(path)
+    _writer.write(
+        {
+            "name": "process_name",
+            "ph": "M",
+            "pid": os.getpid(),
+            "args": {"name": process_name or Path(sys.argv[0]).name or "python"},
+        }
+    )
+    atexit.register(uninstall)
+
+    for name in targets:
+        if name in sys.modules:
+            _patch_module(sys.modules[name])
+    _finder = _PatchingFinder()
+    sys.meta_path.insert(0, _finder)
+    return True
+
+
+def uninstall():
+    """Turn tracing off, writing out any spans not yet written, and unwrap the calls."""
+    global _writer, _finder
+    if _finder is not None:
+        sys.meta_path.remove(_finder)
+        _finder = None
+    while _patched:
+        owner, name, original = _patched.pop()
+        setattr(owner, name, original)
+    if _writer is not None:
+        writer, _writer = _writer, None
+        writer.close()
+        atexit.unregister(uninstall)
+
+
+def read_events(path):
+    """Read the spans written to a file, in either format."""
+    with open(path) as f:
+        if Path(path).suffix == ".json":
+            return json.load(f)["traceEvents"]
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run(script, args=()):
+    """Run a script from its own directory with tracing on, as a span of its own."""
+    script = Path(script).resolve()
+    os.chdir(script.parent)
+    sys.argv = [script.name, *args]
+    sys.path[0] = str(script.parent)
+    install(process_name=script.name)
+    with span(script.name, category="run"):
+        runpy.run_path(str(script), run_name="__main__")
+
+
+def summary(events):
+    """Print the number of spans of each name, and the total and longest time in them."""
+    totals = defaultdict(list)
+    for event in events:
+        if event.get("ph") == "X":
+            totals[(event.get("cat", ""), event["name"])].append(event["dur"] / 1e6)
+
+    print(f"{'category':<9} {'span':<60} {'count':>6} {'total (s)':>10} {'max (s)':>9}")
+    for (category, name), durations in sorted(totals.items(), key=lambda item: -sum(item[1])):
+        print(
+            f"{category:<9} {name[-60:]:<60} {len(durations):6d} {sum(durations):10.3f}"
+            f" {max(durations):9.3f}"
+        )
+
+
+def main():
+    """Run a script with tracing on, or summarize or convert a trace."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("run", help="run a script with tracing on")
+    command.add_argument("-o", "--output", help="file to write spans to (default BAMS_TRACE)")
+    command.add_argument("script")
+    command.add_argument("args", nargs=argparse.REMAINDER)
+
+    command = commands.add_parser("summary", help="sum up the time spent in each kind of span")
+    command.add_argument("trace")
+
+    command = commands.add_parser("chrome", help="convert JSON lines to a Chrome trace")
+    command.add_argument("trace")
+    command.add_argument("output")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        if args.output:
+            os.environ["BAMS_TRACE"] = args.output
+        elif "BAMS_TRACE" not in os.environ:
+            parser.error("give a file to write spans to, with -o or BAMS_TRACE")
+        run(args.script, args.args)
+    elif args.command == "summary":
+        summary(read_events(args.trace))
+    else:
+        with open(args.output, "w") as f:
+            json.dump({"traceEvents": read_events(args.trace)}, f)
+
+
+if __name__ == "__main__":
+    main()
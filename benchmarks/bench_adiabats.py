@@ -0,0 +1,75 @@
+"""Measure the moist adiabat table of `bams.adiabats`: its cost, its error, and what it saves.
+
+Run from this directory: ``python bench_adiabats.py``. The error is measured against a fine
+numerical integration at random points of the table, and the savings on lifting fig1's kind
+of parcel and on drawing a Skew-T's moist adiabats, compared with MetPy.
+"""
+
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, "..")
+
+import matplotlib
+
+matplotlib.use("agg")
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+import metpy.calc as mpcalc
+from bams import adiabats, sounding
+from metpy.plots import SkewT
+from metpy.units import units
+
+
+def best_of(func, repeat=5):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def table_errors(table, rng, count=100000):
+    """Compare lookups with integrating from 1000 hPa in small steps."""
+    theta_w = rng.uniform(table.theta_w[0], table.theta_w[-1], count)
+    log_p = rng.uniform(table.log_pressure[-1], table.log_pressure[0], count)
+    expected = adiabats._integrate(theta_w, np.log(1000.0), log_p - np.log(1000.0), 2000)
+    error = np.abs(table.temperature_at(np.exp(log_p), theta_w) - expected)
+    return error.max(), error[log_p > np.log(100.0)].max()
+
+
+if __name__ == "__main__":
+    os.environ["BAMS_ADIABATS_CACHE_DIR"] = tempfile.mkdtemp()
+    rng = np.random.default_rng(0)
+
+    start = timeit.default_timer()
+    table = adiabats.moist_adiabat_table()
+    t_build = timeit.default_timer() - start
+
+    def load():
+        adiabats.moist_adiabat_table.cache_clear()
+        return adiabats.moist_adiabat_table()
+
+    t_load = best_of(load)
+    print(f"table: built in {t_build:.3f} s, loaded in {t_load * 1000:.2f} ms")
+
+    worst, below_100 = table_errors(table, rng)
+    print(f"max error: {worst:.2e} K, {below_100:.2e} K below 100 hPa")
+
+    p = units.Quantity(np.linspace(1000, 100, 80), "hPa")
+    t, td = units.Quantity(25, "degC"), units.Quantity(18, "degC")
+    t_metpy = best_of(lambda: mpcalc.parcel_profile(p, t, td))
+    t_table = best_of(lambda: sounding.parcel_profile(p, t, td))
+    diff = np.abs(mpcalc.parcel_profile(p, t, td) - sounding.parcel_profile(p, t, td)).max()
+    print(
+        f"parcel profile: metpy {t_metpy * 1000:.2f} ms, table {t_table * 1000:.2f} ms,"
+        f" max diff {diff.m:.2e} K"
+    )
+
+    fig = plt.figure(figsize=(12, 12))
+    skew = SkewT(fig, rotation=45)
+    skew.ax.set_ylim(1000, 100)
+    skew.ax.set_xlim(-40, 60)
+    t_metpy = best_of(skew.plot_moist_adiabats)
+    t_table = best_of(lambda: adiabats.plot_moist_adiabats(skew))
+    print(f"moist adiabats: metpy {t_metpy * 1000:.2f} ms, table {t_table * 1000:.2f} ms")
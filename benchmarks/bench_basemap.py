@@ -0,0 +1,89 @@
+"""Compare drawing fig6's map layers with MetPy's MapPanel and with the basemap cache.
+
+Run from this directory: ``python bench_basemap.py [dpi]``. Only the map is drawn (fig6's
+area, projection, layers and size, with no plots), as it would be for every product on the
+same map. The cached layers are timed against an empty cache, then from the cache on disk
+only (as in a new process), then from memory, and finally drawn from cached images.
+"""
+
+import io
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, "..")
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from bams import basemap
+from metpy.plots import MapPanel, PanelContainer
+
+# Map of fig6
+area = [-120, -75, 25, 50]
+layers = ["lakes", "land", "ocean", "states", "coastline", "borders"]
+size = (18, 9)
+
+
+def best_of(func, repeat=3):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def render(panel_class, dpi, **traits):
+    panel = panel_class()
+    panel.area = area
+    panel.projection = "lcc"
+    panel.layers = layers
+    panel.title = " "
+    for name, value in traits.items():
+        setattr(panel, name, value)
+
+    pc = PanelContainer()
+    pc.size = size
+    pc.panels = [panel]
+    buffer = io.BytesIO()
+    pc.save(buffer, format="png", dpi=dpi)
+    plt.close(pc.figure)
+    buffer.seek(0)
+    return plt.imread(buffer)
+
+
+if __name__ == "__main__":
+    dpi = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+    # Also reads and caches the shapefiles, so that none of the timings below include that
+    expected = render(MapPanel, dpi)
+    t_metpy = best_of(lambda: render(MapPanel, dpi))
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        os.environ["BAMS_BASEMAP_CACHE_DIR"] = cache_dir
+        t_cold = timeit.timeit(lambda: render(basemap.MapPanel, dpi), number=1)
+
+        def from_disk():
+            basemap._geometry_cache.clear()
+            return render(basemap.MapPanel, dpi)
+
+        t_disk = best_of(from_disk)
+        t_warm = best_of(lambda: render(basemap.MapPanel, dpi))
+        cached = render(basemap.MapPanel, dpi)
+
+        render(basemap.MapPanel, dpi, rasterize_layers=True)
+        t_raster = best_of(lambda: render(basemap.MapPanel, dpi, rasterize_layers=True))
+        raster = render(basemap.MapPanel, dpi, rasterize_layers=True)
+
+    def differing(image):
+        return (np.abs(image - expected).max(axis=-1) > 0.25).mean()
+
+    print(f"map {expected.shape[1]}x{expected.shape[0]} pixels, layers {', '.join(layers)}")
+    print(f"MetPy MapPanel:          {t_metpy:.3f} s")
+    print(f"cached (cold):           {t_cold:.3f} s")
+    print(f"cached (from disk):      {t_disk:.3f} s")
+    print(f"cached (from memory):    {t_warm:.3f} s")
+    print(f"cached images:           {t_raster:.3f} s")
+    print(f"pixels differing from MetPy: {differing(cached):.2%} (vector),")
+    print(f"                             {differing(raster):.2%} (images)")
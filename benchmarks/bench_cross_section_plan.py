@@ -0,0 +1,101 @@
+"""Compare repeated `metpy.interpolate.cross_section` calls with a shared cross section plan.
+
+Run from this directory: ``python bench_cross_section_plan.py``. Before timing, the plan's
+results (values and coordinates) are checked against MetPy's on synthetic grids covering the
+cases fig3's grid does not: a longitude-latitude grid in [0, 360) and a projected grid with 2D
+latitude and longitude.
+"""
+
+import sys
+import timeit
+
+sys.path.insert(0, "..")
+
+import numpy as np
+import xarray as xr
+
+import metpy.interpolate
+from bams.cross import cross_section
+
+# get_test_data is used for internal MetPy testing and not supported publicly
+from metpy.cbook import get_test_data
+
+start = (37.0, -105.0)
+end = (35.5, -65.0)
+
+
+def best_of(func, repeat=3):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def check(data):
+    """Check that the plan matches `metpy.interpolate.cross_section`, coordinates included."""
+    expected = metpy.interpolate.cross_section(data, start, end)
+    result = cross_section(data, start, end)
+    assert set(result.coords) == set(expected.coords)
+    for name in [*result.coords, *getattr(expected, "data_vars", [])]:
+        if name != "metpy_crs":
+            np.testing.assert_allclose(result[name].values, expected[name].values, rtol=1e-10)
+
+
+def synthetic_grids():
+    """Make a longitude-latitude grid in [0, 360) and a projected one with 2D lat/lon."""
+    rng = np.random.default_rng(0)
+    isobaric = ("isobaric", [1000.0, 850.0, 700.0, 500.0], {"units": "hPa"})
+
+    lon = np.arange(200.0, 320.0)
+    lat = np.arange(20.0, 60.0)
+    geographic = xr.DataArray(
+        rng.normal(280, 10, (4, lat.size, lon.size)),
+        dims=("isobaric", "lat", "lon"),
+        coords={
+            "isobaric": isobaric,
+            "lat": ("lat", lat, {"units": "degrees_north"}),
+            "lon": ("lon", lon, {"units": "degrees_east"}),
+        },
+        attrs={"units": "K"},
+        name="temperature",
+    ).metpy.assign_crs(grid_mapping_name="latitude_longitude")
+
+    x = np.linspace(-3e6, 3e6, 60)
+    y = np.linspace(-1.5e6, 2e6, 40)
+    projected = (
+        xr.DataArray(
+            rng.normal(280, 10, (4, y.size, x.size)),
+            dims=("isobaric", "y", "x"),
+            coords={
+                "isobaric": isobaric,
+                "y": ("y", y, {"units": "m", "standard_name": "projection_y_coordinate"}),
+                "x": ("x", x, {"units": "m", "standard_name": "projection_x_coordinate"}),
+            },
+            attrs={"units": "K"},
+            name="temperature",
+        )
+        .metpy.assign_crs(
+            grid_mapping_name="lambert_conformal_conic",
+            standard_parallel=25.0,
+            longitude_of_central_meridian=-95.0,
+            latitude_of_projection_origin=25.0,
+            earth_radius=6371229.0,
+        )
+        .metpy.assign_latitude_longitude()
+    )
+    return geographic, projected
+
+
+if __name__ == "__main__":
+    for grid in synthetic_grids():
+        check(grid)
+
+    data = xr.open_dataset(get_test_data("narr_example.nc", False))
+    data = data.metpy.parse_cf().squeeze()
+    check(data)
+
+    # Simulate slicing the same transect through many forecast hours of the same grid
+    print(f"{'datasets':>8} {'metpy (s)':>10} {'plan (s)':>10} {'speedup':>8}")
+    for count in (1, 10, 50):
+        t_metpy = best_of(
+            lambda: [metpy.interpolate.cross_section(data, start, end) for _ in range(count)]
+        )
+        t_plan = best_of(lambda: [cross_section(data, start, end) for _ in range(count)])
+        print(f"{count:8d} {t_metpy:10.4f} {t_plan:10.4f} {t_metpy / t_plan:8.1f}")
@@ -0,0 +1,178 @@
+"""Compare fig3's cross section of a long time series in memory and streamed to disk.
+
+Run from this directory: ``python bench_cross_series.py [times] [processes]``. A synthetic
+NARR-like series (temperature, specific humidity and geopotential height on NARR's grid
+and levels, every 3 hours) is written to ``output/series.nc`` the first time. Its cross
+section, terrain pressure, potential temperature and relative humidity along fig3's path
+are computed by `bams.series.cross_section_series`, streaming to ``output/series``, and
+then by loading the whole series and running fig3's workflow on it. Peak memory is the
+resident size of the largest worker, and of this process.
+"""
+
+import resource
+import shutil
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, "..")
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from bams import thermo
+from bams.cross import cross_section, terrain_pressure
+from bams.derived import DerivedFields
+from bams.series import cross_section_series, open_series
+
+series_path = Path("output/series.nc")
+start = (37.0, -105.0)
+end = (35.5, -65.0)
+
+
+def make_series(times):
+    """Write a series with random values around standard profiles on NARR's grid.
+
+    Times are written one at a time, so that the series need not fit in memory.
+    """
+    import netCDF4
+
+    rng = np.random.default_rng(0)
+    x = np.arange(349) * 32463.0 - 5632642.0
+    y = np.arange(277) * 32463.0 - 4612000.0
+    pressure = np.array(
+        [1000, 975, 950, 925, 900, 875, 850, 825, 800, 775, 750, 725, 700, 650, 600]
+        + [550, 500, 450, 400, 350, 300, 275, 250, 225, 200, 175, 150, 125, 100],
+        dtype=float,
+    )
+    depth = (1000 - pressure)[:, None, None]
+    shape = (pressure.size, y.size, x.size)
+    dates = pd.date_range("1987-04-01", periods=times, freq="3h")
+
+    def fields():
+        return {
+            "Temperature": (290 - 0.065 * depth + rng.normal(size=shape), "K"),
+            "Specific_humidity": (
+                0.01 * np.exp(-depth / 300) * rng.uniform(0.5, 1, size=shape),
+                "kg/kg",
+            ),
+            "Geopotential_height": (110 + 8.3 * depth + rng.normal(size=shape), "m"),
+        }
+
+    first = xr.Dataset(
+        {
+            name: (
+                ("time", "isobaric", "y", "x"),
+                value[np.newaxis].astype(np.float32),
+                {"units": unit, "grid_mapping": "Lambert_Conformal"},
+            )
+            for name, (value, unit) in fields().items()
+        },
+        coords={
+            "time": dates[:1],
+            "isobaric": ("isobaric", pressure, {"units": "hPa"}),
+            "x": ("x", x, {"units": "m"}),
+            "y": ("y", y, {"units": "m"}),
+        },
+    ).assign(
+        Lambert_Conformal=(
+            (),
+            0,
+            {
+                "grid_mapping_name": "lambert_conformal_conic",
+                "standard_parallel": 50.0,
+                "longitude_of_central_meridian": -107.0,
+                "latitude_of_projection_origin": 50.0,
+                "earth_shape": "spherical",
+                "earth_radius": 6367470.21484375,
+            },
+        )
+    )
+    series_path.parent.mkdir(parents=True, exist_ok=True)
+    first.to_netcdf(series_path, unlimited_dims=["time"])
+
+    with netCDF4.Dataset(series_path, "a") as nc:
+        time_var = nc.variables["time"]
+        for index, date in enumerate(dates[1:], start=1):
+            time_var[index] = netCDF4.date2num(
+                date.to_pydatetime(), time_var.units, time_var.calendar
+            )
+            for name, (value, _) in fields().items():
+                nc.variables[name][index] = value.astype(np.float32)
+
+
+def open_data():
+    return xr.open_dataset(series_path).metpy.parse_cf()
+
+
+def terrain():
+    topo = xr.open_dataset("../hgt.sfc.nc")
+    return topo.metpy.parse_cf("hgt").squeeze()
+
+
+def derived_fields():
+    fields = DerivedFields()
+    fields.register(
+        "Potential_temperature", thermo.potential_temperature, "isobaric", "Temperature"
+    )
+    fields.register(
+        "Relative_humidity",
+        thermo.relative_humidity_from_specific_humidity,
+        "isobaric",
+        "Temperature",
+        "Specific_humidity",
+    )
+    return fields
+
+
+def peak_mb(who):
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+if __name__ == "__main__":
+    times = int(sys.argv[1]) if len(sys.argv) > 1 else 48
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    current = False
+    if series_path.exists():
+        # Close the file before it is written again
+        with xr.open_dataset(series_path) as data:
+            current = data.sizes["time"] == times
+    if not current:
+        make_series(times)
+    topo = terrain()
+
+    shutil.rmtree("output/series", ignore_errors=True)
+    before = time.perf_counter()
+    cross_section_series(
+        open_data,
+        start,
+        end,
+        "output/series",
+        terrain=topo,
+        fields=derived_fields(),
+        processes=processes,
+    )
+    t_streamed = time.perf_counter() - before
+    streamed = open_series("output/series")
+
+    before = time.perf_counter()
+    data = open_data().load()
+    cross = cross_section(data, start, end)
+    cross["topo_pressure"] = terrain_pressure(
+        cross["Geopotential_height"], cross_section(topo, start, end)
+    )
+    cross = derived_fields().assign(cross).load()
+    t_memory = time.perf_counter() - before
+
+    for name in ["Relative_humidity", "topo_pressure"]:
+        expected = cross[name].values
+        assert np.isfinite(expected).any(), f"{name} is all NaN; the path misses the grid"
+        actual = streamed[name].transpose(*cross[name].dims).values
+        assert np.allclose(actual, expected, equal_nan=True), name
+
+    size = series_path.stat().st_size / 2**20
+    print(f"{times} times, {size:.0f} MB")
+    print(f"in memory: {t_memory:8.2f} s {peak_mb(resource.RUSAGE_SELF):8.0f} MB")
+    print(f"streamed:  {t_streamed:8.2f} s {peak_mb(resource.RUSAGE_CHILDREN):8.0f} MB")
@@ -0,0 +1,100 @@
+"""Compare rendering fig2's satellite layer with and without decimating the image first.
+
+Run from this directory: ``python bench_decimate_imagery.py [dpi]``. The GOES image is
+fetched the way fig2 fetches it (through the remote data cache). Each variant renders in
+its own process, so that peak memory is measured separately; both images are saved under
+``output/`` here and their RMS difference is reported along with the timings.
+"""
+
+import json
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, "..")
+
+import cartopy.crs as ccrs
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.testing.compare import calculate_rms
+from PIL import Image
+
+from bams import remote
+from bams.imagery import decimate_to_axes
+from siphon.catalog import TDSCatalog
+
+satellite_catalog = "https://thredds.ucar.edu/thredds/catalog/satellite/goes/east/products/CloudAndMoistureImagery/CONUS/Channel02/current/catalog.xml"
+
+# Extent, padding and (approximately) projection used by fig2
+extent = (-113, -70, 25, 45)
+request_bbox = (extent[0] - 5, extent[1] + 5, extent[2] - 5, extent[3] + 5)
+map_crs = ccrs.LambertConformal(central_longitude=-95, standard_parallels=(25, 25))
+
+
+def render(path, dpi, decimate):
+    remote.install()
+    satdata = remote.open_subset(
+        TDSCatalog(satellite_catalog).datasets[0], ["Sectorized_CMI"], bbox=request_bbox
+    )
+    cmi = satdata.metpy.parse_cf("Sectorized_CMI").load()
+
+    start = time.perf_counter()
+    fig = plt.figure(figsize=(18, 9))
+    ax = fig.add_subplot(projection=map_crs)
+    ax.set_extent(extent)
+    if decimate:
+        cmi = decimate_to_axes(cmi, ax, dpi=dpi)
+
+    image_extent = (cmi.metpy.x[0], cmi.metpy.x[-1], cmi.metpy.y[0], cmi.metpy.y[-1])
+    ax.imshow(
+        cmi,
+        extent=image_extent,
+        origin="lower",
+        cmap="Greys_r",
+        regrid_shape=6000,
+        transform=cmi.metpy.cartopy_crs,
+    )
+    fig.savefig(path, dpi=dpi, bbox_inches="tight")
+
+    return {
+        "pixels": int(cmi.size),
+        "seconds": time.perf_counter() - start,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def read_rgb(path):
+    return np.asarray(Image.open(path).convert("RGB"), dtype=float)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        print(json.dumps(render(sys.argv[1], int(sys.argv[2]), sys.argv[3] == "decimate")))
+        sys.exit()
+
+    dpi = sys.argv[1] if len(sys.argv) > 1 else "150"
+    Path("output").mkdir(exist_ok=True)
+
+    print(f"{'variant':<10} {'pixels':>12} {'render (s)':>11} {'peak RSS (MB)':>14}")
+    for variant in ("full", "decimate"):
+        output = subprocess.run(
+            [sys.executable, __file__, f"output/imagery_{variant}.png", dpi, variant],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        result = json.loads(output.splitlines()[-1])
+        print(
+            f"{variant:<10} {result['pixels']:12d} {result['seconds']:11.2f}"
+            f" {result['peak_rss_mb']:14.1f}"
+        )
+
+    full = read_rgb("output/imagery_full.png")
+    rms = calculate_rms(full, read_rgb("output/imagery_decimate.png"))
+    print(f"RMS difference: {rms:.3f} (of 255)")
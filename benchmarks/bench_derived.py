@@ -0,0 +1,88 @@
+"""Compare computing fig5's wind speed eagerly on every level and lazily for one level.
+
+Run from this directory: ``python bench_derived.py``. Fig5 computes the wind speed of the
+whole GFS subset and then plots only 300 hPa; with `bams.derived.DerivedFields`, only the
+300 hPa level of the plotted area is computed. Both are timed, and their peak memory traced,
+from the opened dataset to the values of the plotted level, for ``GFS_test.nc`` and for a
+synthetic global 0.25 degree grid with the 26 levels of full-resolution GFS output.
+"""
+
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, "..")
+
+import numpy as np
+import xarray as xr
+
+import metpy.calc as mpcalc
+from bams.derived import DerivedFields
+from metpy.cbook import get_test_data
+from metpy.units import units
+
+u_name = "u-component_of_wind_isobaric"
+v_name = "v-component_of_wind_isobaric"
+level = 300 * units.hPa
+
+
+def best_of(func, repeat=3):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def peak_mb(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def gfs_test():
+    data = xr.open_dataset(get_test_data("GFS_test.nc", False)).metpy.parse_cf().squeeze()
+    return data.metpy.sel(lat=slice(70, 10), lon=slice(360 - 150, 360 - 55)).load()
+
+
+def full_resolution():
+    levels = [1000, 975, 950, 925, 900, 850, 800, 750, 700, 650, 600, 550, 500]
+    levels += [450, 400, 350, 300, 250, 200, 150, 100, 70, 50, 30, 20, 10]
+    lat = np.arange(90, -90.1, -0.25)
+    lon = np.arange(0, 360, 0.25)
+    rng = np.random.default_rng(0)
+    shape = (len(levels), lat.size, lon.size)
+    attrs = {"units": "m/s"}
+    data = xr.Dataset(
+        {
+            u_name: (("isobaric", "lat", "lon"), rng.normal(size=shape, scale=20), attrs),
+            v_name: (("isobaric", "lat", "lon"), rng.normal(size=shape, scale=20), attrs),
+        },
+        coords={
+            "isobaric": ("isobaric", np.array(levels, dtype=float), {"units": "hPa"}),
+            "lat": ("lat", lat, {"units": "degrees_north"}),
+            "lon": ("lon", lon, {"units": "degrees_east"}),
+        },
+    )
+    return data.metpy.parse_cf()
+
+
+def eager(ds):
+    ds = ds.copy()
+    ds["wind_speed"] = mpcalc.wind_speed(ds[u_name], ds[v_name])
+    return ds["wind_speed"].metpy.sel(vertical=level).values
+
+
+def lazy(ds):
+    fields = DerivedFields().register("wind_speed", mpcalc.wind_speed, u_name, v_name)
+    ds = fields.assign(ds)
+    return ds["wind_speed"].metpy.sel(vertical=level).values
+
+
+if __name__ == "__main__":
+    print(f"{'data':<16} {'':<6} {'time (s)':>9} {'peak (MB)':>10}")
+    for name, open_data in [("GFS_test.nc", gfs_test), ("0.25 deg global", full_resolution)]:
+        ds = open_data()
+        assert np.allclose(eager(ds), lazy(ds))
+        for label, func in [("eager", eager), ("lazy", lazy)]:
+            seconds = best_of(lambda: func(ds))
+            print(f"{name:<16} {label:<6} {seconds:9.3f} {peak_mb(lambda: func(ds)):10.1f}")
@@ -0,0 +1,111 @@
+"""Compare drawing many polygons with MetPy's PlotGeometry and with `bams.geometry`.
+
+Run from this directory: ``python bench_geometry.py [polygons] [dpi]``. Synthetic zones
+(jagged polygons of a few hundred vertices, like county or forecast zones, scattered over
+North America and the oceans around it, defaulting to 12000) are drawn on fig6's map and
+size, with no map layers. `bams.geometry.PlotGeometry` is timed with an empty cache and from
+the cache, against MetPy's, along with the number of vertices each draws.
+"""
+
+import io
+import sys
+import timeit
+
+sys.path.insert(0, "..")
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+import numpy as np
+import shapely.geometry as sgeom
+
+import metpy.plots
+from bams import geometry
+from metpy.plots import MapPanel, PanelContainer
+
+# Map of fig6
+area = [-120, -75, 25, 50]
+size = (18, 9)
+colors = ["#C1E9C1", "#66A366", "#FFE066", "#FFA366", "#E06666", "#EE99EE"]
+
+
+def make_zones(count, vertices=300, seed=0):
+    """Make jagged polygons of about a degree across, at random places."""
+    rng = np.random.default_rng(seed)
+    lon = rng.uniform(-170, -40, count)
+    lat = rng.uniform(5, 75, count)
+    angle = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+    radius = 0.5 * (1 + 0.05 * rng.standard_normal((count, vertices)))
+    rings = np.stack(
+        [
+            lon[:, None] + radius * np.cos(angle) / np.cos(np.radians(lat[:, None])),
+            lat[:, None] + radius * np.sin(angle),
+        ],
+        axis=-1,
+    )
+    return [sgeom.Polygon(ring) for ring in rings]
+
+
+def render(plot_class, zones, dpi, traits=None):
+    geo = plot_class()
+    geo.geometry = zones
+    geo.fill = colors
+    geo.stroke = "black"
+    for name, value in (traits or {}).items():
+        setattr(geo, name, value)
+
+    panel = MapPanel()
+    panel.plots = [geo]
+    panel.area = area
+    panel.projection = "lcc"
+    panel.layers = []
+    panel.title = " "
+
+    pc = PanelContainer()
+    pc.size = size
+    pc.panels = [panel]
+    buffer = io.BytesIO()
+    pc.save(buffer, format="png", dpi=dpi)
+    plt.close(pc.figure)
+    buffer.seek(0)
+    return plt.imread(buffer)
+
+
+def vertices(geometries):
+    count = 0
+    for geom in geometries:
+        parts = geom.geoms if hasattr(geom, "geoms") else [geom]
+        for part in parts:
+            rings = [part.exterior, *part.interiors] if part.geom_type == "Polygon" else [part]
+            count += sum(len(ring.coords) for ring in rings)
+    return count
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 12000
+    dpi = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    zones = make_zones(count)
+
+    before = timeit.default_timer()
+    expected = render(metpy.plots.PlotGeometry, zones, dpi)
+    t_metpy = timeit.default_timer() - before
+
+    before = timeit.default_timer()
+    cold = render(geometry.PlotGeometry, zones, dpi, {"dpi": dpi})
+    t_cold = timeit.default_timer() - before
+    t_warm = min(
+        timeit.repeat(
+            lambda: render(geometry.PlotGeometry, zones, dpi, {"dpi": dpi}), number=1, repeat=3
+        )
+    )
+    drawn = list(geometry._projected_cache.values())
+
+    differing = (np.abs(cold - expected).max(axis=-1) > 0.25).mean()
+    print(f"{count} zones, {vertices(zones)} vertices, map of {cold.shape[1]}x{cold.shape[0]}")
+    print(f"MetPy PlotGeometry:     {t_metpy:8.3f} s")
+    print(f"clipped (cold):         {t_cold:8.3f} s")
+    print(f"clipped (from memory):  {t_warm:8.3f} s")
+    print(f"zones drawn: {len(drawn)}, vertices drawn: {vertices(drawn)}")
+    print(f"pixels differing from MetPy: {differing:.2%}")
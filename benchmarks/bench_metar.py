@@ -0,0 +1,62 @@
+"""Compare the throughput of parsing METARs with MetPy, in parallel and from the cache.
+
+Run from this directory: ``python bench_metar.py``. The most recent hourly METAR file is
+fetched the way fig2 fetches it (through the remote data cache).
+"""
+
+import io
+import os
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, "..")
+
+from bams import remote
+from bams.metar import parse_metars, read_metars
+from metpy.io import parse_metar_file
+from siphon.catalog import TDSCatalog
+
+metar_catalog = "https://thredds.ucar.edu/thredds/catalog/noaaport/text/metar/catalog.xml"
+
+
+def best_of(func, repeat=3):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+if __name__ == "__main__":
+    remote.install()
+    now = datetime.utcnow()
+    year, month = now.year, now.month
+    dataset = TDSCatalog(metar_catalog).datasets.filter_time_nearest(now)
+    text = dataset.remote_open(mode="t").read()
+
+    def metpy_parse():
+        return parse_metar_file(io.StringIO(text), year=year, month=month)
+
+    def cached_read():
+        return read_metars(io.StringIO(text), year=year, month=month)
+
+    expected = metpy_parse()
+    reports = len(expected)
+    print(f"{reports} reports")
+    print(f"{'variant':<14} {'time (s)':>9} {'reports/s':>10}")
+
+    def report(name, seconds):
+        print(f"{name:<14} {seconds:9.3f} {reports / seconds:10.0f}")
+
+    report("metpy", best_of(metpy_parse))
+
+    workers = 1
+    while workers < os.cpu_count():
+        workers = min(workers * 2, os.cpu_count())
+        result = parse_metars(text, year=year, month=month, workers=workers)
+        assert result.equals(expected)
+        seconds = best_of(lambda: parse_metars(text, year=year, month=month, workers=workers))
+        report(f"{workers} processes", seconds)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        os.environ["BAMS_METAR_CACHE_DIR"] = cache_dir
+        cached_read()
+        report("cached", best_of(cached_read))
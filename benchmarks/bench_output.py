@@ -0,0 +1,107 @@
+"""Compare saving a figure at several resolutions with savefig and with `bams.output`.
+
+Run from this directory: ``python bench_output.py [dpi]``. A synthetic map the size of
+fig5's (filled and labelled contours, barbs and station labels, on a Lambert conformal
+projection) is saved as the figures are, to a PNG at print resolution (600 dpi by default)
+and WebP images for screens and thumbnails: with a ``savefig(..., bbox_inches="tight")`` for
+each, and with `bams.output.save`, which renders once. Each runs in its own interpreter so
+that its peak memory can be measured, as the growth of its maximum resident size while
+saving.
+"""
+
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, "..")
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import cartopy.crs as ccrs
+import matplotlib.pyplot as plt
+import numpy as np
+
+from bams import output
+
+
+def make_figure():
+    lon, lat = np.meshgrid(np.linspace(-150, -55, 381), np.linspace(10, 70, 241))
+    height = 5500 + 300 * np.sin(np.radians(4 * lon)) * np.cos(np.radians(3 * lat))
+    speed = 40 + 30 * np.cos(np.radians(6 * lon)) * np.sin(np.radians(5 * lat))
+
+    fig = plt.figure(figsize=(18, 9))
+    ax = fig.add_subplot(projection=ccrs.LambertConformal(central_longitude=-100))
+    ax.set_extent([-125, -70, 20, 55], ccrs.PlateCarree())
+    ax.contourf(
+        lon, lat, speed, np.arange(0, 80, 5), cmap="BuPu", transform=ccrs.PlateCarree()
+    )
+    contours = ax.contour(
+        lon, lat, height, np.arange(5000, 6000, 30), colors="k", transform=ccrs.PlateCarree()
+    )
+    ax.clabel(contours, fontsize=10)
+    ax.barbs(
+        lon[::12, ::12],
+        lat[::12, ::12],
+        speed[::12, ::12],
+        -speed[::12, ::12] / 2,
+        transform=ccrs.PlateCarree(),
+    )
+    # Labels at stations, as station plots draw them
+    rng = np.random.default_rng(0)
+    for x, y in zip(rng.uniform(-125, -70, 600), rng.uniform(20, 55, 600)):
+        ax.text(x, y, f"{rng.integers(-20, 35)}", fontsize=8, transform=ccrs.PlateCarree())
+    ax.set_title("500-hPa Heights and Wind Speed", loc="left", fontsize=16)
+    return fig
+
+
+def child(method, dpi, directory):
+    fig = make_figure()
+    outputs = output.product_paths(Path(directory) / method, dpi)
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    records = []
+    if method == "savefig":
+        for out in outputs:
+            step = time.perf_counter()
+            fig.savefig(out.target, dpi=out.dpi, bbox_inches="tight")
+            records.append(
+                {"target": out.target, "seconds": time.perf_counter() - step, "mb": None}
+            )
+    else:
+        records = output.save(fig, outputs)
+    seconds = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+    print(json.dumps({"seconds": seconds, "peak_mb": peak / 1024, "records": records}))
+
+
+def run(method, dpi, directory):
+    result = subprocess.run(
+        [sys.executable, __file__, "--child", method, str(dpi), directory],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(result.stdout)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        child(sys.argv[2], float(sys.argv[3]), sys.argv[4])
+        sys.exit()
+
+    dpi = float(sys.argv[1]) if len(sys.argv) > 1 else 600
+    with tempfile.TemporaryDirectory() as directory:
+        results = {method: run(method, dpi, directory) for method in ["savefig", "single"]}
+
+    for method, result in results.items():
+        print(f"{method}: {result['seconds']:.2f} s, peak {result['peak_mb']:.0f} MB")
+        for record in result["records"]:
+            name = "(render)" if record["target"] is None else Path(record["target"]).name
+            mb = "" if record["mb"] is None else f"{record['mb']:8.1f} MB"
+            print(f"  {name:<28} {record['seconds']:8.3f} s {mb}")
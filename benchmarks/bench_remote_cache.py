@@ -0,0 +1,35 @@
+"""Time the figures using remote data with a cold, warm and replayed remote data cache.
+
+Run from this directory: ``python bench_remote_cache.py``. The figures are run in separate
+processes, each against the same, initially empty, temporary cache.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+figures = ["fig1_skewt.py", "fig2_multilayer.py"]
+
+
+def run(script, **env):
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, script],
+        cwd="../scripts",
+        env={**os.environ, "MPLBACKEND": "Agg", **env},
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as cache_dir:
+        print(f"{'figure':<20} {'cold (s)':>9} {'warm (s)':>9} {'replay (s)':>10}")
+        for script in figures:
+            cold = run(script, BAMS_REMOTE_CACHE="on", BAMS_REMOTE_CACHE_DIR=cache_dir)
+            warm = run(script, BAMS_REMOTE_CACHE="on", BAMS_REMOTE_CACHE_DIR=cache_dir)
+            replay = run(script, BAMS_REMOTE_CACHE="replay", BAMS_REMOTE_CACHE_DIR=cache_dir)
+            print(f"{script:<20} {cold:9.2f} {warm:9.2f} {replay:10.2f}")
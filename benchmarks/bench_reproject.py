@@ -0,0 +1,91 @@
+"""Compare reprojecting fig2's satellite image with cartopy and with the cached mapping.
+
+Run from this directory: ``python bench_reproject.py [dpi]``. The GOES image is fetched the
+way fig2 fetches it (through the remote data cache) and decimated to the map as fig2 does.
+The cached mapping is timed twice, against an empty cache (computing and storing the
+mapping) and then again as on every following run.
+"""
+
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, "..")
+
+import cartopy.crs as ccrs
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+import numpy as np
+from cartopy.img_transform import warp_array
+
+from bams import remote
+from bams.imagery import decimate_to_axes
+from bams.reproject import warp_to_axes
+from siphon.catalog import TDSCatalog
+
+satellite_catalog = "https://thredds.ucar.edu/thredds/catalog/satellite/goes/east/products/CloudAndMoistureImagery/CONUS/Channel02/current/catalog.xml"
+
+# Extent, padding and (approximately) projection used by fig2
+extent = (-113, -70, 25, 45)
+request_bbox = (extent[0] - 5, extent[1] + 5, extent[2] - 5, extent[3] + 5)
+map_crs = ccrs.LambertConformal(central_longitude=-95, standard_parallels=(25, 25))
+regrid_shape = 6000
+
+
+def best_of(func, repeat=3):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+if __name__ == "__main__":
+    dpi = int(sys.argv[1]) if len(sys.argv) > 1 else 600
+
+    remote.install()
+    satdata = remote.open_subset(
+        TDSCatalog(satellite_catalog).datasets[0], ["Sectorized_CMI"], bbox=request_bbox
+    )
+    cmi = satdata.metpy.parse_cf("Sectorized_CMI").load()
+
+    fig = plt.figure(figsize=(18, 9))
+    ax = fig.add_subplot(projection=map_crs)
+    ax.set_extent(extent)
+    cmi = decimate_to_axes(cmi, ax, dpi=dpi)
+    x, y = cmi.metpy.x.values, cmi.metpy.y.values
+
+    def cached_warp():
+        return warp_to_axes(cmi, ax, dpi=dpi, regrid_shape=regrid_shape)[0]
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        os.environ["BAMS_REPROJECT_CACHE_DIR"] = cache_dir
+        t_cold = timeit.timeit(cached_warp, number=1)
+        t_warm = best_of(cached_warp)
+        result = cached_warp()
+
+    # What cartopy's imshow does for every image, onto the same pixels
+    rows, columns = result.shape
+
+    def cartopy_warp():
+        return warp_array(
+            cmi.values,
+            ax.projection,
+            source_proj=cmi.metpy.cartopy_crs,
+            target_res=(columns, rows),
+            source_extent=(x[0], x[-1], y[0], y[-1]),
+            target_extent=ax.get_extent(),
+        )[0]
+
+    t_cartopy = best_of(cartopy_warp)
+    expected = np.ma.masked_invalid(cartopy_warp())
+    masked = np.ma.getmaskarray(result)
+    differ = (np.ma.getmaskarray(expected) != masked) | (
+        ~masked & (expected.filled(0) != result.filled(0))
+    )
+
+    print(f"image {cmi.shape}, map {result.shape}")
+    print(f"cartopy warp:  {t_cartopy:.3f} s")
+    print(f"cached (cold): {t_cold:.3f} s")
+    print(f"cached (warm): {t_warm:.3f} s")
+    print(f"pixels differing from cartopy: {differ.mean():.2%}")
@@ -0,0 +1,89 @@
+"""Compare the latency of products rendered one-shot and by the render service.
+
+Run from this directory: ``python bench_service.py [processes]``. Each request is rendered
+once in a new interpreter, as the figure scripts are (importing the libraries, opening the
+data and rendering), and then by `bams.service` over HTTP, from warm workers: one request
+at a time, and all at once, from as many clients as there are workers.
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+sys.path.insert(0, "..")
+
+from bams import service
+
+# fig3 along a few paths, and fig5 at a few levels
+requests = [
+    "fig3",
+    "fig3?start=40,-110&end=40,-80",
+    "fig3?start=30,-100&end=45,-90",
+    "fig5?level=850",
+    "fig5?level=500",
+    "fig5?level=300",
+    "fig5?level=250",
+]
+
+
+def one_shot(request):
+    """Render a request in a new interpreter, returning how long it took."""
+    url = urlsplit(request)
+    code = (
+        "import sys; sys.path.insert(0, '..'); from bams import service; "
+        f"service.render({url.path!r}, {dict(parse_qsl(url.query))!r})"
+    )
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", code], check=True, env=dict(os.environ, MPLBACKEND="agg")
+    )
+    return time.perf_counter() - start
+
+
+def fetch(base, request):
+    start = time.perf_counter()
+    with urllib.request.urlopen(f"{base}/{request}") as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def summarize(label, seconds):
+    median = statistics.median(seconds)
+    print(f"{label:<28} {median * 1000:10.0f} {max(seconds) * 1000:10.0f}")
+
+
+if __name__ == "__main__":
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    cold = [one_shot(request) for request in requests]
+
+    with service.RenderService(processes) as svc:
+        start = time.perf_counter()
+        svc.warm()
+        t_start = time.perf_counter() - start
+        with service.make_server(svc, 0) as server:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base = f"http://127.0.0.1:{server.server_address[1]}"
+
+            # The first request of each product fills the caches it uses
+            first = [fetch(base, request) for request in requests]
+            sequential = [fetch(base, request) for request in requests]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(svc.processes) as clients:
+                concurrent = list(clients.map(lambda r: fetch(base, r), requests * 4))
+            t_concurrent = time.perf_counter() - start
+            server.shutdown()
+
+    print(f"{len(requests)} requests, {svc.processes} workers")
+    print(f"{'':<28} {'median (ms)':>10} {'max (ms)':>10}")
+    summarize("one-shot", cold)
+    summarize("service, first request", first)
+    summarize("service, warm", sequential)
+    summarize("service, concurrent", concurrent)
+    print(f"starting the service took {t_start:.2f} s, once")
+    print(f"concurrent throughput: {len(concurrent) / t_concurrent:.2f} requests/s")
@@ -0,0 +1,117 @@
+"""Compare rendering fig1's Skew-T from scratch with rendering it from `bams.skewt`'s template.
+
+Run from this directory: ``python bench_skewt.py``. Both render the same random soundings as
+fig1 does, down to the indices and hodograph, and save them as PNG. Both draw the moist
+adiabats from `bams.adiabats`, as fig1 does; the parcel profiles, indices and table of moist
+adiabats are calculated beforehand, since only the rendering is compared.
+"""
+
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, "..")
+
+import matplotlib
+
+matplotlib.use("agg")
+
+import matplotlib.pyplot as plt
+import numpy as np
+from bench_sounding import random_soundings
+from mpl_toolkits.axes_grid1.inset_locator import inset_axes
+
+from bams import adiabats, sounding
+from bams.skewt import SkewTTemplate
+from metpy.plots import Hodograph, SkewT
+from metpy.units import units
+
+count = 20
+resolutions = [100, 200]
+
+
+def prepare(rng, p, t, td):
+    """Add winds and heights to a sounding, and calculate what fig1 shows."""
+    levels = p.size
+    u = units.Quantity(np.cumsum(rng.normal(2, 4, levels)), "knots")
+    v = units.Quantity(np.cumsum(rng.normal(1, 4, levels)), "knots")
+    hght = units.Quantity(np.linspace(300, 16000, levels), "m")
+    prof = sounding.parcel_profile(p, t[0], td[0]).to("degC")
+    row = sounding.analyze_soundings(p, t, td).iloc[0]
+    indices = f"""CAPE = {row.cape:.0f} J/kg
+CIN = {row.cin:.0f} J/kg
+LI = {row.lifted_index:.0f}
+LCL = {row.lcl_pressure:.0f} hPa
+LFC = {row.lfc_pressure:.0f} hPa
+EL = {row.el_pressure:.0f} hPa"""
+    lcl = (
+        units.Quantity(row.lcl_pressure, "hPa"),
+        units.Quantity(row.lcl_temperature, "degC"),
+    )
+    return p, t, td, u, v, hght, prof, lcl, indices
+
+
+def plot_sounding(skew, hodo, p, t, td, u, v, hght, prof, lcl, indices):
+    below_100_hpa = p >= 101.0 * units.hPa
+    skew.plot(p, t, "r")
+    skew.plot(p, td, "g")
+    skew.plot_barbs(p[below_100_hpa], u[below_100_hpa], v[below_100_hpa])
+    skew.plot(*lcl, "ko", markerfacecolor="black")
+    skew.plot(p, prof, "k", linewidth=2)
+    skew.shade_cin(p, t, prof, td)
+    skew.shade_cape(p, t, prof)
+    skew.ax.figure.text(
+        0.14, 0.21, indices, size=14, ha="left", bbox=dict(boxstyle="square", fc="white")
+    )
+    hodo.plot_colormapped(u[below_100_hpa], v[below_100_hpa], hght[below_100_hpa])
+
+
+def render_from_scratch(data, path, dpi):
+    fig = plt.figure(figsize=(12, 12))
+    skew = SkewT(fig, rotation=45)
+    ax_hodo = inset_axes(skew.ax, "40%", "40%", loc=1)
+    hodo = Hodograph(ax_hodo, component_range=80.0)
+    hodo.add_grid(increment=20)
+    skew.ax.set_ylim(1000, 100)
+    skew.ax.set_xlim(-40, 60)
+    plot_sounding(skew, hodo, *data)
+    skew.ax.axvline(0, color="c", linestyle="--", linewidth=2)
+    skew.plot_dry_adiabats()
+    adiabats.plot_moist_adiabats(skew)
+    skew.plot_mixing_lines()
+    skew.ax.set_ylabel("Pressure (hPa)")
+    skew.ax.set_xlabel(r"Temperature ($\mathrm{°C}$)")
+    ax_hodo.set_yticks(range(-50, 51, 50))
+    fig.savefig(path, dpi=dpi, bbox_inches="tight")
+    plt.close(fig)
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    soundings = [prepare(rng, *s) for s in random_soundings(rng, count)]
+    adiabats.moist_adiabat_table()
+    out = tempfile.mkdtemp()
+    print(f"{'dpi':>4} {'scratch (/s)':>13} {'template (/s)':>14} {'setup (s)':>10}")
+
+    for dpi in resolutions:
+        start = timeit.default_timer()
+        for i, data in enumerate(soundings):
+            render_from_scratch(data, os.path.join(out, f"scratch_{i}.png"), dpi)
+        t_scratch = timeit.default_timer() - start
+
+        start = timeit.default_timer()
+        template = SkewTTemplate(dpi=dpi)
+        t_setup = timeit.default_timer() - start
+        start = timeit.default_timer()
+        for i, data in enumerate(soundings):
+            template.render(
+                lambda skew, hodo: plot_sounding(skew, hodo, *data),
+                os.path.join(out, f"template_{i}.png"),
+            )
+        t_template = timeit.default_timer() - start
+        plt.close(template.fig)
+
+        print(f"{dpi:4d} {count / t_scratch:13.2f} {count / t_template:14.2f}", end="")
+        print(f" {t_setup:10.3f}")
+    print(f"Images are in {out}")
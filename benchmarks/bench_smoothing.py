@@ -0,0 +1,48 @@
+"""Compare the smoothing engines of `bams.smoothing.smooth_gaussian` with MetPy's.
+
+Run from this directory: ``python bench_smoothing.py``.
+"""
+
+import sys
+import timeit
+
+sys.path.insert(0, "..")
+
+import numpy as np
+
+import metpy.calc as mpcalc
+from bams.smoothing import smooth_gaussian
+from metpy.units import units
+
+shapes = [(500, 500), (1377, 2145), (2000, 3000)]
+kernels = [10, 50, 100]
+engines = ["fft", "threads"]
+
+
+def best_of(func, repeat=3):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    print(f"{'shape':>12} {'n':>4} {'metpy (s)':>10}", end="")
+    for engine in engines:
+        print(f" {engine + ' (s)':>12} {'max diff':>9}", end="")
+    print()
+
+    for shape in shapes:
+        # Smooth background with small-scale noise, like a theta-e analysis
+        y, x = np.mgrid[: shape[0], : shape[1]]
+        grid = 300 + 20 * np.sin(x / 200) * np.cos(y / 150) + rng.normal(0, 1, shape)
+        grid = units.Quantity(grid.astype("float32"), "K")
+
+        for n in kernels:
+            expected = mpcalc.smooth_gaussian(grid, n)
+            t_metpy = best_of(lambda: mpcalc.smooth_gaussian(grid, n))
+            print(f"{str(shape):>12} {n:4d} {t_metpy:10.3f}", end="")
+            for engine in engines:
+                result = smooth_gaussian(grid, n, engine=engine)
+                diff = np.abs(result - expected).max().m
+                t_engine = best_of(lambda: smooth_gaussian(grid, n, engine=engine))
+                print(f" {t_engine:12.3f} {diff:9.2e}", end="")
+            print()
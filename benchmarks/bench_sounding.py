@@ -0,0 +1,96 @@
+"""Compare analyzing soundings one at a time with MetPy and all at once with `bams.sounding`.
+
+Run from this directory: ``python bench_sounding.py``. The soundings are random perturbations
+of a warm-season profile with different numbers of levels, as from RAOBs, and are passed to
+`bams.sounding.analyze_soundings` as a ragged list. Looping over 10,000 soundings with MetPy
+takes a long time, so the loop is timed over at most 1,000 of them and scaled up (marked
+with ``*``). The largest differences from MetPy are over the soundings timed with both,
+leaving out those MetPy fails on.
+"""
+
+import sys
+import timeit
+
+sys.path.insert(0, "..")
+
+import numpy as np
+
+import metpy.calc as mpcalc
+from bams import sounding
+from metpy.units import units
+
+counts = [100, 1000, 10000]
+loop_limit = 1000
+
+
+def random_soundings(rng, count):
+    """Make soundings from about 1000 hPa to 100 hPa with 40 to 80 levels."""
+    soundings = []
+    for _ in range(count):
+        levels = rng.integers(40, 81)
+        p = np.linspace(rng.uniform(950, 1010), 100, levels)
+        z = -np.log(p / 1000)
+        t = 25 + rng.normal(0, 3) - 45 * z + rng.normal(0, 0.5, levels)
+        t = np.maximum(t, -60 + rng.normal(0, 2, levels))
+        td = t - np.maximum(rng.uniform(0, 6) + 20 * z + rng.normal(0, 1, levels), 0)
+        soundings.append(
+            (units.Quantity(p, "hPa"), units.Quantity(t, "degC"), units.Quantity(td, "degC"))
+        )
+    return soundings
+
+
+def metpy_analysis(p, t, td):
+    try:
+        return _metpy_analysis(p, t, td)
+    except (TypeError, ValueError):
+        # MetPy fails to find the LFC of some soundings with crossings only below the LCL
+        return [np.nan] * 6
+
+
+def _metpy_analysis(p, t, td):
+    prof = mpcalc.parcel_profile(p, t[0], td[0])
+    li = mpcalc.lifted_index(p, t, prof)[0]
+    cape, cin = mpcalc.cape_cin(p, t, td, prof)
+    lcl_pressure, _ = mpcalc.lcl(p[0], t[0], td[0])
+    lfc_pressure, _ = mpcalc.lfc(p, t, td, prof)
+    el_pressure, _ = mpcalc.el(p, t, td, prof)
+    return [
+        lcl_pressure.m_as("hPa"),
+        lfc_pressure.m_as("hPa"),
+        el_pressure.m_as("hPa"),
+        cape.m_as("J/kg"),
+        cin.m_as("J/kg"),
+        li.m_as("delta_degC"),
+    ]
+
+
+def best_of(func, repeat=3):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    columns = ["lcl_pressure", "lfc_pressure", "el_pressure", "cape", "cin", "lifted_index"]
+    print(f"{'soundings':>9} {'loop (s)':>10} {'batch (s)':>10} {'speedup':>8}", end="")
+    print(f" {'max CAPE diff':>14} {'max LCL diff':>13}")
+
+    for count in counts:
+        soundings = random_soundings(rng, count)
+        p, t, td = (list(values) for values in zip(*soundings))
+
+        timed = soundings[:loop_limit]
+        start = timeit.default_timer()
+        expected = np.array([metpy_analysis(*s) for s in timed])
+        t_loop = (timeit.default_timer() - start) * count / len(timed)
+        marker = "*" if len(timed) < count else " "
+
+        table = sounding.analyze_soundings(p, t, td)
+        t_batch = best_of(lambda: sounding.analyze_soundings(p, t, td))
+
+        result = table[columns].to_numpy()[: len(timed)]
+        cape_diff = np.nanmax(np.abs(result[:, 3] - expected[:, 3]))
+        lcl_diff = np.nanmax(np.abs(result[:, 0] - expected[:, 0]))
+        print(
+            f"{count:9d} {t_loop:9.2f}{marker} {t_batch:10.3f} {t_loop / t_batch:8.1f}", end=""
+        )
+        print(f" {cape_diff:14.2e} {lcl_diff:13.2e}")
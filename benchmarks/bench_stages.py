@@ -0,0 +1,497 @@
+"""Time and memory-profile each stage of the figure pipelines, and flag regressions.
+
+Run from this directory: ``python bench_stages.py [fig1 fig2 ...]``. Each figure's work is
+split into the stages of `harness.run_pipeline`: fetch (reading the data), decode (parsing
+it), compute, render (building the figure and drawing it at screen resolution) and savefig
+(the 600 dpi ``savefig(..., bbox_inches="tight")`` of the scripts).
+
+The pipelines run on MetPy's bundled test data, and on remote data only as far as it is in
+the remote data cache (``BAMS_REMOTE_CACHE=replay`` keeps them offline). Where it is not,
+they stand in for it: fig1 uses a random sounding, and fig2 the bundled METAR file and a
+theta-e analysis on a grid of RTMA's size, without satellite imagery (which
+``bench_reproject.py`` and ``bench_decimate_imagery.py`` cover). Which data were used is
+saved with the results.
+
+Results are saved to ``output/stages.json``. Pass ``--save-baseline`` to keep them as the
+baseline (``stages_baseline.json``) that later runs are compared with, e.g. before and after
+changing the pinned versions in ``environment.yml``; a run flags the stages that got slower
+or use more memory, and exits with an error if there are any.
+"""
+
+import argparse
+import io
+import sys
+from datetime import datetime
+
+sys.path.insert(0, "..")
+
+import matplotlib
+
+matplotlib.use("agg")
+
+import cartopy.crs as ccrs
+import cartopy.feature as cfeature
+import geopandas
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import xarray as xr
+from bench_sounding import random_soundings
+from harness import compare, differences, load, print_table, run_pipeline, save
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from mpl_toolkits.axes_grid1.inset_locator import inset_axes
+
+import metpy.calc as mpcalc
+import metpy.plots as mpplots
+from bams import adiabats, remote, sounding, thermo
+from bams.cross import cross_section, terrain_pressure
+from bams.metar import parse_metars
+from bams.smoothing import smooth_gaussian
+from bams.stations import thin_stations
+
+# get_test_data is used for internal MetPy testing and not supported publicly
+from metpy.cbook import get_test_data
+from metpy.plots import (
+    BarbPlot,
+    ContourPlot,
+    FilledContourPlot,
+    Hodograph,
+    MapPanel,
+    PanelContainer,
+    PlotGeometry,
+    SkewT,
+)
+from metpy.units import pandas_dataframe_to_unit_arrays, units
+from siphon.simplewebservice.wyoming import WyomingUpperAir
+
+# Source of the data each pipeline ran on, saved with the results
+sources = {}
+
+
+def new_figure(figsize):
+    """Make a figure outside of pyplot, so that repeated renders are not kept open."""
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def draw(fig):
+    fig.canvas.draw()
+    return fig
+
+
+def savefig(fig):
+    """Save a figure as the scripts do, returning the size of the image."""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=600, bbox_inches="tight")
+    return buffer.getbuffer().nbytes
+
+
+def fig1():
+    """Skew-T and hodograph of an upper air sounding."""
+
+    def fetch(_):
+        try:
+            df = WyomingUpperAir.request_data(datetime(2011, 5, 22, 12), "TOP")
+            sources["fig1"] = "remote"
+        except Exception:
+            # A random warm-season sounding, with winds veering with height
+            p, t, td = random_soundings(np.random.default_rng(0), 1)[0]
+            df = pd.DataFrame(
+                {
+                    "pressure": p.m,
+                    "temperature": t.m,
+                    "dewpoint": td.m,
+                    "direction": np.linspace(150, 290, p.size),
+                    "speed": np.linspace(10, 80, p.size),
+                    "height": np.linspace(300, 16000, p.size),
+                }
+            )
+            sources["fig1"] = "stand-in"
+        return df
+
+    def decode(df):
+        df = df.dropna(
+            subset=("temperature", "dewpoint", "direction", "speed"), how="all"
+        ).reset_index(drop=True)
+        p = df["pressure"].values * units.hPa
+        t = df["temperature"].values * units.degC
+        td = df["dewpoint"].values * units.degC
+        u, v = mpcalc.wind_components(
+            df["speed"].values * units.knots, df["direction"].values * units.degrees
+        )
+        return p, t, td, u, v, df["height"].values * units.meter
+
+    def compute(data):
+        p, t, td = data[:3]
+        prof = sounding.parcel_profile(p, t[0], td[0]).to("degC")
+        indices = {
+            "li": mpcalc.lifted_index(p, t, prof)[0],
+            "cape_cin": mpcalc.cape_cin(p, t, td, prof),
+            "lcl": mpcalc.lcl(p[0], t[0], td[0]),
+            "lfc": mpcalc.lfc(p, t, td, prof),
+            "el": mpcalc.el(p, t, td, prof),
+        }
+        return data, prof, indices
+
+    def render(computed):
+        (p, t, td, u, v, hght), prof, indices = computed
+        fig = new_figure((12, 12))
+        skew = SkewT(fig, rotation=45)
+        below_100_hpa = p >= 101.0 * units.hPa
+        skew.plot(p, t, "r")
+        skew.plot(p, td, "g")
+        skew.plot_barbs(p[below_100_hpa], u[below_100_hpa], v[below_100_hpa])
+        skew.ax.set_ylim(1000, 100)
+        skew.ax.set_xlim(-40, 60)
+        skew.plot(*indices["lcl"], "ko", markerfacecolor="black")
+        skew.plot(p, prof, "k", linewidth=2)
+        skew.shade_cin(p, t, prof, td)
+        skew.shade_cape(p, t, prof)
+        skew.ax.axvline(0, color="c", linestyle="--", linewidth=2)
+        skew.plot_dry_adiabats()
+        adiabats.plot_moist_adiabats(skew)
+        skew.plot_mixing_lines()
+        cape, cin = indices["cape_cin"]
+        fig.text(0.14, 0.21, f"CAPE = {cape:.0f~P}\nCIN = {cin:.0f~P}", size=14)
+        ax_hodo = inset_axes(skew.ax, "40%", "40%", loc=1)
+        hodo = Hodograph(ax_hodo, component_range=80.0)
+        hodo.add_grid(increment=20)
+        hodo.plot_colormapped(u[below_100_hpa], v[below_100_hpa], hght[below_100_hpa])
+        return draw(fig)
+
+    return [
+        ("fetch", fetch),
+        ("decode", decode),
+        ("compute", compute),
+        ("render", render),
+        ("savefig", savefig),
+    ]
+
+
+def fig2():
+    """Surface observations over a smoothed theta-e analysis, from stand-in data."""
+    sources["fig2"] = "stand-in"
+    map_crs = ccrs.LambertConformal(central_longitude=-95, standard_parallels=(25, 25))
+
+    def fetch(_):
+        with open(get_test_data("metar_20190701_1200.txt", False)) as f:
+            text = f.read()
+
+        # Smooth fields with small-scale noise, on a grid of the size of RTMA's 2.5 km
+        rng = np.random.default_rng(0)
+        x = np.linspace(-2.76e6, 2.68e6, 2145)
+        y = np.linspace(-0.26e6, 3.23e6, 1377)
+        xx, yy = np.meshgrid(x / 5e5, y / 5e5)
+        noise = rng.normal(0, 0.5, xx.shape)
+        temperature = 290 + 10 * np.cos(yy) + noise
+        grids = {
+            "pressure": units.Quantity(1000 - 80 * np.sin(xx) ** 2 + noise, "hPa"),
+            "temperature": units.Quantity(temperature, "K"),
+            "dewpoint": units.Quantity(temperature - 5 - 10 * np.sin(xx) ** 2, "K"),
+        }
+        return text, x, y, grids
+
+    def decode(fetched):
+        text, x, y, grids = fetched
+        sfc_data = parse_metars(text, year=2019, month=7)
+        return pandas_dataframe_to_unit_arrays(sfc_data, sfc_data.units), x, y, grids
+
+    def compute(decoded):
+        sfc_data, x, y, grids = decoded
+        theta_e = thermo.equivalent_potential_temperature(
+            grids["pressure"], grids["temperature"], grids["dewpoint"]
+        )
+        theta_e = smooth_gaussian(theta_e, n=50)
+        plot_mask = thin_stations(
+            sfc_data["station_id"],
+            sfc_data["longitude"],
+            sfc_data["latitude"],
+            map_crs,
+            175000,
+            priority=sfc_data["current_wx1_symbol"],
+        )
+        return sfc_data, plot_mask, x, y, theta_e
+
+    def render(computed):
+        sfc_data, plot_mask, x, y, theta_e = computed
+        fig = new_figure((18, 9))
+        ax = fig.add_subplot(projection=map_crs)
+        ax.set_extent((-113, -70, 25, 45))
+        c = ax.contour(x, y, theta_e.m, levels=range(240, 400, 8), colors="tab:blue")
+        ax.clabel(c, inline=True, use_clabeltext=True, fontsize=11)
+        stn = mpplots.StationPlot(
+            ax,
+            sfc_data["longitude"][plot_mask].m,
+            sfc_data["latitude"][plot_mask].m,
+            transform=ccrs.PlateCarree(),
+            fontsize=11,
+            clip_on=True,
+        )
+        stn.plot_parameter("NW", sfc_data["air_temperature"][plot_mask], color="red")
+        stn.plot_parameter("SW", sfc_data["dew_point_temperature"][plot_mask], color="blue")
+        stn.plot_symbol("C", sfc_data["cloud_coverage"][plot_mask], mpplots.sky_cover)
+        stn.plot_barb(
+            sfc_data["eastward_wind"][plot_mask], sfc_data["northward_wind"][plot_mask]
+        )
+        ax.add_feature(cfeature.BORDERS)
+        ax.add_feature(cfeature.COASTLINE)
+        return draw(fig)
+
+    return [
+        ("fetch", fetch),
+        ("decode", decode),
+        ("compute", compute),
+        ("render", render),
+        ("savefig", savefig),
+    ]
+
+
+def fig3():
+    """Cross section of NARR data through the terrain."""
+    sources["fig3"] = "test data"
+    start = (37.0, -105.0)
+    end = (35.5, -65.0)
+
+    def fetch(_):
+        data = xr.open_dataset(get_test_data("narr_example.nc", False)).load()
+        topo = xr.open_dataset("../hgt.sfc.nc").load()
+        return data, topo
+
+    def decode(fetched):
+        data, topo = fetched
+        return data.metpy.parse_cf().squeeze(), topo.metpy.parse_cf("hgt").squeeze()
+
+    def compute(decoded):
+        data, topo = decoded
+        topo_cross = cross_section(topo, start, end)
+        cross = cross_section(data, start, end).set_coords(("lat", "lon"))
+        cross["topo_pressure"] = terrain_pressure(cross["Geopotential_height"], topo_cross)
+        cross["Potential_temperature"] = thermo.potential_temperature(
+            cross["isobaric"], cross["Temperature"]
+        )
+        cross["Relative_humidity"] = thermo.relative_humidity_from_specific_humidity(
+            cross["isobaric"], cross["Temperature"], cross["Specific_humidity"]
+        )
+        cross["u_wind"] = cross["u_wind"].metpy.convert_units("knots")
+        cross["v_wind"] = cross["v_wind"].metpy.convert_units("knots")
+        cross["t_wind"], cross["n_wind"] = mpcalc.cross_section_components(
+            cross["u_wind"], cross["v_wind"]
+        )
+        return data, cross
+
+    def render(computed):
+        data, cross = computed
+        fig = new_figure((18, 9))
+        ax = fig.add_subplot()
+        rh_contour = ax.contourf(
+            cross["index"],
+            cross["isobaric"],
+            cross["Relative_humidity"],
+            levels=np.arange(0, 1.05, 0.05),
+            cmap="YlGnBu",
+        )
+        fig.colorbar(rh_contour)
+        theta_contour = ax.contour(
+            cross["index"],
+            cross["isobaric"],
+            cross["Potential_temperature"],
+            levels=np.arange(250, 450, 5),
+            colors="k",
+            linewidths=2,
+        )
+        theta_contour.clabel(
+            theta_contour.levels[1::2],
+            fontsize=8,
+            inline=1,
+            inline_spacing=8,
+            fmt="%i",
+            rightside_up=True,
+            use_clabeltext=True,
+        )
+        ax.barbs(
+            cross["index"][5:100:5],
+            cross["isobaric"],
+            cross["t_wind"][:, 5:100:5],
+            cross["n_wind"][:, 5:100:5],
+        )
+        ax.fill_between(
+            cross["index"], cross["topo_pressure"], cross["isobaric"][0], facecolor="gray"
+        )
+        ax.set_yscale("symlog")
+        ax.set_ylim(cross["isobaric"].max(), cross["isobaric"].min())
+
+        data_crs = data["Geopotential_height"].metpy.cartopy_crs
+        ax_inset = fig.add_axes([0.125, 0.654, 0.25, 0.25], projection=data_crs)
+        ax_inset.contour(
+            data["x"],
+            data["y"],
+            data["Geopotential_height"].sel(isobaric=500.0),
+            levels=np.arange(5100, 6000, 60),
+            cmap="inferno",
+        )
+        ax_inset.plot(cross["x"], cross["y"], c="k")
+        ax_inset.coastlines()
+        ax_inset.add_feature(cfeature.STATES.with_scale("50m"), alpha=0.2)
+        return draw(fig)
+
+    return [
+        ("fetch", fetch),
+        ("decode", decode),
+        ("compute", compute),
+        ("render", render),
+        ("savefig", savefig),
+    ]
+
+
+def draw_container(panels, size):
+    """Draw declarative panels as `PanelContainer.save` does, before saving."""
+    pc = PanelContainer()
+    pc.size = size
+    pc.panels = panels
+    pc.draw()
+    plt.close(pc.figure)
+    return draw(pc.figure)
+
+
+def fig5():
+    """300 hPa heights and winds of a GFS forecast, with the declarative interface."""
+    sources["fig5"] = "test data"
+
+    def fetch(_):
+        return xr.open_dataset(get_test_data("GFS_test.nc", False)).load()
+
+    def decode(data):
+        data = data.metpy.parse_cf().squeeze()
+        return data.metpy.sel(lat=slice(70, 10), lon=slice(360 - 150, 360 - 55))
+
+    def compute(ds):
+        ds = ds.copy()
+        ds["wind_speed"] = mpcalc.wind_speed(
+            ds["u-component_of_wind_isobaric"], ds["v-component_of_wind_isobaric"]
+        )
+        return ds
+
+    def render(ds):
+        contour = ContourPlot()
+        contour.data = ds
+        contour.field = "Geopotential_height_isobaric"
+        contour.level = 300 * units.hPa
+        contour.contours = list(range(0, 10000, 120))
+        contour.clabels = True
+
+        cfill = FilledContourPlot()
+        cfill.data = ds
+        cfill.field = "wind_speed"
+        cfill.level = 300 * units.hPa
+        cfill.contours = list(range(10, 201, 20))
+        cfill.colormap = "BuPu"
+        cfill.colorbar = "horizontal"
+        cfill.plot_units = "knot"
+
+        barbs = BarbPlot()
+        barbs.data = ds
+        barbs.field = ["u-component_of_wind_isobaric", "v-component_of_wind_isobaric"]
+        barbs.level = 300 * units.hPa
+        barbs.skip = (3, 3)
+        barbs.plot_units = "knot"
+
+        panel = MapPanel()
+        panel.area = [-125, -74, 20, 55]
+        panel.projection = "lcc"
+        panel.layers = ["states", "coastline", "borders"]
+        panel.plots = [cfill, contour, barbs]
+        return draw_container([panel], (15, 15))
+
+    return [
+        ("fetch", fetch),
+        ("decode", decode),
+        ("compute", compute),
+        ("render", render),
+        ("savefig", savefig),
+    ]
+
+
+def fig6():
+    """SPC convective outlook, drawn with `PlotGeometry`."""
+    sources["fig6"] = "test data"
+
+    def fetch(_):
+        with open(get_test_data("spc_day1otlk_20210317_1200_lyr.geojson", False), "rb") as f:
+            return f.read()
+
+    def decode(content):
+        return geopandas.read_file(io.BytesIO(content))
+
+    def render(outlook):
+        geo = PlotGeometry()
+        geo.geometry = outlook["geometry"]
+        geo.fill = outlook["fill"]
+        geo.stroke = outlook["stroke"]
+        geo.labels = outlook["LABEL"]
+        geo.label_fontsize = "large"
+
+        panel = MapPanel()
+        panel.plots = [geo]
+        panel.area = [-120, -75, 25, 50]
+        panel.projection = "lcc"
+        panel.layers = ["lakes", "land", "ocean", "states", "coastline", "borders"]
+        return draw_container([panel], (18, 9))
+
+    return [("fetch", fetch), ("decode", decode), ("render", render), ("savefig", savefig)]
+
+
+pipelines = {"fig1": fig1, "fig2": fig2, "fig3": fig3, "fig5": fig5, "fig6": fig6}
+
+
+def main():
+    """Time and memory-profile the stages of the figure pipelines."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument(
+        "pipelines", nargs="*", help=f"pipelines to run, out of {', '.join(pipelines)}"
+    )
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="timings per stage")
+    parser.add_argument("-o", "--output", default="output/stages.json", help="results file")
+    parser.add_argument("--baseline", default="stages_baseline.json", help="baseline file")
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="save the results as the baseline"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="fraction by which a stage may grow before it is flagged (default 0.25)",
+    )
+    args = parser.parse_args()
+    unknown = [name for name in args.pipelines if name not in pipelines]
+    if unknown:
+        parser.error(f"unknown pipelines: {', '.join(unknown)}")
+
+    remote.install()
+    records = []
+    for name in args.pipelines or pipelines:
+        records.extend(run_pipeline(name, pipelines[name](), args.repeat))
+
+    try:
+        baseline = load(args.baseline)
+    except FileNotFoundError:
+        baseline = None
+    print_table(records, baseline)
+
+    save(args.output, records, repeat=args.repeat, data=sources)
+    if args.save_baseline:
+        save(args.baseline, records, repeat=args.repeat, data=sources)
+        print(f"Saved the baseline to {args.baseline}")
+    elif baseline is not None:
+        changed = differences(baseline)
+        if changed:
+            print("Measured with differences from the baseline:", *changed, sep="\n  ")
+        regressions = compare(records, baseline, args.threshold)
+        if regressions:
+            print("Regressions:", *regressions, sep="\n  ")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
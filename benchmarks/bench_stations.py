@@ -0,0 +1,86 @@
+"""Compare thinning stations with MetPy and `bams.stations`, from scratch and incrementally.
+
+Run from this directory: ``python bench_stations.py``. Stations are placed at random over
+fig2's map. For the incremental case a few percent of the stations change (appear,
+disappear, or change priority) between thinnings, as from one hourly file to the next.
+"""
+
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, "..")
+
+import cartopy.crs as ccrs
+import numpy as np
+
+import metpy.calc as mpcalc
+from bams import stations
+
+crs = ccrs.LambertConformal(central_longitude=-95, standard_parallels=(25, 25))
+counts = [2000, 8000]
+radii = [75000, 175000, 400000]
+
+
+def best_of(func, repeat=3):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def random_stations(rng, count):
+    station_id = np.array([f"S{i:05d}" for i in range(count)])
+    longitude = rng.uniform(-113, -70, count)
+    latitude = rng.uniform(25, 45, count)
+    priority = rng.integers(0, 10, count)
+    return station_id, longitude, latitude, priority
+
+
+def next_hour(rng, station_id, longitude, latitude, priority, fraction=0.03):
+    """Drop and add a few stations and change the priority of a few others."""
+    kept = rng.random(station_id.size) > fraction
+    added = int(fraction * station_id.size)
+    new_id, new_lon, new_lat, new_priority = random_stations(rng, added)
+    priority = priority[kept].copy()
+    changed = rng.random(priority.size) < fraction
+    priority[changed] = rng.integers(0, 10, changed.sum())
+    return (
+        np.concatenate([station_id[kept], np.char.add("N", new_id)]),
+        np.concatenate([longitude[kept], new_lon]),
+        np.concatenate([latitude[kept], new_lat]),
+        np.concatenate([priority, new_priority]),
+    )
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    os.environ["BAMS_STATIONS_CACHE_DIR"] = tempfile.mkdtemp()
+    print(f"{'stations':>8} {'radius':>7} {'metpy (s)':>10} {'layout (s)':>11}", end="")
+    print(f" {'incr (s)':>9}")
+
+    for count in counts:
+        current = random_stations(rng, count)
+        following = next_hour(rng, *current)
+
+        for radius in radii:
+
+            def metpy_thin(station_id, longitude, latitude, priority):
+                locs = crs.transform_points(ccrs.PlateCarree(), longitude, latitude)
+                return mpcalc.reduce_point_density(locs[..., :2], radius, priority=priority)
+
+            def layout_thin(station_id, longitude, latitude, priority):
+                layout = stations.StationLayout(station_id, longitude, latitude, crs)
+                return layout.reduce_point_density(radius, priority)
+
+            t_metpy = best_of(lambda: metpy_thin(*following))
+            t_layout = best_of(lambda: layout_thin(*following))
+
+            # Time only the second call, which updates the result of the first, starting
+            # without any layouts in memory as a new run would
+            stations.thin_stations(*current[:3], crs, radius, priority=current[3])
+            stations._layout_cache.clear()
+            start = timeit.default_timer()
+            stations.thin_stations(*following[:3], crs, radius, priority=following[3])
+            t_incremental = timeit.default_timer() - start
+
+            print(f"{count:8d} {radius:7d} {t_metpy:10.3f} {t_layout:11.3f}", end="")
+            print(f" {t_incremental:9.3f}")
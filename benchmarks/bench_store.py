@@ -0,0 +1,128 @@
+"""Compare opening gridded inputs from NetCDF and from `bams.store` stores.
+
+Run from this directory: ``python bench_store.py [FILE...]``, defaulting to ``hgt.sfc.nc``
+and MetPy's NARR and GFS test data. Each file is ingested into its store first (in
+``BAMS_STORE_CACHE_DIR``, if set), then opened cold, with the pages of the file and of the
+store evicted from the page cache: opened and parsed (``xr.open_dataset`` and ``parse_cf``)
+and from its store, and then reading one horizontal slice of its largest variable and one
+row through all its levels, as a map and a cross section do. Bytes read are the pages of the
+file or store resident in memory afterwards.
+"""
+
+import ctypes
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, "..")
+
+import numpy as np
+import xarray as xr
+
+from bams import store
+from metpy.cbook import get_test_data
+
+_libc = ctypes.CDLL(None, use_errno=True)
+_page = os.sysconf("SC_PAGE_SIZE")
+
+
+def files_of(source):
+    """Get the files holding a NetCDF file or a store."""
+    path = Path(source)
+    return sorted(path.glob("*")) if path.is_dir() else [path]
+
+
+def evict(paths):
+    """Drop the pages of files from the page cache."""
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def resident(paths):
+    """Count the bytes of files in the page cache."""
+    total = 0
+    for path in paths:
+        size = path.stat().st_size
+        if not size:
+            continue
+        mapped = np.memmap(path, mode="r")
+        pages = np.zeros((size + _page - 1) // _page, dtype=np.uint8)
+        if _libc.mincore(
+            ctypes.c_void_p(mapped.ctypes.data),
+            ctypes.c_size_t(size),
+            pages.ctypes.data_as(ctypes.c_void_p),
+        ):
+            raise OSError(ctypes.get_errno(), "mincore failed")
+        total += int((pages & 1).sum()) * _page
+        del mapped
+    return total
+
+
+def open_netcdf(source):
+    return xr.open_dataset(source).metpy.parse_cf()
+
+
+def largest(data):
+    return max(data.data_vars.values(), key=lambda var: var.size)
+
+
+def read_slice(data):
+    var = largest(data)
+    return var[(0,) * (var.ndim - 2)].values
+
+
+def read_row(data):
+    var = largest(data)
+    return var[(0,) * (var.ndim - 3) + (slice(None), var.shape[-2] // 2)].values
+
+
+def cold(opener, source, paths, read=None):
+    """Time opening (and reading part of) a file with nothing in the page cache."""
+    evict(paths)
+    start = time.perf_counter()
+    data = opener(source)
+    if read is not None:
+        read(data)
+    elapsed = time.perf_counter() - start
+    data.close()
+    return elapsed, resident(paths)
+
+
+if __name__ == "__main__":
+    sources = sys.argv[1:] or [
+        "../hgt.sfc.nc",
+        get_test_data("narr_example.nc", False),
+        get_test_data("GFS_test.nc", False),
+    ]
+
+    columns = ["NetCDF (ms)", "store (ms)", "NetCDF (kB)", "store (kB)"]
+    print(f"{'':<40}" + "".join(f" {column:>12}" for column in columns))
+    for source in sources:
+        start = time.perf_counter()
+        path = store.update(source)
+        t_ingest = time.perf_counter() - start
+
+        var = largest(store.open_store(path))
+        print(
+            f"{Path(source).name} (ingested in {t_ingest:.2f} s, largest variable {var.dims})"
+        )
+        reads = [("open", None), ("open, one level", read_slice)]
+        if var.ndim >= 3:
+            reads.append(("open, one row of every level", read_row))
+        for label, read in reads:
+            t_nc, b_nc = min(
+                cold(open_netcdf, source, files_of(source), read) for _ in range(3)
+            )
+            t_st, b_st = min(
+                cold(store.open_store, path, files_of(path), read) for _ in range(3)
+            )
+            print(
+                f"  {label:<38} {t_nc * 1000:12.1f} {t_st * 1000:12.1f}"
+                f" {b_nc / 1024:12.0f} {b_st / 1024:12.0f}"
+            )
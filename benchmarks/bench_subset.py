@@ -0,0 +1,87 @@
+"""Compare bytes fetched and peak memory of fig2's data access with and without subsetting.
+
+Run from this directory: ``python bench_subset.py``. Each variant runs in its own process
+against an empty temporary cache, so that all data are fetched from the server. To measure
+offline, record a cache first and pass ``BAMS_REMOTE_CACHE=replay`` and
+``BAMS_REMOTE_CACHE_DIR``; bytes are then counted as served by the stand-in server.
+"""
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, "..")
+
+from bams import remote
+from siphon.catalog import TDSCatalog
+
+satellite_catalog = "https://thredds.ucar.edu/thredds/catalog/satellite/goes/east/products/CloudAndMoistureImagery/CONUS/Channel02/current/catalog.xml"
+rtma_catalog = (
+    "https://thredds.ucar.edu/thredds/catalog/grib/NCEP/RTMA/CONUS_2p5km/catalog.xml"
+)
+rtma_variables = [
+    "Pressure_Analysis_surface",
+    "Temperature_Analysis_height_above_ground",
+    "Dewpoint_temperature_Analysis_height_above_ground",
+]
+
+# Matches the extent and padding used by fig2
+extent = (-113, -70, 25, 45)
+request_bbox = (extent[0] - 5, extent[1] + 5, extent[2] - 5, extent[3] + 5)
+
+
+def fetch(subset):
+    """Run fig2's fetch stage, loading the data into memory."""
+    remote.install()
+    start = time.perf_counter()
+
+    satellite = TDSCatalog(satellite_catalog).datasets[0]
+    if subset:
+        satdata = remote.open_subset(satellite, ["Sectorized_CMI"], bbox=request_bbox)
+    else:
+        satdata = remote.open_remote_dataset(satellite)
+    satdata["Sectorized_CMI"].load()
+    dt = datetime.strptime(satdata.attrs["start_date_time"], "%Y%j%H%M%S")
+
+    rtma = TDSCatalog(rtma_catalog).datasets[
+        "Best Real Time Mesoscale Analysis 2.5 km Time Series"
+    ]
+    rtma_data = remote.open_subset(
+        rtma, rtma_variables, time=dt, bbox=request_bbox if subset else None
+    )
+    rtma_data.load()
+
+    return {
+        "seconds": time.perf_counter() - start,
+        "bytes": remote.stats["fetched_bytes"] + remote.stats["cached_bytes"],
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        print(json.dumps(fetch(sys.argv[1] == "subset")))
+        sys.exit()
+
+    print(f"{'variant':<8} {'time (s)':>9} {'fetched (MB)':>13} {'peak RSS (MB)':>14}")
+    for variant in ("full", "subset"):
+        env = dict(os.environ)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            env.setdefault("BAMS_REMOTE_CACHE_DIR", cache_dir)
+            output = subprocess.run(
+                [sys.executable, __file__, variant],
+                env=env,
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+        result = json.loads(output.splitlines()[-1])
+        print(
+            f"{variant:<8} {result['seconds']:9.2f} {result['bytes'] / 1e6:13.1f}"
+            f" {result['peak_rss_mb']:14.1f}"
+        )
@@ -0,0 +1,102 @@
+"""Compare rendering fig5's product at every level serially and over a pool of workers.
+
+Run from this directory: ``python bench_sweep.py [processes] [dpi]``. The product is fig5's
+(heights, wind speed and barbs over North America, on the cached basemap) at every isobaric
+level of ``GFS_test.nc``. The serial loop opens the data once and renders each frame in
+turn, as a script looping over fig5 would; the pool is `bams.sweep.render_sweep`. Frames are
+written to ``output/sweep``, and assembled into ``output/sweep/fig5.gif``.
+"""
+
+import sys
+import time
+
+sys.path.insert(0, "..")
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import xarray as xr
+
+import metpy.calc as mpcalc
+from bams.basemap import MapPanel
+from bams.sweep import animate, render_frame, render_sweep, sweep
+from metpy.cbook import get_test_data
+from metpy.plots import BarbPlot, ContourPlot, FilledContourPlot, PanelContainer
+
+pattern = "output/sweep/{mode}_{index:03d}.png"
+title = "{level:~P} Heights and Wind Speed"
+
+
+def open_gfs():
+    """Open and subset the GFS data as fig5 does."""
+    data = xr.open_dataset(get_test_data("GFS_test.nc", False)).metpy.parse_cf().squeeze()
+    ds = data.metpy.sel(lat=slice(70, 10), lon=slice(360 - 150, 360 - 55))
+    ds["wind_speed"] = mpcalc.wind_speed(
+        ds["u-component_of_wind_isobaric"], ds["v-component_of_wind_isobaric"]
+    )
+    return ds
+
+
+def product():
+    """Fig5's product, without its data, level or title."""
+    contour = ContourPlot()
+    contour.field = "Geopotential_height_isobaric"
+    contour.contours = list(range(0, 20000, 120))
+    contour.clabels = True
+
+    cfill = FilledContourPlot()
+    cfill.field = "wind_speed"
+    cfill.contours = list(range(10, 201, 20))
+    cfill.colormap = "BuPu"
+    cfill.colorbar = "horizontal"
+    cfill.plot_units = "knot"
+
+    barbs = BarbPlot()
+    barbs.field = ["u-component_of_wind_isobaric", "v-component_of_wind_isobaric"]
+    barbs.skip = (3, 3)
+    barbs.plot_units = "knot"
+
+    panel = MapPanel()
+    panel.area = [-125, -74, 20, 55]
+    panel.projection = "lcc"
+    panel.layers = ["states", "coastline", "borders"]
+    panel.plots = [cfill, contour, barbs]
+
+    pc = PanelContainer()
+    pc.size = (15, 15)
+    pc.panels = [panel]
+    return pc
+
+
+if __name__ == "__main__":
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    dpi = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    ds = open_gfs()
+    levels = ds["Geopotential_height_isobaric"].metpy.vertical.metpy.unit_array.to("hPa")
+    frames = sweep(levels=levels)
+    template = product()
+
+    start = time.perf_counter()
+    for index, (level, _) in enumerate(frames):
+        path = pattern.format(mode="serial", index=index)
+        render_frame(template, ds, level, path=path, title=title, dpi=dpi)
+    t_serial = time.perf_counter() - start
+
+    start = time.perf_counter()
+    paths = render_sweep(
+        template,
+        open_gfs,
+        frames,
+        pattern.replace("{mode}", "pool"),
+        title=title,
+        processes=processes,
+        dpi=dpi,
+    )
+    t_pool = time.perf_counter() - start
+    animate(paths, "output/sweep/fig5.gif")
+
+    print(f"{len(frames)} frames at {dpi} dpi")
+    print(f"serial: {t_serial:8.2f} s {len(frames) / t_serial:6.2f} frames/s")
+    print(f"pool:   {t_pool:8.2f} s {len(frames) / t_pool:6.2f} frames/s")
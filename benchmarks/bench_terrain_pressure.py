@@ -0,0 +1,76 @@
+"""Compare the per-column terrain pressure loop from fig3 with `bams.cross.terrain_pressure`.
+
+Run from this directory: ``python bench_terrain_pressure.py``.
+"""
+
+import sys
+import timeit
+
+sys.path.insert(0, "..")
+
+import numpy as np
+import xarray as xr
+
+from bams.cross import terrain_pressure
+from metpy.interpolate import log_interpolate_1d
+
+
+def synthetic_cross(columns, times=None, levels=29, seed=0):
+    """Build a cross section of geopotential height and terrain height like fig3's."""
+    rng = np.random.default_rng(seed)
+    isobaric = xr.DataArray(
+        np.linspace(1000, 100, levels), dims="isobaric", attrs={"units": "hPa"}
+    )
+    # Standard atmosphere heights, with a little noise per column
+    heights = 44330.8 * (1 - (isobaric.values / 1013.25) ** 0.190263)
+    shape = (levels, columns) if times is None else (times, levels, columns)
+    dims = ("isobaric", "index") if times is None else ("time", "isobaric", "index")
+    height = xr.DataArray(
+        heights[:, None] + rng.normal(0, 10, shape),
+        dims=dims,
+        coords={"isobaric": isobaric, "index": np.arange(columns)},
+        attrs={"units": "m"},
+        name="Geopotential_height",
+    )
+    terrain = xr.DataArray(
+        rng.uniform(150, 3000, columns),
+        dims="index",
+        coords={"index": np.arange(columns)},
+        attrs={"units": "m"},
+    )
+    return height, terrain
+
+
+def loop(height, terrain):
+    """Reproduce the original fig3 implementation."""
+    c = []
+    for index in height.index:
+        a = height.sel(index=index)
+        b = terrain.sel(index=index)
+        c.append(log_interpolate_1d(b, a, a.metpy.vertical))
+    return xr.DataArray(
+        np.array(c).squeeze(), coords=terrain.coords, dims="index", attrs={"units": c[0].units}
+    )
+
+
+def best_of(func, repeat=3):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+if __name__ == "__main__":
+    print(f"{'columns':>8} {'times':>6} {'loop (s)':>10} {'batch (s)':>10} {'speedup':>8}")
+    for columns in (100, 1000, 5000):
+        height, terrain = synthetic_cross(columns)
+        np.testing.assert_allclose(
+            loop(height, terrain).values, terrain_pressure(height, terrain).values
+        )
+        t_loop = best_of(lambda: loop(height, terrain))
+        t_batch = best_of(lambda: terrain_pressure(height, terrain))
+        print(f"{columns:8d} {1:6d} {t_loop:10.4f} {t_batch:10.4f} {t_loop / t_batch:8.1f}")
+
+    # The loop only handles a single time, so compare against one loop per time
+    for times in (10, 100):
+        height, terrain = synthetic_cross(1000, times=times)
+        t_loop = best_of(lambda: loop(height.isel(time=0), terrain), repeat=1) * times
+        t_batch = best_of(lambda: terrain_pressure(height, terrain))
+        print(f"{1000:8d} {times:6d} {t_loop:10.4f} {t_batch:10.4f} {t_loop / t_batch:8.1f}")
@@ -0,0 +1,76 @@
+"""Compare the thermodynamic functions of `bams.thermo` with MetPy's.
+
+Run from this directory: ``python bench_thermo.py [dtype]``. Each function is timed, and
+its peak memory traced, on grids from 100x100 to 2000x3000 of surface-like pressure,
+temperature, dewpoint and specific humidity (float64 by default, or ``float32``), given as
+quantities in the units MetPy's functions convert to. The largest relative difference
+between the results is shown along with them.
+"""
+
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, "..")
+
+import numpy as np
+
+import metpy.calc as mpcalc
+from bams import thermo
+from metpy.units import units
+
+shapes = [(100, 100), (500, 500), (1000, 1000), (1377, 2145), (2000, 3000)]
+functions = [
+    ("potential_temperature", ["pressure", "temperature"]),
+    ("relative_humidity_from_specific_humidity", ["pressure", "temperature", "humidity"]),
+    ("equivalent_potential_temperature", ["pressure", "temperature", "dewpoint"]),
+]
+
+
+def make_fields(shape, dtype, seed=0):
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[: shape[0], : shape[1]]
+    wave = np.sin(x / (shape[1] / 6)) * np.cos(y / (shape[0] / 4))
+    temperature = 285 + 15 * wave + rng.normal(0, 0.5, shape)
+    fields = {
+        "pressure": units.Quantity(950 + 60 * wave + rng.normal(0, 1, shape), "hPa"),
+        "temperature": units.Quantity(temperature, "K"),
+        "dewpoint": units.Quantity(temperature - 3 - 8 * np.abs(wave), "K"),
+        "humidity": units.Quantity(0.002 + 0.008 * (1 + wave) / 2, "dimensionless"),
+    }
+    return {
+        name: units.Quantity(q.magnitude.astype(dtype), q.units) for name, q in fields.items()
+    }
+
+
+def measure(func, args, repeat=3):
+    """Time a function, and trace the peak memory allocated while it runs."""
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    seconds = min(timeit.repeat(lambda: func(*args), number=1, repeat=repeat))
+    return result, seconds, peak / 2**20
+
+
+if __name__ == "__main__":
+    dtype = sys.argv[1] if len(sys.argv) > 1 else "float64"
+    print(
+        f"{'':<42} {'shape':>11} {'metpy (ms)':>11} {'bams (ms)':>10} {'speedup':>8}"
+        f" {'metpy (MB)':>11} {'bams (MB)':>10} {'max rel diff':>13}"
+    )
+    for shape in shapes:
+        fields = make_fields(shape, dtype)
+        for name, inputs in functions:
+            args = [fields[arg] for arg in inputs]
+            expected, t_metpy, mb_metpy = measure(getattr(mpcalc, name), args)
+            result, t_bams, mb_bams = measure(getattr(thermo, name), args)
+            assert result.units == expected.units and result.magnitude.dtype == dtype
+            diff = np.max(np.abs(result.magnitude - expected.magnitude) / expected.magnitude)
+            print(
+                f"{name:<42} {'x'.join(map(str, shape)):>11} {t_metpy * 1000:11.1f}"
+                f" {t_bams * 1000:10.1f} {t_metpy / t_bams:8.1f} {mb_metpy:11.0f}"
+                f" {mb_bams:10.0f} {diff:13.1e}"
+            )
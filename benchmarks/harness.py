@@ -0,0 +1,200 @@
+"""Time and memory-profile the stages of a pipeline, and compare the results between runs.
+
+A pipeline is a list of named stages, each a function taking the output of the one before
+(the first takes None). `run_pipeline` calls each stage once while tracing its memory
+allocations with `tracemalloc`, then times it on the same input, keeping the best of several
+runs. Stages must therefore leave their input as they found it. The peak memory is what
+Python and NumPy allocate during the stage; buffers allocated directly by C++ libraries (such
+as Agg's canvas) are not included.
+
+Results are saved as JSON along with a description of the machine and of the library
+versions, and `compare` flags stages that have become slower, or use more memory, than in a
+stored baseline.
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, "..")
+
+from bams.build import library_versions
+
+# Differences too small to be told apart from noise
+min_seconds = 0.005
+min_mb = 1.0
+
+
+def measure(func, arg=None, repeat=3):
+    """Measure one stage, returning its output and a record of its time and peak memory."""
+    tracemalloc.start()
+    try:
+        output = func(arg)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    seconds = min(timeit.repeat(lambda: func(arg), number=1, repeat=repeat))
+    return output, {"seconds": seconds, "peak_mb": peak / 2**20}
+
+
+def run_pipeline(name, stages, repeat=3):
+    """Measure the stages of a pipeline in turn.
+
+    A stage that fails is recorded with its error, and the rest of its pipeline skipped.
+
+    Parameters
+    ----------
+    name : str
+        Name of the pipeline, e.g. the figure it makes
+    stages : list of (str, callable)
+        Stage names and functions
+    repeat : int, optional
+        Number of times each stage is timed
+
+    Returns
+    -------
+    list of dict
+        One record per stage measured
+
+    """
+    records = []
+    output = None
+    for stage, func in stages:
+        record = {"pipeline": name, "stage": stage}
+        try:
+            output, measured = measure(func, output, repeat)
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            records.append(record)
+            break
+        record.update(measured)
+        records.append(record)
+    return records
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).resolve().parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def machine():
+    """Describe the machine, interpreter and library versions results were measured with."""
+    return {
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "node": platform.node(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+        "commit": _git_commit(),
+        "versions": library_versions(),
+    }
+
+
+def save(path, records, **metadata):
+    """Save results to a JSON file, along with the machine and any other metadata."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"machine": machine(), **metadata, "results": records}, f, indent=1)
+        f.write("\n")
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _by_stage(baseline):
+    return {
+        (record["pipeline"], record["stage"]): record
+        for record in baseline["results"]
+        if "error" not in record
+    }
+
+
+def compare(records, baseline, threshold=0.25):
+    """Find the stages that are slower, or use more memory, than in a baseline.
+
+    Parameters
+    ----------
+    records : list of dict
+        Results of `run_pipeline`
+    baseline : dict
+        Saved results, as read by `load`
+    threshold : float, optional
+        Fraction by which a stage may grow before it is flagged. Differences smaller than
+        ``min_seconds`` or ``min_mb`` are never flagged.
+
+    Returns
+    -------
+    list of str
+        A description of each regression
+
+    """
+    previous = _by_stage(baseline)
+    regressions = []
+    for record in records:
+        old = previous.get((record["pipeline"], record["stage"]))
+        if old is None or "error" in record:
+            continue
+        for measure_name, unit, floor in [
+            ("seconds", "s", min_seconds),
+            ("peak_mb", "MB", min_mb),
+        ]:
+            new_value, old_value = record[measure_name], old[measure_name]
+            if new_value > old_value * (1 + threshold) and new_value - old_value > floor:
+                regressions.append(
+                    f"{record['pipeline']} {record['stage']}: {measure_name} "
+                    f"{old_value:.3f} {unit} -> {new_value:.3f} {unit}"
+                )
+    return regressions
+
+
+def differences(baseline):
+    """List what differs between the machine a baseline was measured on and this one."""
+    current = machine()
+    old = baseline.get("machine", {})
+    changed = [
+        f"{key}: {old.get(key)} -> {current[key]}"
+        for key in ("node", "platform", "processor", "cpus")
+        if old.get(key) != current[key]
+    ]
+    versions = old.get("versions", {})
+    changed.extend(
+        f"{name}: {versions.get(name)} -> {version}"
+        for name, version in current["versions"].items()
+        if versions.get(name) != version
+    )
+    return changed
+
+
+def print_table(records, baseline=None):
+    """Print the results, with the change from a baseline if given."""
+    previous = _by_stage(baseline) if baseline is not None else {}
+
+    print(f"{'pipeline':<10} {'stage':<10} {'time (s)':>9} {'peak (MB)':>10}", end="")
+    print(f" {'change':>8}" if previous else "")
+    for record in records:
+        print(f"{record['pipeline']:<10} {record['stage']:<10}", end="")
+        if "error" in record:
+            print(f" failed: {record['error']}")
+            continue
+        print(f" {record['seconds']:9.3f} {record['peak_mb']:10.1f}", end="")
+        old = previous.get((record["pipeline"], record["stage"]))
+        if old is not None and old["seconds"] > 0:
+            print(f" {100 * (record['seconds'] / old['seconds'] - 1):+7.0f}%", end="")
+        print()
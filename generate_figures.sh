@@ -1,8 +1,5 @@
 #!/bin/bash
-cd ./scripts
-conda run -n bams-manuscript python fig1_skewt.py &
-conda run -n bams-manuscript python fig2_multilayer.py &
-conda run -n bams-manuscript python fig3_cross_section.py &
-conda run -n bams-manuscript python fig5_declarative.py &
-conda run -n bams-manuscript python fig6_plotgeometry.py &
-wait
+# Regenerate the figures whose inputs have changed (see bams/build.py); pass --force to
+# regenerate all of them
+cd "$(dirname "$0")"
+conda run --no-capture-output -n bams-manuscript python -m bams.build "$@"
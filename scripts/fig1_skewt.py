@@ -3,6 +3,11 @@
 # ## Creating a Skew-T representation of an atmospheric profile with remotely accessed data
 # Provided by rpmanser (co-author).
 
+# %%
+import sys
+
+sys.path.insert(0, "..")
+
 # %%
 from datetime import datetime
 
@@ -12,6 +17,7 @@ from matplotlib import rcParams
 from mpl_toolkits.axes_grid1.inset_locator import inset_axes
 
 import metpy.calc as mpcalc
+from bams import adiabats, output, remote, sounding
 from metpy.plots import Hodograph, SkewT
 from metpy.units import units
 from siphon.simplewebservice.wyoming import WyomingUpperAir
@@ -20,6 +26,12 @@ from siphon.simplewebservice.wyoming import WyomingUpperAir
 label_sizes = {"xtick.labelsize": 12, "ytick.labelsize": 12, "axes.labelsize": 14}
 rcParams.update(label_sizes)
 
+# %% [markdown]
+# Keep remotely accessed data in a local cache, so that re-running the figure doesn't download it again (see `bams/remote.py` for configuration).
+
+# %%
+remote.install()
+
 # %%
 time = datetime(2011, 5, 22, 12)
 station = "TOP"
@@ -40,7 +52,7 @@ u, v = mpcalc.wind_components(wind_speed, wind_dir)
 hght = df["height"].values * units.meter
 
 # %%
-prof = mpcalc.parcel_profile(p, T[0], Td[0]).to("degC")
+prof = sounding.parcel_profile(p, T[0], Td[0]).to("degC")
 li = mpcalc.lifted_index(p, T, prof)[0]
 cape, cin = mpcalc.cape_cin(p, T, Td, prof)
 lcl_pressure, lcl_temperature = mpcalc.lcl(p[0], T[0], Td[0])
@@ -89,7 +101,7 @@ skew.ax.axvline(0, color="c", linestyle="--", linewidth=2)
 
 # Add the relevant special lines
 skew.plot_dry_adiabats()
-skew.plot_moist_adiabats()
+adiabats.plot_moist_adiabats(skew)
 skew.plot_mixing_lines()
 
 fig.text(0.14, 0.21, indices, size=14, ha="left", bbox=dict(boxstyle="square", fc="white"))
@@ -104,7 +116,8 @@ hodo.add_grid(increment=20)
 hodo.plot_colormapped(u[below_100_hpa], v[below_100_hpa], hght[below_100_hpa])
 ax_hodo.set_yticks(range(-50, 51, 50))
 
-fig.savefig("../output/fig1_skewt.png", dpi=600, bbox_inches="tight")
+# A PNG for print and WebP images for the web, from a single render
+output.save(fig, output.product_paths("../output/fig1_skewt"))
 
 # %% [markdown]
 # ### Draft caption
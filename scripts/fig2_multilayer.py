@@ -3,6 +3,11 @@
 # ## Layered plot of multiple data products and calculations provided by Siphon and MetPy
 # Adapted from https://github.com/Unidata/metpy-workshop/blob/main/notebooks/solutions/workshop_solutions.ipynb.
 
+# %%
+import sys
+
+sys.path.insert(0, "..")
+
 # %%
 from datetime import datetime
 
@@ -11,12 +16,29 @@ import cartopy.feature as cfeature
 import matplotlib.pyplot as plt
 from matplotlib.patheffects import withStroke
 
-import metpy.calc as mpcalc
 import metpy.plots as mpplots
-from metpy.io import parse_metar_file
+from bams import output, remote, thermo
+from bams.imagery import decimate_to_axes
+from bams.metar import read_metars
+from bams.reproject import warp_to_axes
+from bams.smoothing import smooth_gaussian
+from bams.stations import thin_stations
 from metpy.units import pandas_dataframe_to_unit_arrays
 from siphon.catalog import TDSCatalog
 
+# %% [markdown]
+# Keep remotely accessed data in a local cache, so that re-running the figure doesn't download it again (see `bams/remote.py` for configuration).
+
+# %%
+remote.install()
+
+# %% [markdown]
+# Define the map extent up front, so that only the data needed to cover it are requested from the server. The requested area is padded, as the Lambert conformal map reaches beyond the longitude/latitude box at its corners and smoothing needs data beyond the edges.
+
+# %%
+extent = (-113, -70, 25, 45)
+request_bbox = (extent[0] - 5, extent[1] + 5, extent[2] - 5, extent[3] + 5)
+
 # %% [markdown]
 # Access near-real-time satellite data remotely from UCAR/Unidata's THREDDS Data Server (TDS).
 
@@ -24,7 +46,7 @@ from siphon.catalog import TDSCatalog
 satcat = TDSCatalog(
     "https://thredds.ucar.edu/thredds/catalog/satellite/goes/east/products/CloudAndMoistureImagery/CONUS/Channel02/current/catalog.xml"
 )
-satdata = satcat.datasets[0].remote_access(use_xarray=True)
+satdata = remote.open_subset(satcat.datasets[0], ["Sectorized_CMI"], bbox=request_bbox)
 
 cmi = satdata.metpy.parse_cf("Sectorized_CMI")
 dt = datetime.strptime(satdata.attrs["start_date_time"], "%Y%j%H%M%S")
@@ -36,21 +58,26 @@ dt = datetime.strptime(satdata.attrs["start_date_time"], "%Y%j%H%M%S")
 rtma_cat = TDSCatalog(
     "https://thredds.ucar.edu/thredds/catalog/grib/NCEP/RTMA/CONUS_2p5km/catalog.xml"
 )
-rtma_data = rtma_cat.datasets["Best Real Time Mesoscale Analysis 2.5 km Time Series"].remote_access(use_xarray=True)
+rtma_data = remote.open_subset(
+    rtma_cat.datasets["Best Real Time Mesoscale Analysis 2.5 km Time Series"],
+    [
+        "Pressure_Analysis_surface",
+        "Temperature_Analysis_height_above_ground",
+        "Dewpoint_temperature_Analysis_height_above_ground",
+    ],
+    time=dt,
+    bbox=request_bbox,
+)
 rtma_data = rtma_data.metpy.parse_cf().squeeze()
 
 # %%
-pres = rtma_data["Pressure_Analysis_surface"].metpy.sel(time=dt, method="nearest")
-temp = rtma_data["Temperature_Analysis_height_above_ground"].metpy.sel(
-    time=dt, method="nearest"
-)
-dewp = rtma_data["Dewpoint_temperature_Analysis_height_above_ground"].metpy.sel(
-    time=dt, method="nearest"
-)
+pres = rtma_data["Pressure_Analysis_surface"]
+temp = rtma_data["Temperature_Analysis_height_above_ground"]
+dewp = rtma_data["Dewpoint_temperature_Analysis_height_above_ground"]
 
-theta_e = mpcalc.equivalent_potential_temperature(pres, temp, dewp)
+theta_e = thermo.equivalent_potential_temperature(pres, temp, dewp)
 
-theta_e = mpcalc.smooth_gaussian(theta_e, n=50)
+theta_e = smooth_gaussian(theta_e, n=50)
 
 rtma_crs = theta_e.metpy.cartopy_crs
 
@@ -63,33 +90,36 @@ metar_cat = TDSCatalog(
 )
 metar_text = metar_cat.datasets.filter_time_nearest(dt).remote_open(mode="t")
 
-sfc_data = parse_metar_file(metar_text, year=dt.year, month=dt.month)
+sfc_data = read_metars(metar_text, year=dt.year, month=dt.month)
 sfc_units = sfc_data.units
 
 sfc_data = pandas_dataframe_to_unit_arrays(sfc_data, sfc_units)
 
 # %%
-locs = rtma_crs.transform_points(
-    ccrs.PlateCarree(), sfc_data["longitude"].m, sfc_data["latitude"].m
-)
-
-plot_mask = mpcalc.reduce_point_density(
-    locs[..., :2], 175000, priority=sfc_data["current_wx1_symbol"]
+# Thin the stations on the map as `mpcalc.reduce_point_density` does, re-evaluating only the
+# stations affected by changes since the last run
+plot_mask = thin_stations(
+    sfc_data["station_id"],
+    sfc_data["longitude"],
+    sfc_data["latitude"],
+    rtma_crs,
+    175000,
+    priority=sfc_data["current_wx1_symbol"],
 )
 
 # %%
+dpi = 600
+
 fig = plt.figure(figsize=(18, 9))
 ax = fig.add_subplot(projection=rtma_crs)
+ax.set_extent(extent)
 
-image_extent = (cmi.metpy.x[0], cmi.metpy.x[-1], cmi.metpy.y[0], cmi.metpy.y[-1])
-ax.imshow(
-    cmi,
-    extent=image_extent,
-    origin="lower",
-    cmap="Greys_r",
-    regrid_shape=6000,
-    transform=cmi.metpy.cartopy_crs,
-)
+# Only reproject the part of the image that is visible, at the resolution it's saved at.
+# The mapping from the satellite grid to the map is cached on disk between runs.
+cmi = decimate_to_axes(cmi, ax, dpi=dpi)
+image, image_extent = warp_to_axes(cmi, ax, dpi=dpi, regrid_shape=6000)
+
+ax.imshow(image, extent=image_extent, origin="lower", cmap="Greys_r", transform=rtma_crs)
 
 c = ax.contour(
     theta_e.metpy.x,
@@ -142,7 +172,6 @@ stn.plot_barb(
 
 ax.add_feature(cfeature.BORDERS, color="yellow")
 ax.add_feature(cfeature.COASTLINE, color="yellow")
-ax.set_extent((-113, -70, 25, 45))
 
 datestamp = f"{dt:%H%M} UTC {dt:%d %B %Y}"
 with open("../output/fig2_caption.txt", "wt") as caption_file:
@@ -151,7 +180,8 @@ with open("../output/fig2_caption.txt", "wt") as caption_file:
 print(f"For caption: {datestamp}")
 
 fig.show()
-fig.savefig("../output/fig2_multilayer.png", dpi=600, bbox_inches="tight")
+# A PNG for print and WebP images for the web, from a single render
+output.save(fig, output.product_paths("../output/fig2_multilayer", dpi))
 
 # %% [markdown]
 # ### Draft caption
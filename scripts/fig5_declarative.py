@@ -9,9 +9,13 @@
 # Here we generate the example figure using MetPy's Declarative plotting interface. We'll first import the libraries shared for both workflows.
 
 # %%
-import xarray as xr
+import sys
 
-import metpy.calc as mpcalc
+sys.path.insert(0, "..")
+
+# %%
+from bams import output, store
+from bams.figures import fig5, fig5_data
 
 # get_test_data is used for internal MetPy testing and not supported publicly
 from metpy.cbook import get_test_data
@@ -21,60 +25,26 @@ from metpy.units import units
 # Read GFS output valid 1200 UTC 31 October 2010, provided as part of MetPy's internal testing data.
 
 # %%
-data = xr.open_dataset(get_test_data("GFS_test.nc", False)).metpy.parse_cf().squeeze()
+# Opened already parsed from a local store, memory-mapped and ingested on the first run
+data = store.open_dataset(get_test_data("GFS_test.nc", False)).squeeze()
 
 dt_string = data["time"].dt.strftime("%Y-%m-%d %T").data
 
-ds = data.metpy.sel(lat=slice(70, 10), lon=slice(360 - 150, 360 - 55))
+# %% [markdown]
+# The data are subset to the area of the map, with wind speed declared as a derived field, computed only for the level and area the plots select (see `fig5_data` in `bams/figures.py`).
 
 # %%
-ds["wind_speed"] = mpcalc.wind_speed(
-    ds["u-component_of_wind_isobaric"], ds["v-component_of_wind_isobaric"]
-)
-
+ds = fig5_data(data)
 
 # %% [markdown]
-# Now let's import the Declarative classes we'll use for the demonstrated workflow.
+# The product is built from MetPy's Declarative classes: a `ContourPlot` of geopotential height, a `FilledContourPlot` of wind speed and a `BarbPlot` of the wind, in a `MapPanel` (drawing its layers from geometries projected onto the map once and cached) in a `PanelContainer` (see `fig5` in `bams/figures.py`, which the render service draws too).
 
 # %%
-from metpy.plots import BarbPlot, ContourPlot, FilledContourPlot, MapPanel, PanelContainer
+pc = fig5(ds, 300 * units.hPa)
 
-# %%
-contour = ContourPlot()
-contour.data = ds
-contour.field = "Geopotential_height_isobaric"
-contour.level = 300 * units.hPa
-contour.contours = list(range(0, 10000, 120))
-contour.clabels = True
-
-cfill = FilledContourPlot()
-cfill.data = ds
-cfill.field = "wind_speed"
-cfill.level = 300 * units.hPa
-cfill.contours = list(range(10, 201, 20))
-cfill.colormap = "BuPu"
-cfill.colorbar = "horizontal"
-cfill.plot_units = "knot"
-
-barbs = BarbPlot()
-barbs.data = ds
-barbs.field = ["u-component_of_wind_isobaric", "v-component_of_wind_isobaric"]
-barbs.level = 300 * units.hPa
-barbs.skip = (3, 3)
-barbs.plot_units = "knot"
-
-panel = MapPanel()
-panel.area = [-125, -74, 20, 55]
-panel.projection = "lcc"
-panel.layers = ["states", "coastline", "borders"]
-panel.title = f"{cfill.level:~P} Heights and Wind Speed at {dt_string}"
-panel.plots = [cfill, contour, barbs]
-
-pc = PanelContainer()
-pc.size = (15, 15)
-pc.panels = [panel]
-
-pc.save("../output/fig5_declarative.png", dpi=600, bbox_inches="tight")
+# A PNG for print and WebP images for the web, from a single render
+pc.draw()
+output.save(pc.figure, output.product_paths("../output/fig5_declarative"))
 
 # %% [markdown]
 # ### Without Declarative
@@ -85,6 +55,8 @@ import cartopy.crs as ccrs
 import cartopy.feature as cfeature
 import matplotlib.pyplot as plt
 
+from bams.reproject import project_mesh
+
 # %%
 level = 300 * units.hPa
 
@@ -104,27 +76,31 @@ plot_crs = ccrs.LambertConformal(
 
 data_crs = ds_subset["metpy_crs"].metpy.cartopy_crs
 
+# Contour in map coordinates, rather than projecting every contour line onto the map. The
+# projected grid is cached on disk between runs.
+x, y = project_mesh(ds_subset["lon"], ds_subset["lat"], data_crs, plot_crs)
+
 fig = plt.figure(figsize=(15, 15))
 ax = fig.add_subplot(projection=plot_crs)
 
 c = ax.contour(
-    ds_subset["lon"],
-    ds_subset["lat"],
+    x,
+    y,
     ds_subset["Geopotential_height_isobaric"],
     levels=list(range(0, 10000, 120)),
-    transform=data_crs,
+    transform=plot_crs,
     colors="k",
 )
 
 c.clabel(inline=1, fmt="%.0f", inline_spacing=8, use_clabeltext=True)
 
 cf = ax.contourf(
-    ds_subset["lon"],
-    ds_subset["lat"],
+    x,
+    y,
     ds_subset["wind_speed"].metpy.convert_units("knots"),
     levels=list(range(10, 201, 20)),
     cmap="BuPu",
-    transform=data_crs,
+    transform=plot_crs,
 )
 
 fig.colorbar(cf, orientation="horizontal", pad=0, aspect=50)
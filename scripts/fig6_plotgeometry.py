@@ -3,12 +3,25 @@
 # ## PlotGeometry Example
 # Adapted from https://unidata.github.io/MetPy/v1.3/examples/plots/spc_convective_outlook.html.
 
+# %%
+import sys
+
+sys.path.insert(0, "..")
+
 # %%
 import geopandas
 
+from bams import output
+
+# MetPy's MapPanel, drawing its layers from geometries projected onto the map once and cached
+from bams.basemap import MapPanel
+
+# MetPy's PlotGeometry, drawing only what reaches the map, simplified to the output's pixels
+from bams.geometry import PlotGeometry
+
 # get_test_data is used for internal MetPy testing and not supported publicly
 from metpy.cbook import get_test_data
-from metpy.plots import MapPanel, PanelContainer, PlotGeometry
+from metpy.plots import PanelContainer
 
 # %% [markdown]
 # Read SPC Day 1 Outlook valid 1200 UTC 17 March 2021. GeoJSON originally from SPC archive, provided as part of MetPy's internal testing data.
@@ -27,6 +40,7 @@ geo.fill = day1_outlook["fill"]
 geo.stroke = day1_outlook["stroke"]
 geo.labels = day1_outlook["LABEL"]
 geo.label_fontsize = "large"
+geo.dpi = 600
 
 # %% [markdown]
 # Declarative MapPanel gives a plotting `axes` to work with Cartopy under the hood.
@@ -47,7 +61,9 @@ panel.layers = ["lakes", "land", "ocean", "states", "coastline", "borders"]
 pc = PanelContainer()
 pc.size = (18, 9)
 pc.panels = [panel]
-pc.save("../output/fig6_plotgeometry.png", dpi=600, bbox_inches="tight")
+# A PNG for print and WebP images for the web, from a single render
+pc.draw()
+output.save(pc.figure, output.product_paths("../output/fig6_plotgeometry"))
 
 # %% [markdown]
 # ### Draft caption
@@ -0,0 +1,81 @@
+"""Tests of subsetting datasets that are not offered through the NetCDF Subset Service."""
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from bams import remote
+
+# Matches the padded extent requested by fig2
+bbox = (-118, -65, 20, 50)
+
+
+@pytest.fixture
+def goes_file(tmp_path):
+    """Write a small full-disk image on the GOES-East fixed grid, laid out as on THREDDS."""
+    height = 35786023.0
+    x = np.linspace(-5.4e6, 5.4e6, 200)
+    y = np.linspace(5.4e6, -5.4e6, 200)
+    data = xr.Dataset(
+        {
+            "Sectorized_CMI": (
+                ("y", "x"),
+                np.random.default_rng(0).random((y.size, x.size), dtype=np.float32),
+                {"grid_mapping": "fixedgrid_projection", "units": "1"},
+            ),
+            "fixedgrid_projection": (
+                (),
+                0,
+                {
+                    "grid_mapping_name": "geostationary",
+                    "perspective_point_height": height,
+                    "semi_major_axis": 6378137.0,
+                    "semi_minor_axis": 6356752.31414,
+                    "longitude_of_projection_origin": -75.0,
+                    "latitude_of_projection_origin": 0.0,
+                    "sweep_angle_axis": "x",
+                },
+            ),
+        },
+        coords={
+            "x": ("x", x, {"units": "m", "standard_name": "projection_x_coordinate"}),
+            "y": ("y", y, {"units": "m", "standard_name": "projection_y_coordinate"}),
+        },
+        attrs={"start_date_time": "2022152180117"},
+    )
+    path = tmp_path / "goes.nc"
+    data.to_netcdf(path)
+    return path
+
+
+@pytest.fixture
+def dataset(goes_file, monkeypatch):
+    """Stand in for a catalog dataset offered only for download."""
+    monkeypatch.setattr(
+        remote, "open_remote_dataset", lambda dataset: remote._open_local(goes_file)
+    )
+    return SimpleNamespace(access_urls={"HTTPServer": goes_file.as_uri()})
+
+
+def test_subset_locally_keeps_projection(dataset):
+    """Check that a local subset can still be parsed by MetPy, as fig2 does."""
+    subset = remote.open_subset(dataset, ["Sectorized_CMI"], bbox=bbox)
+    assert "fixedgrid_projection" in subset.variables
+    cmi = subset.metpy.parse_cf("Sectorized_CMI")
+    assert cmi.metpy.cartopy_crs.proj4_params["proj"] == "geos"
+
+
+def test_subset_locally_covers_bbox(dataset):
+    """Check that the subset is smaller than the image but covers the requested box."""
+    full = remote.open_remote_dataset(dataset)
+    subset = remote.open_subset(dataset, ["Sectorized_CMI"], bbox=bbox)
+    assert 0 < subset.sizes["x"] < full.sizes["x"]
+    assert 0 < subset.sizes["y"] < full.sizes["y"]
+
+    crs = subset.metpy.parse_cf("Sectorized_CMI").metpy.cartopy_crs
+    lon, lat = np.meshgrid(np.linspace(bbox[0], bbox[1], 20), np.linspace(*bbox[2:], 20))
+    points = crs.transform_points(crs.as_geodetic(), lon.ravel(), lat.ravel())
+    assert points[:, 0].min() >= subset.x.min() and points[:, 0].max() <= subset.x.max()
+    assert points[:, 1].min() >= subset.y.min() and points[:, 1].max() <= subset.y.max()
@@ -0,0 +1,35 @@
+"""Tests of keeping the cache of reprojection indices within its size limit."""
+
+import os
+
+import numpy as np
+import pytest
+
+from bams import reproject
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    path = tmp_path / "reproject"
+    monkeypatch.setenv("BAMS_REPROJECT_CACHE_DIR", str(path))
+    # Room for two of the arrays below, but not three
+    monkeypatch.setenv("BAMS_REPROJECT_CACHE_SIZE", str(2 * 8000 + 500))
+    return path
+
+
+def store(cache_dir, key, value, accessed):
+    array = reproject._cached(key, lambda: np.full(1000, value, dtype=np.float64))
+    # Order the accesses, whatever the resolution of file times
+    os.utime(cache_dir / f"{key}.npy", (accessed, accessed))
+    return array
+
+
+def test_least_recently_used_evicted(cache_dir):
+    store(cache_dir, "a", 0, accessed=0)
+    store(cache_dir, "b", 1, accessed=1)
+    # Reusing the first array keeps it over the second
+    store(cache_dir, "a", 10, accessed=2)
+    store(cache_dir, "c", 2, accessed=3)
+
+    assert sorted(path.stem for path in cache_dir.glob("*.npy")) == ["a", "c"]
+    assert store(cache_dir, "a", 10, accessed=4)[0] == 0
@@ -0,0 +1,53 @@
+"""Tests of keeping the stores of files current."""
+
+import os
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from bams import store
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    path = tmp_path / "stores"
+    monkeypatch.setenv("BAMS_STORE_CACHE_DIR", str(path))
+    return path
+
+
+def write_grid(path, value):
+    xr.Dataset(
+        {"temperature": (("lat", "lon"), np.full((3, 4), value), {"units": "K"})},
+        coords={
+            "lat": ("lat", [30.0, 40.0, 50.0], {"units": "degrees_north"}),
+            "lon": ("lon", [-100.0, -95.0, -90.0, -85.0], {"units": "degrees_east"}),
+        },
+    ).to_netcdf(path)
+
+
+def stores(cache_dir):
+    return sorted(path.parent for path in cache_dir.glob("*/*/store.json"))
+
+
+def test_store_replaced_when_file_changes(tmp_path, cache_dir):
+    source = tmp_path / "grid.nc"
+    write_grid(source, 280.0)
+    assert store.open_dataset(source)["temperature"].values[0, 0] == 280.0
+
+    write_grid(source, 290.0)
+    os.utime(source, ns=(0, os.stat(source).st_mtime_ns + 1))
+    assert store.open_dataset(source)["temperature"].values[0, 0] == 290.0
+    assert len(stores(cache_dir)) == 1
+
+
+def test_store_per_arguments(tmp_path, cache_dir):
+    source = tmp_path / "grid.nc"
+    write_grid(source, 280.0)
+    decoded = store.open_dataset(source)
+    raw = store.open_dataset(source, decode_cf=False)
+    assert decoded["temperature"].attrs["units"] == raw["temperature"].attrs["units"]
+    assert len(stores(cache_dir)) == 2
+
+    store.remove(source)
+    assert not stores(cache_dir)
@@ -0,0 +1,30 @@
+"""Tests of tracing several processes to one file."""
+
+import multiprocessing
+
+import pytest
+
+from bams import trace
+
+
+def _traced_process(path, name):
+    trace.install(path, sample=1, process_name=name)
+    with trace.span(name, category="run"):
+        pass
+    trace.uninstall()
+
+
+@pytest.mark.parametrize("suffix", [".json", ".jsonl"])
+def test_processes_share_trace(tmp_path, suffix):
+    path = tmp_path / f"trace{suffix}"
+    names = [f"fig{i}.py" for i in range(8)]
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=_traced_process, args=(path, name)) for name in names]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    spans = [event["name"] for event in trace.read_events(path) if event["ph"] == "X"]
+    assert sorted(spans) == names